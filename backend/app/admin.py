@@ -0,0 +1,31 @@
+"""Access check for operator routes (``/debug/traces``, ``/proxy/admin/*``).
+
+These routes show other callers' prompts and can cancel their requests, so
+the client API key is not enough: they need ``NANOBEE_ADMIN_TOKEN`` in the
+``X-Admin-Token`` header, or, when no token is configured, a loopback client.
+"""
+from __future__ import annotations
+
+import hmac
+
+from fastapi import Header, HTTPException, Request
+
+from .config import settings
+
+ADMIN_TOKEN_HEADER = "X-Admin-Token"
+LOOPBACK_HOSTS = frozenset({"127.0.0.1", "::1", "localhost"})
+
+
+def require_admin(request: Request, x_admin_token: str | None = Header(None)) -> None:
+    """FastAPI dependency guarding operator routes."""
+
+    if settings.admin_token:
+        if x_admin_token and hmac.compare_digest(x_admin_token.encode(), settings.admin_token.encode()):
+            return
+        raise HTTPException(status_code=401, detail=f"{ADMIN_TOKEN_HEADER} required")
+    host = request.client.host if request.client else None
+    if host not in LOOPBACK_HOSTS:
+        raise HTTPException(status_code=403, detail="Operator routes answer loopback clients only unless NANOBEE_ADMIN_TOKEN is set")
+
+
+__all__ = ["ADMIN_TOKEN_HEADER", "require_admin"]
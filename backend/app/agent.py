@@ -1,41 +1,211 @@
 """Agent wiring for PPT workflows using claude-agent-sdk."""
 from __future__ import annotations
 
-from typing import AsyncIterator
-
-from claude_agent_sdk import ClaudeAgentOptions, Message, ResultMessage, create_sdk_mcp_server, query
+import os
+import time
+from contextlib import aclosing, contextmanager
+from dataclasses import asdict, is_dataclass
+from typing import TYPE_CHECKING, Any, AsyncIterator, Iterator
 
+from .agent_pool import AgentPool
 from .config import settings
-from .skills import create_ppt_visuals, draft_ppt_outline
+from .metrics import AGENT_IN_FLIGHT, AGENT_RUN_COST, AGENT_RUN_SECONDS
+from .skills import TOOL_SPECS, build_tools
+from .tracing import REQUEST_ID_HEADER, current_request_id, tracer
 
-ppt_server = create_sdk_mcp_server(
-    name="ppt-skills",
-    version="1.0.0",
-    tools=[draft_ppt_outline, create_ppt_visuals],
-)
+if TYPE_CHECKING:
+    from types import ModuleType
 
+    from claude_agent_sdk import ClaudeAgentOptions, Message
 
-async def run_agent(prompt: str) -> AsyncIterator[Message]:
-    """Run the Claude agent with the PPT-focused MCP server."""
+_sdk_module: ModuleType | None = None
+_ppt_server: Any = None
+
+
+def _sdk() -> ModuleType:
+    """``claude_agent_sdk``, imported on first use; tests patch this accessor.
+
+    The SDK (and the MCP stack under it) takes most of the app's import time,
+    so it is loaded by the first agent run rather than with this module.
+    """
+
+    global _sdk_module
+    if _sdk_module is None:
+        import claude_agent_sdk
+
+        settings.apply_environment()
+        _sdk_module = claude_agent_sdk
+    return _sdk_module
+
+
+def get_ppt_server() -> Any:
+    """The in-process MCP server exposing the PPT skills, created on first use."""
+
+    global _ppt_server
+    if _ppt_server is None:
+        _ppt_server = _sdk().create_sdk_mcp_server(name="ppt-skills", version="1.0.0", tools=build_tools())
+    return _ppt_server
 
-    options = ClaudeAgentOptions(
+
+def _agent_options(env: dict[str, str]) -> ClaudeAgentOptions:
+    return _sdk().ClaudeAgentOptions(
         system_prompt=settings.system_prompt,
         model=settings.default_text_model,
-        mcp_servers={"ppt": ppt_server},
-        allowed_tools=["draft_ppt_outline", "create_ppt_visuals"],
+        mcp_servers={"ppt": get_ppt_server()},
+        allowed_tools=[spec[0] for spec in TOOL_SPECS],
         permission_mode="bypassPermissions",
+        env=env,
     )
 
-    async for message in query(prompt=prompt, options=options):
-        yield message
+
+def _new_client() -> Any:
+    """An unconnected persistent client for the session pool."""
+
+    # The CLI environment is fixed at spawn, so pooled runs cannot carry a
+    # per-request X-Request-ID header (see _trace_env).
+    return _sdk().ClaudeSDKClient(options=_agent_options({}))
+
+
+agent_pool = AgentPool.from_settings(_new_client)
+
+
+async def run_agent(prompt: str) -> AsyncIterator[Message]:
+    """Run the Claude agent with the PPT-focused MCP server.
+
+    Uses a fresh pre-started session from :data:`agent_pool` when the pool is enabled,
+    otherwise spawns a one-off CLI via ``query()``.
+    """
+
+    pooled = agent_pool.enabled
+    with tracer.span("agent.run", model=settings.default_text_model, pooled=pooled) as span:
+        turns = 0
+        messages = agent_pool.run(prompt) if pooled else _sdk().query(prompt=prompt, options=_agent_options(_trace_env()))
+        # aclosing: a consumer that stops early must release the session (or CLI) right away.
+        async with aclosing(messages):
+            async for message in messages:
+                turns += 1
+                yield message
+        if span is not None:
+            span.set(messages=turns)
+
+
+def _trace_env() -> dict[str, str]:
+    """Forward the request id so CLI calls through the bundled proxy join the same trace."""
+
+    request_id = current_request_id()
+    if not request_id:
+        return {}
+    headers = [os.environ.get("ANTHROPIC_CUSTOM_HEADERS", ""), f"{REQUEST_ID_HEADER}: {request_id}"]
+    return {"ANTHROPIC_CUSTOM_HEADERS": "\n".join(header for header in headers if header)}
+
+
+@contextmanager
+def _observe_run() -> Iterator[dict]:
+    """Record duration, outcome and cost of one agent run in the metrics registry."""
+
+    outcome = {"status": "incomplete"}
+    started = time.perf_counter()
+    AGENT_IN_FLIGHT.inc()
+    try:
+        yield outcome
+    except BaseException:
+        outcome["status"] = "error"
+        raise
+    finally:
+        AGENT_IN_FLIGHT.dec()
+        AGENT_RUN_SECONDS.observe(time.perf_counter() - started, status=outcome["status"])
+
+
+def _record_result(outcome: dict, message: Any) -> None:
+    outcome["status"] = "error" if getattr(message, "is_error", False) else "succeeded"
+    cost = getattr(message, "total_cost_usd", None)
+    if isinstance(cost, (int, float)):
+        AGENT_RUN_COST.observe(cost)
 
 
 async def summarize_run(prompt: str) -> dict:
     """Convenience helper that collects the result message."""
 
     summary: dict = {"messages": []}
-    async for message in run_agent(prompt):
-        if isinstance(message, ResultMessage):
-            summary["cost"] = getattr(message, "total_cost_usd", None)
-        summary["messages"].append(message)
+    with _observe_run() as outcome:
+        async for message in run_agent(prompt):
+            if isinstance(message, _sdk().ResultMessage):
+                summary["cost"] = getattr(message, "total_cost_usd", None)
+                _record_result(outcome, message)
+            summary["messages"].append(message)
     return summary
+
+
+def _json_safe(value: Any) -> Any:
+    if is_dataclass(value) and not isinstance(value, type):
+        return _json_safe(asdict(value))
+    if isinstance(value, dict):
+        return {str(key): _json_safe(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_json_safe(item) for item in value]
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    return repr(value)
+
+
+def _content_events(blocks: Any, message_type: str) -> list[dict]:
+    if isinstance(blocks, str):
+        return [{"type": "text", "role": message_type, "text": blocks}]
+
+    sdk = _sdk()
+    events: list[dict] = []
+    for block in blocks or []:
+        if isinstance(block, sdk.TextBlock):
+            events.append({"type": "text", "role": message_type, "text": block.text})
+        elif isinstance(block, sdk.ThinkingBlock):
+            events.append({"type": "thinking", "text": block.thinking})
+        elif isinstance(block, sdk.ToolUseBlock):
+            events.append({"type": "tool_call_start", "id": block.id, "name": block.name, "input": _json_safe(block.input)})
+        elif isinstance(block, sdk.ToolResultBlock):
+            events.append(
+                {
+                    "type": "tool_call_finish",
+                    "id": block.tool_use_id,
+                    "is_error": bool(block.is_error),
+                    "content": _json_safe(block.content),
+                }
+            )
+        else:
+            events.append({"type": "block", "role": message_type, "data": _json_safe(block)})
+    return events
+
+
+def message_events(message: Any) -> list[dict]:
+    """Translate one SDK message into structured, JSON-serialisable events."""
+
+    sdk = _sdk()
+    if isinstance(message, sdk.ResultMessage):
+        return [
+            {
+                "type": "result",
+                "cost": getattr(message, "total_cost_usd", None),
+                "is_error": getattr(message, "is_error", False),
+                "num_turns": getattr(message, "num_turns", None),
+                "duration_ms": getattr(message, "duration_ms", None),
+                "usage": _json_safe(getattr(message, "usage", None)),
+                "result": getattr(message, "result", None),
+            }
+        ]
+    if isinstance(message, sdk.AssistantMessage):
+        return _content_events(message.content, "assistant")
+    if isinstance(message, sdk.UserMessage):
+        return _content_events(message.content, "user")
+    if isinstance(message, sdk.SystemMessage):
+        return [{"type": "system", "subtype": message.subtype, "data": _json_safe(message.data)}]
+    return [{"type": "message", "data": _json_safe(message)}]
+
+
+async def stream_run(prompt: str) -> AsyncIterator[dict]:
+    """Forward agent messages as events without keeping them in memory."""
+
+    with _observe_run() as outcome:
+        async for message in run_agent(prompt):
+            if isinstance(message, _sdk().ResultMessage):
+                _record_result(outcome, message)
+            for event in message_events(message):
+                yield event
@@ -0,0 +1,275 @@
+"""Pool of pre-started Claude agent sessions.
+
+Every ``query()`` call spawns a Claude Code CLI subprocess and performs the
+MCP handshake before the first model call. A pooled session is a
+``ClaudeSDKClient`` that has already paid that cost, so a run only waits for
+the model.
+
+The SDK requires a client to be connected, used and disconnected from one
+task, so each session is a single owner task fed through a queue: it
+connects, serves exactly one run and disconnects. Sessions are never handed
+to a second caller; nothing has to be reset between runs, and one caller's
+conversation cannot leak into the next. The pool keeps ``size`` connected
+spares; sessions idle for longer than ``idle_seconds`` are closed and only
+replenished on the next checkout.
+"""
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import logging
+import time
+import uuid
+from typing import Any, AsyncIterator, Callable
+
+import anyio
+
+from .config import settings
+from .metrics import AGENT_POOL_CHECKOUTS
+
+logger = logging.getLogger(__name__)
+
+ClientFactory = Callable[[], Any]
+
+_MESSAGE, _DONE, _ERROR = "message", "done", "error"
+
+
+class AgentSession:
+    """One CLI session, owned from connect to disconnect by a single task."""
+
+    def __init__(self, factory: ClientFactory) -> None:
+        self.id = uuid.uuid4().hex[:12]
+        self.created_at = time.monotonic()
+        # Set once connected, cleared on disconnect and on any query/receive failure.
+        self.connected = False
+        self._factory = factory
+        self._inbox: asyncio.Queue[tuple[str, asyncio.Queue] | None] = asyncio.Queue()
+        self._ready: asyncio.Future[None] = asyncio.get_running_loop().create_future()
+        self._task: asyncio.Task | None = None
+        self._claimed = False
+        self._serving = False
+
+    def alive(self) -> bool:
+        return self.connected and self._task is not None and not self._task.done()
+
+    def start(self) -> "AgentSession":
+        self._task = asyncio.create_task(self._own(), name=f"agent-session-{self.id}")
+        return self
+
+    async def wait_ready(self) -> None:
+        """Wait until the client is connected; raises what ``connect()`` raised."""
+
+        await asyncio.shield(self._ready)
+
+    async def run(self, prompt: str) -> AsyncIterator[Any]:
+        """Send ``prompt`` to the owner task and yield the messages it relays back.
+
+        A session serves one run; leaving the iterator early cancels the run
+        and the owner task disconnects.
+        """
+
+        if self._claimed:
+            raise RuntimeError(f"agent session {self.id} already served a run")
+        self._claimed = self._serving = True
+        outbox: asyncio.Queue[tuple[str, Any]] = asyncio.Queue(maxsize=1)
+        self._inbox.put_nowait((prompt, outbox))
+        try:
+            while True:
+                kind, value = await outbox.get()
+                if kind == _MESSAGE:
+                    yield value
+                    continue
+                self._serving = False
+                if kind == _ERROR:
+                    raise value
+                return
+        finally:
+            await self.close()
+
+    async def close(self) -> None:
+        """Have the owner task disconnect and wait for it; a run still in progress is cancelled."""
+
+        if self._task is None:
+            return
+        if self._serving or not self._ready.done():
+            self._task.cancel()
+        else:
+            self._inbox.put_nowait(None)
+        with anyio.CancelScope(shield=True), contextlib.suppress(BaseException):
+            await self._task
+
+    async def _own(self) -> None:
+        client = self._factory()
+        try:
+            await client.connect()
+            self.connected = True
+            self._ready.set_result(None)
+            request = await self._inbox.get()
+            if request is not None:
+                await self._serve(client, *request)
+        except Exception as exc:
+            if not self._ready.done():
+                self._ready.set_exception(exc)
+            else:
+                logger.warning("agent session %s failed: %s", self.id, exc)
+        finally:
+            self.connected = False
+            if not self._ready.done():
+                self._ready.cancel()
+            with anyio.CancelScope(shield=True), contextlib.suppress(Exception):
+                await client.disconnect()
+
+    async def _serve(self, client: Any, prompt: str, outbox: asyncio.Queue) -> None:
+        try:
+            await client.query(prompt)
+            async for message in client.receive_response():
+                await outbox.put((_MESSAGE, message))
+        except Exception as exc:
+            self.connected = False
+            await outbox.put((_ERROR, exc))
+        else:
+            await outbox.put((_DONE, None))
+
+
+class AgentPool:
+    """Keeps up to ``size`` connected spare sessions (idle or warming up).
+
+    Each run takes a spare and a replacement starts warming in the
+    background; with no spare idle, the run starts a session on the spot.
+    """
+
+    def __init__(
+        self,
+        factory: ClientFactory,
+        *,
+        size: int = 0,
+        idle_seconds: float = 600.0,
+        reap_interval: float = 30.0,
+    ) -> None:
+        self.factory = factory
+        self.size = max(0, size)
+        self.idle_seconds = idle_seconds
+        self.reap_interval = reap_interval
+        self._idle: list[AgentSession] = []
+        self._busy: set[AgentSession] = set()
+        self._starting = 0
+        self._tasks: set[asyncio.Task] = set()
+        self._reaper: asyncio.Task | None = None
+        self._closed = True
+        self.evicted = 0
+        self.served = 0
+
+    @classmethod
+    def from_settings(cls, factory: ClientFactory) -> "AgentPool":
+        return cls(factory, size=settings.agent_pool_size, idle_seconds=settings.agent_pool_idle_seconds)
+
+    @property
+    def enabled(self) -> bool:
+        return self.size > 0
+
+    async def start(self) -> None:
+        """Begin warming sessions in the background; does not wait for them."""
+
+        if not self.enabled:
+            return
+        self._closed = False
+        self._fill()
+        self._reaper = asyncio.create_task(self._reap())
+
+    async def stop(self) -> None:
+        self._closed = True
+        tasks = [task for task in (self._reaper, *self._tasks) if task is not None]
+        for task in tasks:
+            task.cancel()
+        for task in tasks:
+            with contextlib.suppress(asyncio.CancelledError, Exception):
+                await task
+        self._reaper = None
+        idle, self._idle = self._idle, []
+        for session in idle:
+            await session.close()
+
+    async def run(self, prompt: str) -> AsyncIterator[Any]:
+        """Run ``prompt`` on a warm session (or one started on the spot) and yield its messages."""
+
+        session = self._checkout()
+        AGENT_POOL_CHECKOUTS.inc(kind="warm" if session is not None else "cold")
+        if session is None:
+            session = AgentSession(self.factory).start()
+            try:
+                await session.wait_ready()
+            except BaseException:
+                await session.close()
+                raise
+        self._busy.add(session)
+        self._fill()
+        messages = session.run(prompt)
+        try:
+            async with contextlib.aclosing(messages):
+                async for message in messages:
+                    yield message
+        finally:
+            self._busy.discard(session)
+            self.served += 1
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "idle": len(self._idle),
+            "busy": len(self._busy),
+            "starting": self._starting,
+            "evicted": self.evicted,
+            "served": self.served,
+        }
+
+    def _checkout(self) -> AgentSession | None:
+        while self._idle:
+            session = self._idle.pop()
+            if session.alive():
+                return session
+            self._discard(session)
+        return None
+
+    def _fill(self) -> None:
+        if self._closed:
+            return
+        for _ in range(self.size - len(self._idle) - self._starting):
+            self._starting += 1
+            self._background(self._warm_one())
+
+    async def _warm_one(self) -> None:
+        session = AgentSession(self.factory).start()
+        try:
+            await session.wait_ready()
+        except BaseException as exc:
+            await session.close()
+            if not isinstance(exc, Exception):
+                raise
+            logger.warning("failed to start pooled agent session: %s", exc)
+            return
+        finally:
+            self._starting -= 1
+        if self._closed:
+            await session.close()
+        else:
+            self._idle.append(session)
+
+    async def _reap(self) -> None:
+        while True:
+            await asyncio.sleep(self.reap_interval)
+            cutoff = time.monotonic() - self.idle_seconds
+            for session in list(self._idle):
+                if session.created_at < cutoff or not session.alive():
+                    self._idle.remove(session)
+                    self.evicted += 1
+                    self._discard(session)
+
+    def _discard(self, session: AgentSession) -> None:
+        self._background(session.close())
+
+    def _background(self, coro: Any) -> None:
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+
+__all__ = ["AgentPool", "AgentSession"]
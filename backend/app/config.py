@@ -7,6 +7,8 @@ from environment variables prefixed with ``NANOBEE_`` to avoid collisions.
 from __future__ import annotations
 
 import os
+from functools import lru_cache
+
 from pydantic import Field
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
@@ -16,6 +18,10 @@ class Settings(BaseSettings):
 
     model_config = SettingsConfigDict(env_prefix="NANOBEE_", env_file=".env", env_file_encoding="utf-8", extra="ignore")
 
+    workspaces_root: str = Field(
+        default="./workspaces",
+        description="Root directory for generated artifacts and on-disk caches",
+    )
     claude_api_key: str = Field(
         default="",
         description="API key for Claude / Anthropic service",
@@ -48,6 +54,14 @@ class Settings(BaseSettings):
         ),
         description="System prompt used for all agent conversations",
     )
+    agent_pool_size: int = Field(
+        default=0,
+        description="Pre-started Claude agent sessions kept ready for upcoming runs; 0 spawns a CLI on demand",
+    )
+    agent_pool_idle_seconds: float = Field(
+        default=600.0,
+        description="Idle time after which a pooled agent session is closed",
+    )
 
     openai_api_key: str = Field(
         default="",
@@ -80,13 +94,165 @@ class Settings(BaseSettings):
         default="ppt-vision-pro",
         description="Model name for generating slide visuals",
     )
+    image_size: str = Field(
+        default="1280x720",
+        description="Resolution requested for every generated slide visual",
+    )
+    image_max_concurrency: int = Field(
+        default=8,
+        description="Maximum number of in-flight image requests per process",
+    )
+    deck_image_concurrency: int = Field(
+        default=4,
+        description="Slides of one deck whose images are generated at once",
+    )
+    image_http_max_connections: int = Field(
+        default=16,
+        description="Connection pool size of the shared image upstream HTTP client",
+    )
+    image_http_max_keepalive: int = Field(
+        default=8,
+        description="Idle keep-alive connections retained by the image upstream HTTP client",
+    )
+    image_http2: bool = Field(
+        default=True,
+        description="Negotiate HTTP/2 with the image upstream when the h2 package is installed",
+    )
+    image_connect_timeout: float = Field(
+        default=10.0,
+        description="Seconds allowed to establish a connection to the image upstream",
+    )
+    image_read_timeout: float = Field(
+        default=60.0,
+        description="Seconds allowed for the image upstream to produce a response",
+    )
+    image_retry_attempts: int = Field(
+        default=3,
+        description="Attempts per slide image (first try included) on timeouts, 429 and 5xx",
+    )
+    image_retry_base_delay: float = Field(
+        default=0.5,
+        description="Base of the jittered exponential backoff between image retries, in seconds",
+    )
+    image_retry_max_delay: float = Field(
+        default=8.0,
+        description="Upper bound of the backoff between image retries, in seconds",
+    )
+    image_retry_max_retry_after: float = Field(
+        default=30.0,
+        description="Longest upstream Retry-After honoured; longer waits fail the slide instead",
+    )
+    image_hedge_enabled: bool = Field(
+        default=False,
+        description="Send a duplicate image request when a slide outlives the hedge latency percentile",
+    )
+    image_hedge_percentile: float = Field(
+        default=95.0,
+        description="Latency percentile of recent image requests after which a hedge is sent",
+    )
+    image_breaker_failure_threshold: int = Field(
+        default=5,
+        description="Consecutive image upstream failures that open the circuit breaker",
+    )
+    image_breaker_reset_seconds: float = Field(
+        default=30.0,
+        description="Seconds the image circuit stays open before a probe request is allowed",
+    )
+    image_store_enabled: bool = Field(
+        default=True,
+        description="Download generated images once into the content-addressed store under the workspaces root",
+    )
+    image_store_max_bytes: int = Field(
+        default=20 * 1024 * 1024,
+        description="Largest single image accepted into the image store",
+    )
+    image_store_max_disk_bytes: int = Field(
+        default=2 * 1024**3,
+        description="Size cap of the image store; least recently used images are removed first",
+    )
+    public_base_url: str = Field(
+        default="",
+        description="Externally reachable origin of the deployment, used to make stored image links absolute for the agent",
+    )
+    image_cache_enabled: bool = Field(
+        default=True,
+        description="Reuse previously generated visuals for identical (model, size, prompt)",
+    )
+    image_cache_ttl_seconds: int = Field(
+        default=7 * 24 * 3600,
+        description="Seconds a cached image result stays valid",
+    )
+    image_cache_memory_entries: int = Field(
+        default=256,
+        description="Number of image results kept in the in-memory LRU tier",
+    )
+    image_cache_max_disk_bytes: int = Field(
+        default=64 * 1024 * 1024,
+        description="Size cap of the on-disk image result cache under the workspaces root",
+    )
+    job_workers: int = Field(
+        default=2,
+        description="Number of background workers draining the job queue",
+    )
+    job_max_queue_depth: int = Field(
+        default=100,
+        description="Maximum number of queued jobs before new submissions are rejected",
+    )
+    job_max_queue_per_tenant: int = Field(
+        default=10,
+        description="Maximum number of queued jobs per tenant",
+    )
+    job_result_ttl_seconds: float = Field(
+        default=86400.0,
+        description="How long finished jobs and their results are kept, in memory and on disk",
+    )
+    job_max_finished: int = Field(
+        default=1000,
+        description="Maximum number of finished jobs kept; the oldest are dropped first",
+    )
+    export_cache_enabled: bool = Field(
+        default=True,
+        description="Keep rendered PDF/PPTX exports under the workspaces root, keyed by deck hash",
+    )
+    export_cache_max_bytes: int = Field(
+        default=512 * 1024 * 1024,
+        description="Size cap of the export cache; least recently used files are removed first",
+    )
+    export_image_hosts: str = Field(
+        default="",
+        description="Comma-separated hosts (a leading dot also matches subdomains) whose image URLs deck export may download, besides the image API host",
+    )
+    export_max_download_bytes: int = Field(
+        default=64 * 1024 * 1024,
+        description="Total bytes one deck export may download for slide images that are not in the image store yet",
+    )
+    export_download_concurrency: int = Field(
+        default=4,
+        description="Slide images one deck export downloads at the same time",
+    )
+    tracing_enabled: bool = Field(
+        default=True,
+        description="Record per-request spans and export them as JSONL under the workspaces root",
+    )
+    trace_memory_requests: int = Field(
+        default=200,
+        description="Number of recent request traces kept in memory for /debug/traces",
+    )
+    admin_token: str = Field(
+        default="",
+        description="Token required in X-Admin-Token for operator routes; when empty they only answer loopback clients",
+    )
     default_slide_count: int = Field(
         default=6,
         description="Fallback number of slides when the user does not specify",
     )
 
     def apply_environment(self) -> None:
-        """Apply settings to process environment for SDK compatibility."""
+        """Apply settings to process environment for SDK compatibility.
+
+        Idempotent; called when the app starts and before the first agent run
+        rather than at import, so importing the package has no side effects.
+        """
 
         effective_key = self.text_api_key or self.claude_api_key
         if effective_key and not os.environ.get("ANTHROPIC_API_KEY"):
@@ -95,6 +261,9 @@ class Settings(BaseSettings):
             os.environ["ANTHROPIC_BASE_URL"] = self.anthropic_base_url
         elif self.default_text_base_url and not os.environ.get("ANTHROPIC_BASE_URL"):
             os.environ["ANTHROPIC_BASE_URL"] = self.default_text_base_url
+        if not os.environ.get("ANTHROPIC_CUSTOM_HEADERS"):
+            # Agent turns through the bundled proxy queue behind interactive traffic.
+            os.environ["ANTHROPIC_CUSTOM_HEADERS"] = "X-Request-Priority: batch"
         if self.openai_api_key and not os.environ.get("OPENAI_API_KEY"):
             os.environ["OPENAI_API_KEY"] = self.openai_api_key
         if self.openai_base_url and not os.environ.get("OPENAI_BASE_URL"):
@@ -107,5 +276,9 @@ class Settings(BaseSettings):
             os.environ["OPENAI_SMALL_MODEL"] = self.openai_small_model
 
 
-settings = Settings()
-settings.apply_environment()
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    return Settings()
+
+
+settings = get_settings()
@@ -0,0 +1,627 @@
+"""Server-side deck export to PDF (native) and PPTX (optional ``python-pptx``).
+
+The PDF writer emits one object at a time and images are copied from the
+:class:`~app.image_store.ImageStore` in fixed-size chunks, so a deck is
+streamed to the client page by page without ever being held in memory. JPEG
+files are embedded as-is (``DCTDecode``) and non-interlaced PNGs without an
+alpha channel reuse their ``IDAT`` data (``FlateDecode`` with the PNG
+predictor); other formats get a placeholder frame. Text uses the predefined
+``STSong-Light`` CID font so Chinese renders without embedding a font file.
+
+Rendered files are cached under ``$NANOBEE_WORKSPACES_ROOT/exports`` by a hash
+of the deck, and the cache is written as a side effect of the first stream.
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import ipaddress
+import json
+import os
+import re
+import socket
+import struct
+import tempfile
+import unicodedata
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, Literal
+from urllib.parse import quote, urlsplit
+
+import httpx
+from pydantic import BaseModel, Field
+
+from .config import settings
+from .image_store import DIGEST_PATTERN, PUBLIC_PREFIX, ImageStore
+
+EXPORT_VERSION = 1
+CHUNK_SIZE = 64 * 1024
+PAGE_WIDTH, PAGE_HEIGHT = 842, 595  # A4 landscape in points, as the browser export used
+MEDIA_TYPES = {
+    "pdf": "application/pdf",
+    "pptx": "application/vnd.openxmlformats-officedocument.presentationml.presentation",
+}
+# Matching only the ``/images/`` tail also accepts references stored before images moved under ``/api``.
+_DIGEST_REF = re.compile(rf"(?:^|{re.escape(PUBLIC_PREFIX.removeprefix('/api'))}/)([0-9a-f]{{64}})$")
+_TOKEN = re.compile(r"[\x21-\x7e]+\s*|\s+|.", re.S)
+
+
+class ExportUnavailableError(RuntimeError):
+    """Raised when the optional dependency for an export format is missing."""
+
+
+class ExportPalette(BaseModel):
+    primary: str = "#1f2937"
+    secondary: str = "#475569"
+    accent: str = "#2563eb"
+
+
+class ExportSlide(BaseModel):
+    title: str = Field(..., description="页面标题")
+    bullets: list[str] = Field(default_factory=list, description="要点")
+    image: str | None = Field(None, description="配图：/api/images/{digest}、摘要、图片URL或data URL")
+    palette: ExportPalette | None = Field(None, description="页面配色")
+
+
+class DeckExportRequest(BaseModel):
+    title: str = Field("", description="文档标题，同时作为下载文件名")
+    format: Literal["pdf", "pptx"] = Field("pdf", description="导出格式")
+    slides: list[ExportSlide] = Field(..., min_length=1, description="按顺序排列的页面")
+
+    def digest(self) -> str:
+        canonical = json.dumps(
+            {"version": EXPORT_VERSION, **self.model_dump()}, ensure_ascii=False, sort_keys=True, separators=(",", ":")
+        )
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def digest_from_reference(reference: str) -> str | None:
+    """Extract a store digest from ``/api/images/<digest>``, a full URL to it or a bare digest."""
+
+    match = _DIGEST_REF.search(reference.split("?", 1)[0])
+    return match.group(1) if match else None
+
+
+def allowed_image_hosts() -> set[str]:
+    """Hosts deck export may download from: the image API's own host plus ``export_image_hosts``."""
+
+    hosts = {host.strip().lower() for host in settings.export_image_hosts.split(",") if host.strip()}
+    api_host = urlsplit(settings.image_api_base_url).hostname
+    if api_host:
+        hosts.add(api_host.lower())
+    return hosts
+
+
+def _host_allowed(host: str, allowed: set[str]) -> bool:
+    return host in allowed or any(entry.startswith(".") and host.endswith(entry) for entry in allowed)
+
+
+async def _public_address(host: str, port: int) -> bool:
+    """True when every address ``host`` resolves to is globally routable (no private, loopback or link-local)."""
+
+    try:
+        infos = await asyncio.to_thread(socket.getaddrinfo, host, port, type=socket.SOCK_STREAM)
+    except OSError:
+        return False
+    addresses = {ipaddress.ip_address(info[4][0].split("%", 1)[0]) for info in infos}
+    return bool(addresses) and all(address.is_global for address in addresses)
+
+
+async def _check_url(url: str, allowed: set[str]) -> bool:
+    parts = urlsplit(url)
+    host = (parts.hostname or "").lower()
+    if parts.scheme not in ("http", "https") or not host or not _host_allowed(host, allowed):
+        return False
+    return await _public_address(host, parts.port or (443 if parts.scheme == "https" else 80))
+
+
+async def resolve_images(
+    slides: Iterable[ExportSlide], store: ImageStore, client: httpx.AsyncClient
+) -> list[Path | None]:
+    """Map each slide image to a file in the image store.
+
+    Stored digests are read directly. Data URLs and URLs on an allowed image
+    host that resolves to public addresses only are ingested once, at most
+    ``export_download_concurrency`` at a time and ``export_max_download_bytes``
+    in total, so later exports of the same picture hit the store. Anything
+    else, including images past the byte budget, becomes ``None`` and renders
+    as a placeholder.
+    """
+
+    allowed = allowed_image_hosts()
+    limit = asyncio.Semaphore(max(1, settings.export_download_concurrency))
+    # Bytes promised to downloads in flight or already spent; single event loop, so no lock.
+    budget = {"reserved": 0}
+
+    async def resolve(reference: str) -> Path | None:
+        digest = digest_from_reference(reference) if reference else None
+        if digest:
+            return await asyncio.to_thread(store.path_for, digest)
+        async with limit:
+            try:
+                if reference.startswith("data:"):
+                    stored = await store.ingest({"url": reference}, client)
+                    budget["reserved"] += stored["bytes"] if stored else 0
+                elif await _check_url(reference, allowed):
+                    allowance = min(store.max_bytes, settings.export_max_download_bytes - budget["reserved"])
+                    if allowance <= 0:
+                        return None
+                    budget["reserved"] += allowance
+                    stored = None
+                    try:
+                        stored = await store.download(reference, client, max_bytes=allowance)
+                    finally:
+                        budget["reserved"] -= allowance - (stored["bytes"] if stored else 0)
+                else:
+                    return None
+            except (httpx.HTTPError, ValueError, OSError):
+                return None
+        return await asyncio.to_thread(store.path_for, stored["digest"]) if stored else None
+
+    return list(await asyncio.gather(*(resolve((slide.image or "").strip()) for slide in slides)))
+
+
+# --------------------------------------------------------------------------- images
+
+
+@dataclass
+class PdfImage:
+    width: int
+    height: int
+    entries: str
+    length: int
+    chunks: Callable[[], Iterator[bytes]]
+
+
+def _read_ranges(path: Path, ranges: list[tuple[int, int]]) -> Iterator[bytes]:
+    with path.open("rb") as handle:
+        for offset, length in ranges:
+            handle.seek(offset)
+            while length > 0:
+                chunk = handle.read(min(CHUNK_SIZE, length))
+                if not chunk:
+                    return
+                length -= len(chunk)
+                yield chunk
+
+
+def _probe_jpeg(path: Path) -> PdfImage | None:
+    with path.open("rb") as handle:
+        if handle.read(2) != b"\xff\xd8":
+            return None
+        adobe = False
+        while True:
+            byte = handle.read(1)
+            while byte and byte != b"\xff":
+                byte = handle.read(1)
+            while byte == b"\xff":
+                byte = handle.read(1)
+            if not byte:
+                return None
+            marker = byte[0]
+            if marker == 0x01 or 0xD0 <= marker <= 0xD8:
+                continue
+            if marker == 0xD9:
+                return None
+            (length,) = struct.unpack(">H", handle.read(2))
+            segment_end = handle.tell() + length - 2
+            if marker == 0xEE:
+                adobe = handle.read(5) == b"Adobe"
+            elif 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+                bits, height, width, components = struct.unpack(">BHHB", handle.read(6))
+                break
+            handle.seek(segment_end)
+    colour_space = {1: "/DeviceGray", 3: "/DeviceRGB", 4: "/DeviceCMYK"}.get(components)
+    if colour_space is None or not width or not height:
+        return None
+    entries = f"/ColorSpace {colour_space} /BitsPerComponent {bits} /Filter /DCTDecode"
+    if components == 4 and adobe:
+        # Adobe writes CMYK JPEGs inverted.
+        entries += " /Decode [1 0 1 0 1 0 1 0]"
+    size = path.stat().st_size
+    return PdfImage(width, height, entries, size, lambda: _read_ranges(path, [(0, size)]))
+
+
+def _probe_png(path: Path) -> PdfImage | None:
+    header = None
+    palette = b""
+    idat: list[tuple[int, int]] = []
+    with path.open("rb") as handle:
+        if handle.read(8) != b"\x89PNG\r\n\x1a\n":
+            return None
+        while True:
+            chunk_header = handle.read(8)
+            if len(chunk_header) < 8:
+                break
+            length, kind = struct.unpack(">I4s", chunk_header)
+            if kind == b"IHDR":
+                header = struct.unpack(">IIBBBBB", handle.read(13))
+                handle.seek(4, os.SEEK_CUR)
+            elif kind == b"PLTE":
+                palette = handle.read(length)
+                handle.seek(4, os.SEEK_CUR)
+            elif kind == b"IDAT":
+                idat.append((handle.tell(), length))
+                handle.seek(length + 4, os.SEEK_CUR)
+            elif kind == b"IEND":
+                break
+            else:
+                handle.seek(length + 4, os.SEEK_CUR)
+    if header is None or not idat:
+        return None
+    width, height, depth, colour_type, _, _, interlace = header
+    if interlace:
+        return None
+    if colour_type == 0:
+        colour_space, colours = "/DeviceGray", 1
+    elif colour_type == 2 and depth in (8, 16):
+        colour_space, colours = "/DeviceRGB", 3
+    elif colour_type == 3 and palette:
+        colour_space, colours = f"[/Indexed /DeviceRGB {len(palette) // 3 - 1} <{palette.hex()}>]", 1
+    else:
+        # Alpha channels are interleaved with colour data in IDAT; splitting them
+        # out needs a full decode, which the export deliberately avoids.
+        return None
+    entries = (
+        f"/ColorSpace {colour_space} /BitsPerComponent {depth} /Filter /FlateDecode "
+        f"/DecodeParms << /Predictor 15 /Colors {colours} /BitsPerComponent {depth} /Columns {width} >>"
+    )
+    return PdfImage(width, height, entries, sum(length for _, length in idat), lambda: _read_ranges(path, idat))
+
+
+def probe_image(path: Path | None) -> PdfImage | None:
+    """Describe a stored image as a PDF XObject, or ``None`` if it cannot be embedded."""
+
+    if path is None:
+        return None
+    try:
+        return _probe_jpeg(path) or _probe_png(path)
+    except (OSError, struct.error):
+        return None
+
+
+# --------------------------------------------------------------------------- text
+
+
+def _char_width(char: str) -> float:
+    return 1.0 if unicodedata.east_asian_width(char) in ("W", "F") else 0.5
+
+
+def text_width(text: str, size: float) -> float:
+    return sum(_char_width(char) for char in text) * size
+
+
+def wrap_text(text: str, size: float, max_width: float) -> list[str]:
+    """Break ``text`` into lines no wider than ``max_width`` points.
+
+    Latin words stay together where they fit; CJK text may break between
+    any two characters.
+    """
+
+    lines: list[str] = []
+    line = ""
+    for token in _TOKEN.findall(" ".join(text.split())):
+        pieces = [token] if text_width(token.rstrip(), size) <= max_width else list(token)
+        for piece in pieces:
+            if line and text_width(line + piece.rstrip(), size) > max_width:
+                lines.append(line.rstrip())
+                line = piece.lstrip()
+            else:
+                line += piece
+    if line.strip():
+        lines.append(line.rstrip())
+    return lines
+
+
+def _pdf_text(text: str) -> str:
+    # UniGB-UCS2-H takes two-byte BMP code points.
+    return "<" + "".join(f"{ord(char) if ord(char) <= 0xFFFF else 0x3F:04x}" for char in text) + ">"
+
+
+def _rgb_hex(colour: str, fallback: str) -> str:
+    value = colour.strip().lstrip("#")
+    return value.upper() if re.fullmatch(r"[0-9a-fA-F]{6}", value) else fallback.lstrip("#").upper()
+
+
+def _rgb(colour: str, fallback: str) -> str:
+    value = _rgb_hex(colour, fallback)
+    return " ".join(f"{int(value[i:i + 2], 16) / 255:.3f}" for i in (0, 2, 4))
+
+
+# --------------------------------------------------------------------------- pdf
+
+
+def _page_content(slide: ExportSlide, image: PdfImage | None, has_image: bool, number: int, total: int) -> bytes:
+    palette = slide.palette or ExportPalette()
+    primary = _rgb(palette.primary, ExportPalette().primary)
+    secondary = _rgb(palette.secondary, ExportPalette().secondary)
+    accent = _rgb(palette.accent, ExportPalette().accent)
+    margin = 60
+    text_right = 420 if has_image else PAGE_WIDTH - margin
+    ops = [f"{accent} rg 0 {PAGE_HEIGHT - 8} {PAGE_WIDTH} 8 re f"]
+
+    y = PAGE_HEIGHT - 80
+    for line in wrap_text(slide.title, 24, PAGE_WIDTH - 2 * margin)[:2]:
+        ops.append(f"BT /F1 24 Tf {primary} rg {margin} {y} Td {_pdf_text(line)} Tj ET")
+        y -= 30
+    y -= 20
+
+    for bullet in slide.bullets:
+        lines = wrap_text(bullet, 14, text_right - margin - 20)
+        if not lines:
+            continue
+        if y < 60:
+            break
+        ops.append(f"{accent} rg {margin + 2} {y + 3} 5 5 re f")
+        for line in lines:
+            if y < 60:
+                break
+            ops.append(f"BT /F1 14 Tf {secondary} rg {margin + 20} {y} Td {_pdf_text(line)} Tj ET")
+            y -= 20
+        y -= 6
+
+    box_x, box_y, box_w, box_h = 440, 150, PAGE_WIDTH - margin - 440, 300
+    if image is not None:
+        scale = min(box_w / image.width, box_h / image.height)
+        width, height = image.width * scale, image.height * scale
+        x, y = box_x + (box_w - width) / 2, box_y + (box_h - height) / 2
+        ops.append(f"q {width:.2f} 0 0 {height:.2f} {x:.2f} {y:.2f} cm /Im0 Do Q")
+    elif has_image:
+        ops.append(f"q 0.8 G 1 w {box_x} {box_y} {box_w} {box_h} re S Q")
+        ops.append(f"BT /F1 12 Tf 0.6 g {box_x + 20} {box_y + box_h / 2} Td {_pdf_text('图片暂不支持导出')} Tj ET")
+
+    label = f"{number} / {total}"
+    ops.append(f"BT /F1 10 Tf 0.6 g {PAGE_WIDTH - margin - text_width(label, 10):.2f} 30 Td {_pdf_text(label)} Tj ET")
+    return "\n".join(ops).encode("ascii")
+
+
+class _PdfWriter:
+    """Tracks byte offsets of emitted objects for the trailing xref table."""
+
+    def __init__(self) -> None:
+        self.offset = 0
+        self.offsets: dict[int, int] = {}
+        self.next_number = 1
+
+    def reserve(self) -> int:
+        number = self.next_number
+        self.next_number += 1
+        return number
+
+    def emit(self, data: bytes) -> bytes:
+        self.offset += len(data)
+        return data
+
+    def obj(self, number: int, body: str) -> bytes:
+        self.offsets[number] = self.offset
+        return self.emit(f"{number} 0 obj\n{body}\nendobj\n".encode("ascii"))
+
+    def stream(self, number: int, entries: str, length: int, chunks: Iterable[bytes]) -> Iterator[bytes]:
+        self.offsets[number] = self.offset
+        yield self.emit(f"{number} 0 obj\n<< {entries} /Length {length} >>\nstream\n".encode("ascii"))
+        for chunk in chunks:
+            yield self.emit(chunk)
+        yield self.emit(b"\nendstream\nendobj\n")
+
+    def trailer(self, root: int, info: int) -> bytes:
+        start = self.offset
+        rows = [f"xref\n0 {self.next_number}\n", "0000000000 65535 f \n"]
+        rows.extend(f"{self.offsets[number]:010d} 00000 n \n" for number in range(1, self.next_number))
+        rows.append(f"trailer\n<< /Size {self.next_number} /Root {root} 0 R /Info {info} 0 R >>\nstartxref\n{start}\n%%EOF\n")
+        return self.emit("".join(rows).encode("ascii"))
+
+
+def render_pdf(deck: DeckExportRequest, images: list[Path | None]) -> Iterator[bytes]:
+    """Yield the PDF for ``deck`` object by object; memory use is bounded by one page."""
+
+    writer = _PdfWriter()
+    catalog, pages, font, cid_font, descriptor, info = (writer.reserve() for _ in range(6))
+    yield writer.emit(b"%PDF-1.5\n%\xe2\xe3\xcf\xd3\n")
+    yield writer.obj(catalog, f"<< /Type /Catalog /Pages {pages} 0 R >>")
+    yield writer.obj(font, f"<< /Type /Font /Subtype /Type0 /BaseFont /STSong-Light /Encoding /UniGB-UCS2-H /DescendantFonts [{cid_font} 0 R] >>")
+    yield writer.obj(
+        cid_font,
+        "<< /Type /Font /Subtype /CIDFontType0 /BaseFont /STSong-Light "
+        f"/CIDSystemInfo << /Registry (Adobe) /Ordering (GB1) /Supplement 2 >> /FontDescriptor {descriptor} 0 R "
+        "/DW 1000 /W [1 95 500] >>",
+    )
+    yield writer.obj(
+        descriptor,
+        "<< /Type /FontDescriptor /FontName /STSong-Light /Flags 6 /FontBBox [-25 -254 1000 880] "
+        "/ItalicAngle 0 /Ascent 880 /Descent -120 /CapHeight 880 /StemV 93 >>",
+    )
+    title = "".join(f"{ord(char):04x}" for char in deck.title if ord(char) <= 0xFFFF)
+    yield writer.obj(info, f"<< /Title <feff{title}> /Producer (NanoBee) >>")
+
+    kids = []
+    total = len(deck.slides)
+    for index, (slide, path) in enumerate(zip(deck.slides, images)):
+        image = probe_image(path)
+        resources = f"/Font << /F1 {font} 0 R >>"
+        if image is not None:
+            image_number = writer.reserve()
+            entries = f"/Type /XObject /Subtype /Image /Width {image.width} /Height {image.height} {image.entries}"
+            yield from writer.stream(image_number, entries, image.length, image.chunks())
+            resources += f" /XObject << /Im0 {image_number} 0 R >>"
+        content = _page_content(slide, image, bool(slide.image), index + 1, total)
+        content_number = writer.reserve()
+        yield from writer.stream(content_number, "", len(content), [content])
+        page = writer.reserve()
+        yield writer.obj(
+            page,
+            f"<< /Type /Page /Parent {pages} 0 R /MediaBox [0 0 {PAGE_WIDTH} {PAGE_HEIGHT}] "
+            f"/Resources << {resources} >> /Contents {content_number} 0 R >>",
+        )
+        kids.append(f"{page} 0 R")
+
+    yield writer.obj(pages, f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>")
+    yield writer.trailer(catalog, info)
+
+
+# --------------------------------------------------------------------------- pptx
+
+
+def write_pptx(deck: DeckExportRequest, images: list[Path | None], target: Path) -> None:
+    """Build a 16:9 PPTX with ``python-pptx`` (``pip install nanobee-backend[export]``)."""
+
+    try:
+        from pptx import Presentation
+        from pptx.dml.color import RGBColor
+        from pptx.util import Emu, Inches, Pt
+    except ImportError as exc:
+        raise ExportUnavailableError("PPTX export requires the optional python-pptx package") from exc
+
+    presentation = Presentation()
+    presentation.slide_width, presentation.slide_height = Inches(13.333), Inches(7.5)
+    blank = presentation.slide_layouts[6]
+    for slide, path in zip(deck.slides, images):
+        palette = slide.palette or ExportPalette()
+        page = presentation.slides.add_slide(blank)
+        title = page.shapes.add_textbox(Inches(0.8), Inches(0.5), Inches(11.7), Inches(1.0)).text_frame
+        title.word_wrap = True
+        # Style the paragraph rather than its first run: an empty title has no runs.
+        heading = title.paragraphs[0]
+        heading.text = slide.title
+        heading.font.size = Pt(32)
+        heading.font.color.rgb = RGBColor.from_string(_rgb_hex(palette.primary, ExportPalette().primary))
+
+        body_width = Inches(6.0) if path else Inches(11.7)
+        body = page.shapes.add_textbox(Inches(0.8), Inches(1.8), body_width, Inches(5.0)).text_frame
+        body.word_wrap = True
+        for index, bullet in enumerate(slide.bullets):
+            paragraph = body.paragraphs[0] if index == 0 else body.add_paragraph()
+            paragraph.text = f"• {bullet}"
+            paragraph.font.size = Pt(18)
+            paragraph.space_after = Pt(8)
+
+        if path is not None:
+            try:
+                picture = page.shapes.add_picture(str(path), Inches(7.2), Inches(1.8))
+            except Exception:  # unsupported formats (e.g. WebP) keep the text-only slide
+                continue
+            box_w, box_h = Inches(5.3), Inches(4.8)
+            scale = min(box_w / picture.width, box_h / picture.height)
+            picture.width, picture.height = Emu(int(picture.width * scale)), Emu(int(picture.height * scale))
+
+    target.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_name = tempfile.mkstemp(dir=target.parent, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as handle:
+            presentation.save(handle)
+        os.replace(tmp_name, target)
+    finally:
+        if os.path.exists(tmp_name):
+            os.unlink(tmp_name)
+
+
+# --------------------------------------------------------------------------- cache
+
+
+class DeckExporter:
+    """Renders decks and keeps the results on disk keyed by deck hash."""
+
+    def __init__(self, root: Path, *, max_disk_bytes: int = 512 * 1024 * 1024, enabled: bool = True) -> None:
+        self.root = Path(root)
+        self.max_disk_bytes = max_disk_bytes
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_settings(cls) -> "DeckExporter":
+        return cls(
+            Path(settings.workspaces_root) / "exports",
+            max_disk_bytes=settings.export_cache_max_bytes,
+            enabled=settings.export_cache_enabled,
+        )
+
+    def path(self, digest: str, fmt: str) -> Path:
+        return self.root / f"{digest}.{fmt}"
+
+    def cached(self, digest: str, fmt: str) -> Path | None:
+        """Return a previously rendered file, refreshing its mtime for LRU eviction."""
+
+        path = self.path(digest, fmt)
+        if self.enabled and DIGEST_PATTERN.match(digest) and path.is_file():
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+            self.hits += 1
+            return path
+        self.misses += 1
+        return None
+
+    def stream_pdf(self, deck: DeckExportRequest, images: list[Path | None], digest: str) -> Iterator[bytes]:
+        """Stream the PDF and, if caching is on, tee it into the cache.
+
+        The cache file only appears once the whole document has been written,
+        so a client that disconnects half way leaves nothing behind.
+        """
+
+        chunks = render_pdf(deck, images)
+        if not self.enabled:
+            yield from chunks
+            return
+        target = self.path(digest, "pdf")
+        target.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_name = tempfile.mkstemp(dir=target.parent, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as handle:
+                for chunk in chunks:
+                    handle.write(chunk)
+                    yield chunk
+            os.replace(tmp_name, target)
+        finally:
+            if os.path.exists(tmp_name):
+                os.unlink(tmp_name)
+        self.evict()
+
+    def build_pptx(self, deck: DeckExportRequest, images: list[Path | None], digest: str) -> Path:
+        target = self.path(digest, "pptx")
+        write_pptx(deck, images, target)
+        self.evict()
+        return target
+
+    def evict(self) -> None:
+        """Drop least recently used exports until the directory fits its cap."""
+
+        files = sorted(
+            (path for path in self.root.glob("*.*") if not path.name.startswith(".")),
+            key=lambda path: path.stat().st_mtime,
+        )
+        total = sum(path.stat().st_size for path in files)
+        for path in files:
+            if total <= self.max_disk_bytes:
+                break
+            size = path.stat().st_size
+            try:
+                path.unlink()
+            except OSError:
+                continue
+            total -= size
+
+    def stats(self) -> dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses}
+
+
+def content_disposition(title: str, fmt: str) -> str:
+    name = (title.strip() or "deck").replace("/", "_")
+    return f"attachment; filename=\"deck.{fmt}\"; filename*=UTF-8''{quote(name)}.{fmt}"
+
+
+exporter = DeckExporter.from_settings()
+
+__all__ = [
+    "DeckExportRequest",
+    "DeckExporter",
+    "ExportSlide",
+    "ExportUnavailableError",
+    "MEDIA_TYPES",
+    "content_disposition",
+    "digest_from_reference",
+    "exporter",
+    "render_pdf",
+    "resolve_images",
+    "write_pptx",
+]
@@ -0,0 +1,199 @@
+"""Content-addressed cache for generated slide visuals.
+
+Results are keyed by a hash of ``(model, size, prompt)`` and kept in two
+tiers: a small in-memory LRU for hot prompts and JSON files under the
+workspaces root so that retries and repeated topics survive restarts. Disk
+reads and writes run in worker threads; the disk tier's sizes are indexed in
+memory after one scan, so eviction never re-lists the directory.
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any
+
+from .config import settings
+
+
+class ImageResultCache:
+    """Two-tier (memory LRU + disk) cache with TTL and size-based eviction."""
+
+    def __init__(
+        self,
+        root: Path,
+        *,
+        ttl_seconds: int = 7 * 24 * 3600,
+        max_entries: int = 256,
+        max_disk_bytes: int = 64 * 1024 * 1024,
+        enabled: bool = True,
+    ) -> None:
+        self.root = Path(root)
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max(1, max_entries)
+        self.max_disk_bytes = max_disk_bytes
+        self.enabled = enabled
+        self._memory: OrderedDict[str, tuple[float, dict[str, Any]]] = OrderedDict()
+        self._index: dict[str, tuple[int, float]] | None = None
+        self._disk_bytes = 0
+        self.hits_memory = 0
+        self.hits_disk = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @classmethod
+    def from_settings(cls) -> "ImageResultCache":
+        return cls(
+            Path(settings.workspaces_root) / "cache" / "images",
+            ttl_seconds=settings.image_cache_ttl_seconds,
+            max_entries=settings.image_cache_memory_entries,
+            max_disk_bytes=settings.image_cache_max_disk_bytes,
+            enabled=settings.image_cache_enabled,
+        )
+
+    @staticmethod
+    def make_key(model: str, size: str, prompt: str) -> str:
+        canonical = json.dumps([model, size, prompt], ensure_ascii=False, separators=(",", ":"))
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    async def get(self, key: str) -> dict[str, Any] | None:
+        """Return a cached result or ``None``; expired entries count as misses.
+
+        Memory hits are answered inline; the disk tier is read in a worker thread.
+        """
+
+        if not self.enabled:
+            return None
+        now = time.time()
+        entry = self._memory.get(key)
+        if entry is not None:
+            created_at, value = entry
+            if now - created_at <= self.ttl_seconds:
+                self._memory.move_to_end(key)
+                self.hits_memory += 1
+                return value
+            del self._memory[key]
+
+        path = self._path(key)
+        record = await asyncio.to_thread(self._read, path)
+        if record is not None:
+            created_at = float(record.get("created_at", 0))
+            if now - created_at <= self.ttl_seconds:
+                self._remember(key, created_at, record["value"])
+                self.hits_disk += 1
+                return record["value"]
+            if await asyncio.to_thread(self._unlink, path):
+                self._forget(key)
+
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, value: dict[str, Any]) -> None:
+        if not self.enabled:
+            return
+        created_at = time.time()
+        self._remember(key, created_at, value)
+
+        index = await self._load_index()
+        data = json.dumps({"created_at": created_at, "value": value}, ensure_ascii=False).encode("utf-8")
+        if not await asyncio.to_thread(self._write, self._path(key), data):
+            return
+        self._forget(key)
+        index[key] = (len(data), created_at)
+        self._disk_bytes += len(data)
+        if self._disk_bytes > self.max_disk_bytes:
+            await self._evict_disk(index)
+
+    def stats(self) -> dict[str, int]:
+        hits = self.hits_memory + self.hits_disk
+        return {
+            "hits": hits,
+            "hits_memory": self.hits_memory,
+            "hits_disk": self.hits_disk,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "memory_entries": len(self._memory),
+        }
+
+    def _remember(self, key: str, created_at: float, value: dict[str, Any]) -> None:
+        self._memory[key] = (created_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _path(self, key: str) -> Path:
+        return self.root / key[:2] / f"{key}.json"
+
+    async def _load_index(self) -> dict[str, tuple[int, float]]:
+        """Sizes and write times of the disk tier, scanned once and then kept up to date."""
+
+        if self._index is None:
+            scanned = await asyncio.to_thread(self._scan)
+            if self._index is None:
+                self._index = scanned
+                self._disk_bytes = sum(size for size, _ in scanned.values())
+        return self._index
+
+    def _forget(self, key: str) -> None:
+        if self._index is not None and key in self._index:
+            self._disk_bytes -= self._index.pop(key)[0]
+
+    def _scan(self) -> dict[str, tuple[int, float]]:
+        index: dict[str, tuple[int, float]] = {}
+        for path in self.root.glob("*/*.json"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            index[path.stem] = (stat.st_size, stat.st_mtime)
+        return index
+
+    async def _evict_disk(self, index: dict[str, tuple[int, float]]) -> None:
+        """Drop the oldest files (and expired ones) until the disk tier fits its cap."""
+
+        cutoff = time.time() - self.ttl_seconds
+        victims: list[str] = []
+        total = self._disk_bytes
+        for key, (size, written_at) in sorted(index.items(), key=lambda item: item[1][1]):
+            if total <= self.max_disk_bytes and written_at >= cutoff:
+                break
+            victims.append(key)
+            total -= size
+        for key in victims:
+            self._forget(key)
+            self._memory.pop(key, None)
+        self.evictions += len(victims)
+        await asyncio.to_thread(lambda: [self._unlink(self._path(key)) for key in victims])
+
+    @staticmethod
+    def _read(path: Path) -> dict[str, Any] | None:
+        try:
+            return json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def _write(path: Path, data: bytes) -> bool:
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_suffix(".tmp")
+            tmp_path.write_bytes(data)
+            os.replace(tmp_path, path)
+        except OSError:
+            return False
+        return True
+
+    @staticmethod
+    def _unlink(path: Path) -> bool:
+        try:
+            path.unlink()
+        except OSError:
+            return False
+        return True
+
+
+__all__ = ["ImageResultCache"]
@@ -1,11 +1,21 @@
 """HTTP client for calling the slide image generation LLM API."""
 from __future__ import annotations
 
-from typing import Any
+import asyncio
+import hashlib
+import importlib.util
+import json
+import time
+from typing import Any, AsyncIterator
 
 import httpx
 
 from .config import settings
+from .image_store import ImageStore
+from .metrics import IMAGE_HEDGES, IMAGE_IN_FLIGHT, IMAGE_LATENCY, IMAGE_RETRIES, IMAGE_SHED
+from .resilience import CircuitBreaker, LatencyTracker, RetryPolicy, hedge, is_retryable_error, retry_after_of
+from .tracing import tracer
+from .singleflight import SingleFlight
 
 
 class ImageGenerationClient:
@@ -16,33 +26,230 @@ class ImageGenerationClient:
         self.path = settings.image_api_path
         self.model = settings.image_model
         self.api_key = settings.image_api_key
+        self.size = settings.image_size
+        self._process_limit = asyncio.Semaphore(max(1, settings.image_max_concurrency))
+        self._http_client: httpx.AsyncClient | None = None
+        self._flights = SingleFlight()
+        self.retry_policy = RetryPolicy(
+            attempts=settings.image_retry_attempts,
+            base_delay=settings.image_retry_base_delay,
+            max_delay=settings.image_retry_max_delay,
+            max_retry_after=settings.image_retry_max_retry_after,
+        )
+        self.breaker = CircuitBreaker(settings.image_breaker_failure_threshold, settings.image_breaker_reset_seconds)
+        self.latencies = LatencyTracker()
+        self.store = ImageStore.from_settings()
+        self.hedge_enabled = settings.image_hedge_enabled
+        self.hedge_percentile = settings.image_hedge_percentile
 
     @property
     def endpoint(self) -> str:
         return f"{self.base_url}/{self.path.lstrip('/')}"
 
+    @property
+    def http_client(self) -> httpx.AsyncClient:
+        """Pooled HTTP client shared by every request, created on first use."""
+
+        if self._http_client is None or self._http_client.is_closed:
+            self._http_client = self._build_http_client()
+        return self._http_client
+
+    @staticmethod
+    def _build_http_client() -> httpx.AsyncClient:
+        # HTTP/2 needs the optional ``h2`` package; fall back to HTTP/1.1 keep-alive without it.
+        http2 = settings.image_http2 and importlib.util.find_spec("h2") is not None
+        return httpx.AsyncClient(
+            http2=http2,
+            limits=httpx.Limits(
+                max_connections=settings.image_http_max_connections,
+                max_keepalive_connections=settings.image_http_max_keepalive,
+            ),
+            timeout=httpx.Timeout(settings.image_read_timeout, connect=settings.image_connect_timeout),
+        )
+
+    async def startup(self) -> None:
+        """Open the pooled HTTP client ahead of the first request."""
+
+        _ = self.http_client
+
+    async def aclose(self) -> None:
+        """Close the pooled HTTP client and release its connections."""
+
+        if self._http_client is not None:
+            await self._http_client.aclose()
+            self._http_client = None
+
     async def generate_images(self, prompts: list[str]) -> list[dict[str, Any]]:
         """Generate PPT visuals for each prompt.
 
-        The method is intentionally defensive because upstream implementations
-        may differ. It returns the raw provider payload alongside a stabilized
-        ``url`` field if available.
+        Prompts are dispatched concurrently, bounded by the per-process
+        in-flight limit from settings. Results keep prompt order and
+        carry a ``status`` of ``succeeded`` or ``failed`` so one broken slide
+        does not abort the rest of the deck.
         """
 
+        client = self.http_client
+        return list(await asyncio.gather(*(self._generate_one(client, prompt) for prompt in prompts)))
+
+    async def iter_images(self, prompts: list[str]) -> AsyncIterator[tuple[int, dict[str, Any]]]:
+        """Yield ``(index, result)`` pairs as each slide finishes, fastest first."""
+
+        client = self.http_client
+
+        async def indexed(idx: int, prompt: str) -> tuple[int, dict[str, Any]]:
+            return idx, await self._generate_one(client, prompt)
+
+        tasks = [asyncio.ensure_future(indexed(idx, prompt)) for idx, prompt in enumerate(prompts)]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _generate_one(self, client: httpx.AsyncClient, prompt: str) -> dict[str, Any]:
+        """Generate a single slide visual, reporting failures instead of raising.
+
+        Identical requests already in flight (from another deck, the agent or
+        the HTTP endpoint) are joined rather than sent upstream again. The
+        method is intentionally defensive because upstream implementations
+        may differ. The image itself is persisted in the content-addressed
+        :class:`~app.image_store.ImageStore`; results only carry a compact
+        reference and a stabilized ``url``.
+        """
+
+        payload = {"prompt": prompt, "model": self.model, "size": self.size}
+        try:
+            return await self._flights.do(self._flight_key(payload), lambda: self._post(client, payload))
+        except Exception as exc:
+            # Whatever went wrong belongs to this slide only; the rest of the deck carries on.
+            return self._failed(prompt, str(exc) or exc.__class__.__name__, None)
+
+    def _flight_key(self, payload: dict[str, Any]) -> str:
+        """Key identical upstream requests on endpoint, credentials and normalized payload."""
+
+        canonical = json.dumps(
+            [self.endpoint, self.api_key, payload], ensure_ascii=False, sort_keys=True, separators=(",", ":")
+        )
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    async def _post(self, client: httpx.AsyncClient, payload: dict[str, Any]) -> dict[str, Any]:
+        """POST one slide with retries, optional hedging and the circuit breaker.
+
+        Transient failures (timeouts, connection errors, 408/425/429/5xx) are
+        retried with jittered backoff, honouring ``Retry-After``. While the
+        breaker is open slides fail fast instead of queueing on a degraded
+        upstream.
+        """
+
+        prompt = payload["prompt"]
         headers = {"Content-Type": "application/json"}
         if self.api_key:
             headers["Authorization"] = f"Bearer {self.api_key}"
 
-        results: list[dict[str, Any]] = []
-        async with httpx.AsyncClient(timeout=60) as client:
-            for prompt in prompts:
-                payload = {"prompt": prompt, "model": self.model, "size": "1280x720"}
-                response = await client.post(self.endpoint, json=payload, headers=headers)
-                response.raise_for_status()
-                data = response.json()
-                url = self._extract_image_url(data)
-                results.append({"prompt": prompt, "url": url, "raw": data})
-        return results
+        with tracer.span("image.post", model=self.model) as span:
+            attempt = 0
+            while True:
+                attempt += 1
+                if span is not None:
+                    span.set(attempts=attempt)
+                if not self.breaker.allow():
+                    IMAGE_SHED.inc()
+                    error = f"Image upstream circuit open, retry in {self.breaker.retry_in():.0f}s"
+                    return self._failed(prompt, error, span)
+                try:
+                    data = await hedge(
+                        lambda: self._send(client, payload, headers),
+                        self._hedge_delay(),
+                        on_hedge=lambda: IMAGE_HEDGES.inc(outcome="sent"),
+                        on_hedge_win=lambda: IMAGE_HEDGES.inc(outcome="won"),
+                    )
+                except (httpx.HTTPError, ValueError) as exc:
+                    retryable = is_retryable_error(exc)
+                    if retryable or isinstance(exc, ValueError):
+                        self.breaker.record_failure()
+                    else:
+                        # The upstream answered; a 4xx says nothing about its health.
+                        self.breaker.record_success()
+                    delay = self.retry_policy.delay(attempt, retry_after_of(exc)) if retryable else None
+                    if delay is None:
+                        return self._failed(prompt, str(exc) or exc.__class__.__name__, span)
+                    IMAGE_RETRIES.inc(reason=self._retry_reason(exc))
+                    await asyncio.sleep(delay)
+                    continue
+                except BaseException:
+                    # Cancellation or a local bug must not leave a half-open probe claimed forever.
+                    self.breaker.release()
+                    raise
+                self.breaker.record_success()
+                break
+
+        return await self._compact_result(client, prompt, data)
+
+    async def _compact_result(self, client: httpx.AsyncClient, prompt: str, data: dict[str, Any]) -> dict[str, Any]:
+        """Replace the provider payload by a reference to the stored image bytes."""
+
+        url = self._extract_image_url(data)
+        if url and url.startswith("data:"):
+            url = None
+        result: dict[str, Any] = {"prompt": prompt, "status": "succeeded", "url": url}
+        if not self.store.enabled:
+            return result
+        with tracer.span("image.store") as span:
+            try:
+                image = await self.store.ingest(data, client)
+            except (httpx.HTTPError, OSError, ValueError) as exc:
+                # The slide still has its upstream URL; only local persistence failed.
+                result["store_error"] = str(exc) or exc.__class__.__name__
+                if span is not None:
+                    span.status, span.error = "error", result["store_error"]
+                return result
+            if image is not None:
+                result.update(url=image["url"], source_url=url, image=image)
+                if span is not None:
+                    span.set(bytes=image["bytes"])
+        return result
+
+    async def _send(self, client: httpx.AsyncClient, payload: dict[str, Any], headers: dict[str, str]) -> dict[str, Any]:
+        queued = time.perf_counter()
+        with tracer.span("image.attempt") as span:
+            async with self._process_limit:
+                started = time.perf_counter()
+                if span is not None:
+                    span.set(queued_ms=round((started - queued) * 1000, 3))
+                try:
+                    with IMAGE_IN_FLIGHT.track():
+                        response = await client.post(self.endpoint, json=payload, headers=headers)
+                        response.raise_for_status()
+                        data = response.json()
+                        if not isinstance(data, dict):
+                            raise ValueError(f"Image upstream returned a JSON {type(data).__name__}, expected an object")
+                except BaseException:
+                    IMAGE_LATENCY.observe(time.perf_counter() - started, status="failed")
+                    raise
+                elapsed = time.perf_counter() - started
+                IMAGE_LATENCY.observe(elapsed, status="succeeded")
+                self.latencies.record(elapsed)
+                return data
+
+    def _hedge_delay(self) -> float | None:
+        if not self.hedge_enabled:
+            return None
+        return self.latencies.percentile(self.hedge_percentile)
+
+    @staticmethod
+    def _retry_reason(exc: Exception) -> str:
+        if isinstance(exc, httpx.HTTPStatusError):
+            return str(exc.response.status_code)
+        if isinstance(exc, httpx.TimeoutException):
+            return "timeout"
+        return "connection"
+
+    @staticmethod
+    def _failed(prompt: str, error: str, span: Any) -> dict[str, Any]:
+        if span is not None:
+            span.status, span.error = "error", error
+        return {"prompt": prompt, "status": "failed", "url": None, "error": error}
 
     @staticmethod
     def _extract_image_url(payload: dict[str, Any]) -> str | None:
@@ -50,7 +257,7 @@ class ImageGenerationClient:
 
         if "url" in payload:
             return str(payload["url"])
-        if isinstance(payload.get("data"), list) and payload["data"]:
+        if isinstance(payload.get("data"), list) and payload["data"] and isinstance(payload["data"][0], dict):
             first = payload["data"][0]
             for key in ("url", "image_url", "src"):
                 if key in first:
@@ -0,0 +1,200 @@
+"""Content-addressed on-disk store for generated slide images.
+
+Provider responses carry either a (short-lived) URL or base64 image data.
+Either way the bytes are fetched once, written to
+``$NANOBEE_WORKSPACES_ROOT/images/<digest[:2]>/<digest>`` and replaced by a
+compact reference, so API responses and the agent context never carry image
+payloads. ``GET /api/images/{digest}`` serves the files back. The directory
+is capped at ``image_store_max_disk_bytes``; least recently used images are
+removed first, and cached results pointing at a removed image are treated as
+misses by the skills layer. Disk work runs in worker threads.
+"""
+from __future__ import annotations
+
+import asyncio
+import base64
+import binascii
+import hashlib
+import os
+import re
+import tempfile
+import threading
+from pathlib import Path
+from typing import Any
+
+import httpx
+
+from .config import settings
+
+PUBLIC_PREFIX = "/api/images"
+DIGEST_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+_B64_KEYS = ("b64_json", "image_base64", "base64")
+_URL_KEYS = ("url", "image_url", "src")
+
+
+class ImageTooLargeError(ValueError):
+    """Raised when an upstream image exceeds ``image_store_max_bytes``."""
+
+
+def sniff_content_type(head: bytes) -> str:
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if head.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if head.startswith((b"GIF87a", b"GIF89a")):
+        return "image/gif"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    return "application/octet-stream"
+
+
+class ImageStore:
+    def __init__(
+        self, root: Path, *, max_bytes: int = 20 * 1024 * 1024, max_disk_bytes: int = 2 * 1024**3, enabled: bool = True
+    ) -> None:
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.enabled = enabled
+        self._disk_bytes: int | None = None
+        self._disk_lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls) -> "ImageStore":
+        return cls(
+            Path(settings.workspaces_root) / "images",
+            max_bytes=settings.image_store_max_bytes,
+            max_disk_bytes=settings.image_store_max_disk_bytes,
+            enabled=settings.image_store_enabled,
+        )
+
+    def path_for(self, digest: str) -> Path | None:
+        """Location of a stored image, or ``None`` for malformed or unknown digests.
+
+        Refreshes the file's mtime for LRU eviction.
+        """
+
+        if not DIGEST_PATTERN.match(digest):
+            return None
+        path = self.root / digest[:2] / digest
+        if not path.is_file():
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return path
+
+    def content_type(self, path: Path) -> str:
+        with path.open("rb") as handle:
+            return sniff_content_type(handle.read(16))
+
+    def reference(self, digest: str, size: int, content_type: str) -> dict[str, Any]:
+        return {"digest": digest, "content_type": content_type, "bytes": size, "url": f"{PUBLIC_PREFIX}/{digest}"}
+
+    async def ingest(self, payload: Any, client: httpx.AsyncClient) -> dict[str, Any] | None:
+        """Store the first image found in a provider payload and return its reference.
+
+        Returns ``None`` when the payload carries neither base64 data nor a URL.
+        """
+
+        encoded, url = self._locate(payload)
+        if encoded is None and url and url.startswith("data:"):
+            encoded = url.partition(",")[2]
+        if encoded is not None:
+            try:
+                data = base64.b64decode(encoded, validate=False)
+            except (binascii.Error, ValueError) as exc:
+                raise ValueError(f"Invalid base64 image data: {exc}") from exc
+            return await asyncio.to_thread(self.put_bytes, data)
+        if url:
+            return await self.download(url, client)
+        return None
+
+    def put_bytes(self, data: bytes) -> dict[str, Any]:
+        """Write ``data`` under its digest; blocking (hashing, disk I/O, eviction), so run it in a thread."""
+
+        if len(data) > self.max_bytes:
+            raise ImageTooLargeError(f"Image of {len(data)} bytes exceeds the {self.max_bytes} byte limit")
+        digest = hashlib.sha256(data).hexdigest()
+        target = self.root / digest[:2] / digest
+        if not target.exists():
+            target.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp_name = tempfile.mkstemp(dir=target.parent, prefix=".tmp-")
+            with os.fdopen(fd, "wb") as handle:
+                handle.write(data)
+            os.replace(tmp_name, target)
+            self._added(len(data))
+        else:
+            os.utime(target)
+        return self.reference(digest, len(data), sniff_content_type(data[:16]))
+
+    async def download(self, url: str, client: httpx.AsyncClient, max_bytes: int | None = None) -> dict[str, Any]:
+        """Fetch ``url`` (at most ``max_bytes``, by default the store's limit) and store it like :meth:`put_bytes`."""
+
+        limit = self.max_bytes if max_bytes is None else min(max_bytes, self.max_bytes)
+        buffer = bytearray()
+        async with client.stream("GET", url) as response:
+            response.raise_for_status()
+            async for chunk in response.aiter_bytes():
+                buffer += chunk
+                if len(buffer) > limit:
+                    raise ImageTooLargeError(f"Image at {url} exceeds the {limit} byte limit")
+        # Hashing, the write and any eviction (a directory listing) all run in the worker thread.
+        return await asyncio.to_thread(self.put_bytes, bytes(buffer))
+
+    def _added(self, size: int) -> None:
+        """Account for a newly stored file and evict once the directory outgrows its cap; blocking."""
+
+        with self._disk_lock:
+            if self._disk_bytes is None:
+                self._disk_bytes = sum(path.stat().st_size for path in self._files())
+            else:
+                self._disk_bytes += size
+            if self._disk_bytes > self.max_disk_bytes:
+                self._disk_bytes = self._evict()
+
+    def evict(self) -> None:
+        """Drop least recently used images until the directory fits its cap; blocking."""
+
+        with self._disk_lock:
+            self._disk_bytes = self._evict()
+
+    def _evict(self) -> int:
+        files = sorted(self._files(), key=lambda path: path.stat().st_mtime)
+        total = sum(path.stat().st_size for path in files)
+        for path in files:
+            if total <= self.max_disk_bytes:
+                break
+            size = path.stat().st_size
+            try:
+                path.unlink()
+            except OSError:
+                continue
+            total -= size
+        return total
+
+    def _files(self) -> list[Path]:
+        return [path for path in self.root.glob("??/*") if DIGEST_PATTERN.match(path.name)]
+
+    @staticmethod
+    def _locate(payload: Any) -> tuple[str | None, str | None]:
+        candidates = [payload]
+        if isinstance(payload, dict) and isinstance(payload.get("data"), list) and payload["data"]:
+            candidates.insert(0, payload["data"][0])
+        for candidate in candidates:
+            if not isinstance(candidate, dict):
+                continue
+            for key in _B64_KEYS:
+                if isinstance(candidate.get(key), str) and candidate[key]:
+                    return candidate[key], None
+        for candidate in candidates:
+            if not isinstance(candidate, dict):
+                continue
+            for key in _URL_KEYS:
+                if isinstance(candidate.get(key), str) and candidate[key]:
+                    return None, candidate[key]
+        return None, None
+
+
+__all__ = ["ImageStore", "ImageTooLargeError", "PUBLIC_PREFIX", "sniff_content_type"]
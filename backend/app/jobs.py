@@ -0,0 +1,316 @@
+"""Background job queue for long agent and image runs.
+
+Jobs are admitted into per-tenant queues with depth limits, drained by a
+bounded pool of asyncio workers in round-robin tenant order, and persisted
+as JSON under the workspaces root so queued work survives a restart.
+Finished jobs are kept, in memory and on disk, for ``result_ttl`` seconds
+and at most ``max_finished`` of them; older ones are dropped. Job files are
+read and written on one worker thread, so the event loop never blocks on
+them and writes land in the order they were issued.
+
+The tenant is whatever the caller puts in ``X-Tenant-ID``: it spreads the
+queue fairly between cooperating clients but is not an isolation or quota
+boundary, since a client can pick any value.
+"""
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import json
+import os
+import tempfile
+import time
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Awaitable, Callable
+
+from .config import settings
+from .tracing import tracer
+
+JobRunner = Callable[[dict], Awaitable[Any]]
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED = {SUCCEEDED, FAILED, CANCELLED}
+
+
+class QueueFullError(Exception):
+    """Raised when admitting a job would exceed a queue-depth limit."""
+
+
+@dataclass
+class Job:
+    kind: str
+    payload: dict
+    tenant: str = "default"
+    id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    status: str = QUEUED
+    created_at: float = field(default_factory=time.time)
+    started_at: float | None = None
+    finished_at: float | None = None
+    result: Any = None
+    error: str | None = None
+
+    def summary(self) -> dict[str, Any]:
+        data = asdict(self)
+        data.pop("result")
+        data.pop("payload")
+        return data
+
+
+class JobManager:
+    """Bounded worker pool with per-tenant fairness and early admission control."""
+
+    def __init__(
+        self,
+        root: Path,
+        runners: dict[str, JobRunner],
+        *,
+        workers: int = 2,
+        max_queue_depth: int = 100,
+        max_tenant_depth: int = 10,
+        result_ttl: float = 86400.0,
+        max_finished: int = 1000,
+    ) -> None:
+        self.root = Path(root)
+        self.runners = runners
+        self.workers = max(1, workers)
+        self.max_queue_depth = max_queue_depth
+        self.max_tenant_depth = max_tenant_depth
+        self.result_ttl = result_ttl
+        self.max_finished = max(0, max_finished)
+        self._jobs: dict[str, Job] = {}
+        # Finished job id -> finished_at, oldest first.
+        self._finished: OrderedDict[str, float] = OrderedDict()
+        self._queues: OrderedDict[str, deque[str]] = OrderedDict()
+        self._running: dict[str, asyncio.Task] = {}
+        self._worker_tasks: list[asyncio.Task] = []
+        self._wakeup: asyncio.Event | None = None
+        self._io = ThreadPoolExecutor(max_workers=1, thread_name_prefix="jobs-io")
+
+    @classmethod
+    def from_settings(cls, runners: dict[str, JobRunner]) -> "JobManager":
+        return cls(
+            Path(settings.workspaces_root) / "jobs",
+            runners,
+            workers=settings.job_workers,
+            max_queue_depth=settings.job_max_queue_depth,
+            max_tenant_depth=settings.job_max_queue_per_tenant,
+            result_ttl=settings.job_result_ttl_seconds,
+            max_finished=settings.job_max_finished,
+        )
+
+    async def start(self) -> None:
+        """Restore persisted unfinished jobs and start the worker pool."""
+
+        self._wakeup = asyncio.Event()
+        await self._restore()
+        self._wakeup.set()
+        self._worker_tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        """Stop workers; interrupted jobs stay on disk and are requeued on the next start."""
+
+        tasks = [*self._worker_tasks, *self._running.values()]
+        for task in tasks:
+            task.cancel()
+        for task in tasks:
+            with contextlib.suppress(asyncio.CancelledError, Exception):
+                await task
+        self._worker_tasks = []
+        self._running.clear()
+        self._wakeup = None
+
+    async def submit(self, kind: str, payload: dict, tenant: str = "default") -> Job:
+        if kind not in self.runners:
+            raise ValueError(f"Unknown job kind: {kind}")
+        if self.queue_depth() >= self.max_queue_depth:
+            raise QueueFullError("Job queue is full, retry later")
+        if len(self._queues.get(tenant, ())) >= self.max_tenant_depth:
+            raise QueueFullError(f"Too many queued jobs for tenant {tenant}")
+
+        job = Job(kind=kind, payload=payload, tenant=tenant)
+        self._jobs[job.id] = job
+        self._enqueue(job)
+        await self._persist(job)
+        return job
+
+    async def get(self, job_id: str) -> Job | None:
+        job = self._jobs.get(job_id)
+        if job is None:
+            job = await self._run_io(self._load, job_id)
+            if job is not None and job.status in FINISHED and self._expired(job.finished_at or 0):
+                await self._forget(job_id)
+                return None
+        return job
+
+    async def cancel(self, job_id: str) -> Job | None:
+        job = await self.get(job_id)
+        if job is None or job.status in FINISHED:
+            return job
+        if job.status == QUEUED:
+            queue = self._queues.get(job.tenant)
+            if queue is not None and job_id in queue:
+                queue.remove(job_id)
+        task = self._running.get(job_id)
+        if task is not None:
+            task.cancel()
+        await self._finish(job, CANCELLED)
+        return job
+
+    def queue_depth(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+    def running_count(self) -> int:
+        return len(self._running)
+
+    def _enqueue(self, job: Job) -> None:
+        self._queues.setdefault(job.tenant, deque()).append(job.id)
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def _next_job(self) -> Job | None:
+        """Pop the head of the next tenant queue, rotating tenants for fairness."""
+
+        while self._queues:
+            tenant, queue = next(iter(self._queues.items()))
+            self._queues.move_to_end(tenant)
+            if not queue:
+                del self._queues[tenant]
+                continue
+            job = self._jobs.get(queue.popleft())
+            if not queue:
+                del self._queues[tenant]
+            if job is not None and job.status == QUEUED:
+                return job
+        return None
+
+    async def _worker(self) -> None:
+        assert self._wakeup is not None
+        while True:
+            job = self._next_job()
+            if job is None:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            job.status = RUNNING
+            job.started_at = time.time()
+            await self._persist(job)
+            task = asyncio.create_task(tracer.run(job.id, f"job.{job.kind}", self.runners[job.kind](job.payload), tenant=job.tenant))
+            self._running[job.id] = task
+            try:
+                result = await task
+            except asyncio.CancelledError:
+                if job.status != CANCELLED:
+                    # The worker itself is shutting down; leave the job to be requeued.
+                    raise
+            except Exception as exc:
+                await self._finish(job, FAILED, error=str(exc) or exc.__class__.__name__)
+            else:
+                await self._finish(job, SUCCEEDED, result=result)
+            finally:
+                self._running.pop(job.id, None)
+
+    async def _finish(self, job: Job, status: str, *, result: Any = None, error: str | None = None) -> None:
+        job.status = status
+        job.result = result
+        job.error = error
+        job.finished_at = time.time()
+        self._finished[job.id] = job.finished_at
+        self._finished.move_to_end(job.id)
+        await self._persist(job)
+        await self._prune()
+
+    def _expired(self, finished_at: float) -> bool:
+        return finished_at < time.time() - self.result_ttl
+
+    async def _prune(self) -> None:
+        """Drop finished jobs past the TTL or beyond ``max_finished``, oldest first."""
+
+        expired: list[str] = []
+        while self._finished:
+            job_id, finished_at = next(iter(self._finished.items()))
+            if len(self._finished) <= self.max_finished and not self._expired(finished_at):
+                break
+            self._finished.pop(job_id)
+            expired.append(job_id)
+        for job_id in expired:
+            await self._forget(job_id)
+
+    async def _forget(self, job_id: str) -> None:
+        self._finished.pop(job_id, None)
+        self._jobs.pop(job_id, None)
+        await self._run_io(self._unlink, job_id)
+
+    def _path(self, job_id: str) -> Path:
+        return self.root / f"{job_id}.json"
+
+    async def _run_io(self, fn: Callable[..., Any], *args: Any) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(self._io, fn, *args)
+
+    async def _persist(self, job: Job) -> None:
+        # Snapshot on the loop so the file reflects the job as of this call.
+        data = json.dumps(asdict(job), ensure_ascii=False, default=repr)
+        await self._run_io(self._write, job.id, data)
+
+    def _write(self, job_id: str, data: str) -> None:
+        self.root.mkdir(parents=True, exist_ok=True)
+        fd, tmp_name = tempfile.mkstemp(dir=self.root, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as handle:
+                handle.write(data)
+            os.replace(tmp_name, self._path(job_id))
+        finally:
+            if os.path.exists(tmp_name):
+                os.unlink(tmp_name)
+
+    def _unlink(self, job_id: str) -> None:
+        with contextlib.suppress(OSError):
+            self._path(job_id).unlink()
+
+    def _load(self, job_id: str) -> Job | None:
+        if not job_id.isalnum():
+            return None
+        try:
+            return Job(**json.loads(self._path(job_id).read_text(encoding="utf-8")))
+        except (OSError, ValueError, TypeError):
+            return None
+
+    def _scan(self) -> list[Job]:
+        if not self.root.exists():
+            return []
+        jobs = (self._jobs.get(path.stem) or self._load(path.stem) for path in self.root.glob("*.json"))
+        return [job for job in jobs if job is not None]
+
+    async def _restore(self) -> None:
+        restored: list[Job] = []
+        finished: list[Job] = []
+        for job in await self._run_io(self._scan):
+            if job.status in FINISHED:
+                finished.append(job)
+                continue
+            if job.kind not in self.runners:
+                continue
+            if job.status == RUNNING:
+                job.status = QUEUED
+                job.started_at = None
+                await self._persist(job)
+            restored.append(job)
+        for job in sorted(finished, key=lambda item: item.finished_at or 0):
+            self._finished.setdefault(job.id, job.finished_at or 0)
+        await self._prune()
+        queued = {job_id for queue in self._queues.values() for job_id in queue}
+        for job in sorted(restored, key=lambda item: item.created_at):
+            self._jobs[job.id] = job
+            if job.id not in queued:
+                self._enqueue(job)
+
+
+__all__ = ["Job", "JobManager", "QueueFullError"]
@@ -1,17 +1,61 @@
 """FastAPI entrypoint exposing the Claude agent and PPT skills."""
 from __future__ import annotations
-from typing import Any
+import asyncio
+import json
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Literal
 
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel, Field
+from fastapi import Depends, FastAPI, Header, HTTPException, Request, Response
+from fastapi.responses import FileResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field, ValidationError
 
-from .agent import summarize_run
+from .admin import require_admin
+from .agent import agent_pool, stream_run, summarize_run
 from .config import settings
-from .skills import create_ppt_visuals_handler
+from . import skills
+from .deck_export import MEDIA_TYPES, DeckExportRequest, ExportUnavailableError, content_disposition, exporter, resolve_images
+from .jobs import JobManager, QueueFullError
+from .metrics import cache_ratio, registry
+from .skills import create_ppt_visuals_handler, image_client, stream_ppt_visuals_handler
+from .proxy import api as proxy_api
 from .proxy.api import router as proxy_router
+from .proxy.client import openai_client
+from .tracing import TracingMiddleware, render_waterfall, tracer
+from .workflow import (
+    ImagesRequest,
+    OutlineRequest,
+    PipelineRequest,
+    SearchRequest,
+    SlidesRequest,
+    TextModelError,
+    build_outline,
+    render_images,
+    run_pipeline,
+    search_references,
+    stream_deck_images,
+    stream_outline,
+    write_slides,
+)
 
-app = FastAPI(title="NanoBee Agent", version="1.0.0")
+
+@asynccontextmanager
+async def lifespan(_: FastAPI) -> AsyncIterator[None]:
+    settings.apply_environment()
+    await image_client.startup()
+    await job_manager.start()
+    await agent_pool.start()
+    try:
+        yield
+    finally:
+        await agent_pool.stop()
+        await job_manager.stop()
+        await image_client.aclose()
+        await asyncio.to_thread(tracer.close)
+
+
+app = FastAPI(title="NanoBee Agent", version="1.0.0", lifespan=lifespan)
 app.include_router(proxy_router, prefix="/proxy")
+app.add_middleware(TracingMiddleware)
 
 
 class PromptRequest(BaseModel):
@@ -24,17 +68,151 @@ class VisualRequest(BaseModel):
     slides: int = Field(default=0, description="需要生成的页数，0则使用默认值")
 
 
+class JobRequest(BaseModel):
+    kind: Literal["agent", "visuals"] = Field(..., description="任务类型")
+    payload: dict[str, Any] = Field(default_factory=dict, description="与同步接口一致的请求体")
+
+
+def _serialise_run(result: dict) -> dict[str, Any]:
+    # convert messages to repr to avoid non-serializable types
+    serialised = [repr(msg) for msg in result.pop("messages", [])]
+    return {"messages": serialised, **result}
+
+
+async def _run_agent_job(payload: dict) -> dict[str, Any]:
+    return _serialise_run(await summarize_run(PromptRequest(**payload).prompt))
+
+
+async def _run_visuals_job(payload: dict) -> dict[str, Any]:
+    request = VisualRequest(**payload)
+    slides = request.slides or settings.default_slide_count
+    return await create_ppt_visuals_handler({"topic": request.topic, "narrative": request.narrative or "", "slides": slides})
+
+
+JOB_PAYLOADS: dict[str, type[BaseModel]] = {"agent": PromptRequest, "visuals": VisualRequest}
+job_manager = JobManager.from_settings({"agent": _run_agent_job, "visuals": _run_visuals_job})
+
+
+def _cache_stats() -> dict[str, dict[str, int]]:
+    return {
+        "image": skills.image_cache.stats(),
+        "proxy_response": proxy_api.response_cache.stats(),
+        "deck_export": exporter.stats(),
+    }
+
+
+def _register_runtime_metrics() -> None:
+    """Expose queue depths, in-flight counts and cache counters read at scrape time."""
+
+    registry.callback(
+        "nanobee_queue_depth",
+        "Work waiting for a slot, per queue.",
+        lambda: {
+            ("jobs",): job_manager.queue_depth(),
+            ("proxy_scheduler",): proxy_api.request_scheduler.queue_depth(),
+            ("image_single_flight",): image_client._flights.in_flight(),
+        },
+        ("queue",),
+    )
+    registry.callback("nanobee_jobs_running", "Background jobs currently executing.", lambda: {(): job_manager.running_count()})
+    registry.callback(
+        "nanobee_agent_pool_sessions",
+        "Pooled Claude agent sessions by state.",
+        lambda: {(state,): agent_pool.stats()[state] for state in ("idle", "busy", "starting")},
+        ("state",),
+    )
+    registry.callback(
+        "nanobee_upstream_in_flight",
+        "Outstanding requests per OpenAI-compatible upstream.",
+        lambda: {(upstream.name,): upstream.outstanding for upstream in openai_client.upstreams.upstreams},
+        ("upstream",),
+    )
+    registry.callback(
+        "nanobee_proxy_rate_limit_rejections_total",
+        "Proxy requests rejected by the local RPM/TPM scheduler.",
+        lambda: {(): proxy_api.request_scheduler.rejected_total},
+        kind="counter",
+    )
+    registry.callback(
+        "nanobee_image_circuit_open",
+        "1 while the image upstream circuit breaker is failing fast, else 0.",
+        lambda: {(): 1 if image_client.breaker.state == "open" else 0},
+    )
+    registry.callback(
+        "nanobee_cache_hits_total",
+        "Cache hits per cache.",
+        lambda: {(name,): stats["hits"] for name, stats in _cache_stats().items()},
+        ("cache",),
+        kind="counter",
+    )
+    registry.callback(
+        "nanobee_cache_misses_total",
+        "Cache misses per cache.",
+        lambda: {(name,): stats["misses"] for name, stats in _cache_stats().items()},
+        ("cache",),
+        kind="counter",
+    )
+    registry.callback(
+        "nanobee_cache_hit_ratio",
+        "Hits divided by lookups since process start, per cache.",
+        lambda: {(name,): cache_ratio(stats["hits"], stats["misses"]) for name, stats in _cache_stats().items()},
+        ("cache",),
+    )
+
+
+_register_runtime_metrics()
+
+
 @app.get("/health")
 async def health() -> dict[str, str]:
     return {"status": "ok"}
 
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics() -> PlainTextResponse:
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/debug/traces")
+async def list_traces(limit: int = 50, _: None = Depends(require_admin)) -> dict[str, Any]:
+    return {"traces": tracer.recent(limit)}
+
+
+@app.get("/debug/traces/{request_id}")
+async def get_trace(request_id: str, format: Literal["json", "text"] = "json", _: None = Depends(require_admin)) -> Any:
+    """Waterfall of the spans recorded for one request id (or background job id)."""
+
+    # Misses fall back to reading the exported files, so keep them off the event loop.
+    trace = await asyncio.to_thread(tracer.waterfall, request_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail="Trace not found")
+    if format == "text":
+        return PlainTextResponse(render_waterfall(trace))
+    return trace
+
+
 @app.post("/agent/run")
 async def run_agent_endpoint(payload: PromptRequest) -> dict[str, Any]:
-    result = await summarize_run(payload.prompt)
-    # convert messages to repr to avoid non-serializable types
-    serialised = [repr(msg) for msg in result.pop("messages", [])]
-    return {"messages": serialised, **result}
+    return _serialise_run(await summarize_run(payload.prompt))
+
+
+@app.post("/agent/run/stream")
+async def stream_agent_endpoint(payload: PromptRequest) -> StreamingResponse:
+    """Server-sent events variant of ``/agent/run`` forwarding each agent message."""
+
+    async def events() -> AsyncIterator[str]:
+        try:
+            async for event in stream_run(payload.prompt):
+                yield f"event: {event['type']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+        except Exception as exc:  # pragma: no cover - defensive for HTTP layer
+            yield f"event: error\ndata: {json.dumps({'type': 'error', 'error': str(exc)}, ensure_ascii=False)}\n\n"
+        yield "event: done\ndata: {\"type\": \"done\"}\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @app.post("/skills/visuals")
@@ -47,3 +225,181 @@ async def run_visual_skill(payload: VisualRequest) -> dict[str, Any]:
     except Exception as exc:  # pragma: no cover - defensive for HTTP layer
         raise HTTPException(status_code=500, detail=str(exc)) from exc
     return result
+
+
+@app.post("/skills/visuals/stream")
+async def stream_visual_skill(payload: VisualRequest) -> StreamingResponse:
+    """NDJSON variant of ``/skills/visuals`` emitting each slide as it completes."""
+
+    slides = payload.slides or settings.default_slide_count
+    args = {"topic": payload.topic, "narrative": payload.narrative or "", "slides": slides}
+
+    async def events() -> AsyncIterator[str]:
+        try:
+            async for event in stream_ppt_visuals_handler(args):
+                yield json.dumps(event, ensure_ascii=False) + "\n"
+        except Exception as exc:  # pragma: no cover - defensive for HTTP layer
+            yield json.dumps({"type": "error", "error": str(exc)}, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.api_route("/api/images/{digest}", methods=["GET", "HEAD"])
+@app.api_route("/images/{digest}", methods=["GET", "HEAD"], include_in_schema=False)
+async def get_image(digest: str, request: Request) -> Response:
+    """Serve a stored slide image; content addressed, so cacheable forever.
+
+    ``/images/{digest}`` keeps answering references stored before images
+    moved under ``/api``.
+    """
+
+    store = image_client.store
+    path = await asyncio.to_thread(store.path_for, digest)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Image not found")
+    etag = f'"{digest}"'
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=31536000, immutable"}
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in (tag.strip().removeprefix("W/") for tag in if_none_match.split(",")) or if_none_match.strip() == "*":
+        return Response(status_code=304, headers=headers)
+    # FileResponse streams the file in chunks and answers Range/If-Range itself.
+    return FileResponse(path, media_type=await asyncio.to_thread(store.content_type, path), headers=headers)
+
+
+@app.post("/api/export/deck")
+async def export_deck(payload: DeckExportRequest) -> Response:
+    """Render the deck as PDF (streamed page by page) or PPTX, cached by deck hash."""
+
+    digest = payload.digest()
+    headers = {"ETag": f'"{digest}"', "Content-Disposition": content_disposition(payload.title, payload.format)}
+    media_type = MEDIA_TYPES[payload.format]
+    cached = exporter.cached(digest, payload.format)
+    if cached is not None:
+        return FileResponse(cached, media_type=media_type, headers={**headers, "X-Export-Cache": "hit"})
+
+    with tracer.span("export.resolve_images", slides=len(payload.slides)):
+        images = await resolve_images(payload.slides, image_client.store, image_client.http_client)
+    headers["X-Export-Cache"] = "miss"
+    if payload.format == "pdf":
+        # A sync iterator: Starlette drains it in a worker thread, so file reads never block the loop.
+        return StreamingResponse(exporter.stream_pdf(payload, images, digest), media_type=media_type, headers=headers)
+    try:
+        path = await asyncio.to_thread(exporter.build_pptx, payload, images, digest)
+    except ExportUnavailableError as exc:
+        raise HTTPException(status_code=501, detail=str(exc)) from exc
+    return FileResponse(path, media_type=media_type, headers=headers)
+
+
+def _sse_response(events: AsyncIterator[dict[str, Any]]) -> StreamingResponse:
+    async def frames() -> AsyncIterator[str]:
+        try:
+            async for event in events:
+                yield f"event: {event['type']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+        except Exception as exc:  # pragma: no cover - defensive for HTTP layer
+            yield f"event: error\ndata: {json.dumps({'type': 'error', 'error': str(exc)}, ensure_ascii=False)}\n\n"
+
+    return StreamingResponse(
+        frames(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.post("/api/ppt/search")
+async def ppt_search(payload: SearchRequest) -> dict[str, Any]:
+    references = search_references(payload.topic, payload.limit)
+    return {"topic": payload.topic, "references": [ref.model_dump() for ref in references]}
+
+
+@app.post("/api/ppt/outline")
+async def ppt_outline(payload: OutlineRequest) -> dict[str, Any]:
+    try:
+        outline = await build_outline(payload.topic, payload.references, payload.use_templates)
+    except TextModelError as exc:
+        raise HTTPException(status_code=502, detail=str(exc)) from exc
+    return {"topic": payload.topic, "outline": [section.model_dump() for section in outline]}
+
+
+@app.post("/api/ppt/outline-stream")
+async def ppt_outline_stream(payload: OutlineRequest) -> StreamingResponse:
+    """SSE variant of ``/api/ppt/outline`` emitting each concurrent round as it lands."""
+
+    return _sse_response(stream_outline(payload.topic, payload.references, payload.use_templates))
+
+
+@app.post("/api/ppt/slides")
+async def ppt_slides(payload: SlidesRequest) -> dict[str, Any]:
+    try:
+        slides = await write_slides(
+            payload.topic, payload.outline, payload.references, payload.style_prompt, payload.use_templates
+        )
+    except TextModelError as exc:
+        raise HTTPException(status_code=502, detail=str(exc)) from exc
+    return {"topic": payload.topic, "slides": [slide.model_dump() for slide in slides]}
+
+
+@app.post("/api/ppt/images")
+async def ppt_images(payload: ImagesRequest) -> dict[str, Any]:
+    images = await render_images(payload.topic, payload.slides)
+    return {"images": [image.model_dump() for image in images]}
+
+
+@app.post("/api/ppt/images/stream")
+async def ppt_images_stream(payload: ImagesRequest) -> StreamingResponse:
+    """Whole-deck variant of ``/api/ppt/images``: every slide in the first slide's style, streamed as each lands."""
+
+    return _sse_response(stream_deck_images(payload.topic, payload.slides))
+
+
+@app.post("/api/ppt/pipeline")
+async def ppt_pipeline(payload: PipelineRequest) -> StreamingResponse:
+    """Whole workflow as one SSE stream; each slide's image starts once its content is written."""
+
+    return _sse_response(run_pipeline(payload))
+
+
+@app.post("/jobs", status_code=202)
+async def submit_job(payload: JobRequest, x_tenant_id: str | None = Header(None)) -> dict[str, Any]:
+    """Queue a job; ``X-Tenant-ID`` is client-supplied and only used for fair queueing."""
+
+    try:
+        JOB_PAYLOADS[payload.kind].model_validate(payload.payload)
+    except ValidationError as exc:
+        raise HTTPException(status_code=422, detail=exc.errors(include_url=False)) from exc
+    try:
+        job = await job_manager.submit(payload.kind, payload.payload, tenant=x_tenant_id or "default")
+    except QueueFullError as exc:
+        raise HTTPException(status_code=429, detail=str(exc), headers={"Retry-After": "5"}) from exc
+    return job.summary()
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str) -> dict[str, Any]:
+    job = await job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.summary()
+
+
+@app.get("/jobs/{job_id}/result")
+async def get_job_result(job_id: str) -> Any:
+    job = await job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job.status == "failed":
+        raise HTTPException(status_code=500, detail=job.error)
+    if job.status != "succeeded":
+        raise HTTPException(status_code=409, detail=f"Job is {job.status}")
+    return job.result
+
+
+@app.post("/jobs/{job_id}/cancel")
+async def cancel_job(job_id: str) -> dict[str, Any]:
+    job = await job_manager.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.summary()
@@ -0,0 +1,277 @@
+"""In-process metrics rendered in the Prometheus text exposition format.
+
+A deliberately small registry (counters, gauges, histograms and scrape-time
+callbacks) so ``/metrics`` works without any external service or client
+library. Metric objects for the proxy, agent and image paths live here so
+the whole catalogue can be read in one place.
+"""
+from __future__ import annotations
+
+import math
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator
+
+LabelValues = tuple[str, ...]
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+COST_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: tuple[str, ...], values: LabelValues, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def _key(self, labels: dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+    def samples(self) -> list[str]:
+        raise NotImplementedError
+
+    def render(self) -> list[str]:
+        return self.header() + self.samples()
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()) -> None:
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> list[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in self._values.items()]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels: str) -> None:
+        self._values[self._key(labels)] = value
+
+    def dec(self, amount: float = 1.0, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    @contextmanager
+    def track(self, **labels: str) -> Iterator[None]:
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self, name: str, documentation: str, labelnames: tuple[str, ...] = (), buckets: tuple[float, ...] = LATENCY_BUCKETS
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._series: dict[LabelValues, list[float]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        series = self._series.get(key)
+        if series is None:
+            # bucket counts followed by sum and count
+            series = self._series[key] = [0.0] * (len(self.buckets) + 2)
+        for idx, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[idx] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def count(self, **labels: str) -> float:
+        series = self._series.get(self._key(labels))
+        return series[-1] if series else 0.0
+
+    def samples(self) -> list[str]:
+        lines: list[str] = []
+        for key, series in self._series.items():
+            for bound, count in zip(self.buckets, series):
+                le = 'le="' + _format_value(bound) + '"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {_format_value(count)}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(series[-2])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {_format_value(series[-1])}")
+        return lines
+
+
+class CallbackMetric(_Metric):
+    """Metric whose samples are read from a callback at scrape time."""
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        callback: Callable[[], dict[LabelValues, float]],
+        labelnames: tuple[str, ...] = (),
+        kind: str = "gauge",
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+        self.kind = kind
+
+    def samples(self) -> list[str]:
+        try:
+            values = self.callback()
+        except Exception:  # pragma: no cover - a broken callback must not break the scrape
+            return []
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in values.items()]
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))  # type: ignore[return-value]
+
+    def gauge(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))  # type: ignore[return-value]
+
+    def histogram(
+        self, name: str, documentation: str, labelnames: tuple[str, ...] = (), buckets: tuple[float, ...] = LATENCY_BUCKETS
+    ) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))  # type: ignore[return-value]
+
+    def callback(
+        self,
+        name: str,
+        documentation: str,
+        callback: Callable[[], dict[LabelValues, float]],
+        labelnames: tuple[str, ...] = (),
+        kind: str = "gauge",
+    ) -> CallbackMetric:
+        return self.register(CallbackMetric(name, documentation, callback, labelnames, kind))  # type: ignore[return-value]
+
+    def render(self) -> str:
+        lines: list[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+UPSTREAM_LATENCY = registry.histogram(
+    "nanobee_upstream_request_seconds",
+    "Latency of OpenAI-compatible upstream calls (full response or full stream).",
+    ("upstream", "stream"),
+)
+UPSTREAM_TTFT = registry.histogram(
+    "nanobee_upstream_time_to_first_token_seconds",
+    "Time from dispatching a streaming upstream call to its first chunk.",
+    ("upstream",),
+)
+UPSTREAM_ERRORS = registry.counter(
+    "nanobee_upstream_errors_total",
+    "Upstream failures by error class from OpenAIClient.classify_openai_error.",
+    ("kind",),
+)
+CANCELLED_STREAMS = registry.counter(
+    "nanobee_proxy_cancelled_requests_total",
+    "Proxy upstream calls cancelled before completion (client disconnect or admin).",
+    ("reason", "stream"),
+)
+UNUSED_TOKEN_BUDGET = registry.counter(
+    "nanobee_proxy_unused_token_budget_total",
+    "Completion token budget (max_tokens minus tokens already streamed) left unused by cancelled upstream calls; "
+    "an upper bound on the tokens cancellation saved, not a measurement.",
+)
+IMAGE_LATENCY = registry.histogram(
+    "nanobee_image_generation_seconds", "Latency of one slide image request to the image upstream.", ("status",)
+)
+IMAGE_RETRIES = registry.counter(
+    "nanobee_image_retries_total", "Image upstream retries by the error that caused them.", ("reason",)
+)
+IMAGE_HEDGES = registry.counter(
+    "nanobee_image_hedges_total", "Hedged duplicate image requests sent, and how many won the race.", ("outcome",)
+)
+IMAGE_SHED = registry.counter(
+    "nanobee_image_shed_total", "Slide images failed fast because the image circuit breaker was open."
+)
+IMAGE_IN_FLIGHT = registry.gauge("nanobee_image_requests_in_flight", "Image upstream requests in progress.")
+AGENT_RUN_SECONDS = registry.histogram("nanobee_agent_run_seconds", "Duration of a Claude agent run.", ("status",))
+AGENT_RUN_COST = registry.histogram(
+    "nanobee_agent_run_cost_usd", "Reported cost of a Claude agent run in USD.", buckets=COST_BUCKETS
+)
+AGENT_IN_FLIGHT = registry.gauge("nanobee_agent_runs_in_flight", "Claude agent runs in progress.")
+AGENT_POOL_CHECKOUTS = registry.counter(
+    "nanobee_agent_pool_checkouts_total", "Agent runs served by a pre-started (warm) or a freshly spawned (cold) session.", ("kind",)
+)
+
+
+def cache_ratio(hits: float, misses: float) -> float:
+    total = hits + misses
+    return hits / total if total else 0.0
+
+
+__all__ = [
+    "AGENT_IN_FLIGHT",
+    "AGENT_POOL_CHECKOUTS",
+    "AGENT_RUN_COST",
+    "AGENT_RUN_SECONDS",
+    "CANCELLED_STREAMS",
+    "IMAGE_HEDGES",
+    "IMAGE_IN_FLIGHT",
+    "IMAGE_LATENCY",
+    "IMAGE_RETRIES",
+    "IMAGE_SHED",
+    "UNUSED_TOKEN_BUDGET",
+    "UPSTREAM_ERRORS",
+    "UPSTREAM_LATENCY",
+    "UPSTREAM_TTFT",
+    "Counter",
+    "Gauge",
+    "Histogram",
+    "Registry",
+    "cache_ratio",
+    "registry",
+]
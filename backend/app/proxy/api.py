@@ -1,23 +1,34 @@
 """FastAPI router implementing the Claude Code proxy endpoints."""
 from __future__ import annotations
 
+import asyncio
 import logging
 import uuid
+from dataclasses import dataclass
 from datetime import datetime
-from typing import Optional
+from typing import Any, AsyncIterator, Optional
 
+import anyio
 from fastapi import APIRouter, Depends, Header, HTTPException, Request
 from fastapi.responses import JSONResponse, StreamingResponse
 
+from ..admin import require_admin
 from .client import openai_client
 from .config import proxy_config
 from .conversion.request_converter import convert_claude_to_openai
 from .conversion.response_converter import convert_openai_streaming_to_claude, convert_openai_to_claude_response
 from .model_manager import model_manager
 from .models.claude import ClaudeMessagesRequest, ClaudeTokenCountRequest
+from .response_cache import ResponseCache
+from .scheduler import Admission, RequestScheduler, estimate_request_tokens, request_priority
+from .tokenizer import count_request_tokens
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
+request_scheduler = RequestScheduler.from_config(proxy_config)
+response_cache = ResponseCache.from_config(proxy_config)
+CACHE_HEADER = "X-Proxy-Cache"
+PROXY_REQUEST_ID_HEADER = "X-Proxy-Request-ID"
 
 
 def validate_api_key(x_api_key: Optional[str] = Header(None), authorization: Optional[str] = Header(None)):
@@ -33,60 +44,161 @@ def validate_api_key(x_api_key: Optional[str] = Header(None), authorization: Opt
         raise HTTPException(status_code=401, detail="Invalid API key. Please provide a valid Anthropic API key.")
 
 
-@router.post("/v1/messages")
-async def create_message(request: ClaudeMessagesRequest, http_request: Request, _: None = Depends(validate_api_key)):
-    if not proxy_config.openai_api_key:
+@dataclass
+class PreparedRequest:
+    """A Claude request converted for the upstream, with its scheduler admission unless cached.
+
+    The client charges the admission against the upstream it picks and
+    settles it from the reported usage.
+    """
+
+    request: ClaudeMessagesRequest
+    openai_request: dict[str, Any]
+    cache_key: Optional[str]
+    cached_response: Optional[dict[str, Any]]
+    admission: Optional[Admission] = None
+
+
+async def prepare_request(request: ClaudeMessagesRequest, priority: Optional[str] = None) -> PreparedRequest:
+    """Convert, look up the response cache and size the scheduler admission.
+
+    Shared by the HTTP route and the in-process path in :mod:`.local`.
+    """
+
+    if not proxy_config.has_openai_credentials():
         raise HTTPException(status_code=500, detail="OPENAI_API_KEY is required for proxy usage")
 
-    request_id = str(uuid.uuid4())
     openai_request = convert_claude_to_openai(request, model_manager)
+    cache_key = response_cache.make_key(openai_request) if response_cache.is_cacheable(openai_request) else None
+    if cache_key:
+        cached_response = response_cache.get(cache_key)
+        if cached_response is not None:
+            return PreparedRequest(request, openai_request, cache_key, cached_response)
+
+    prompt_tokens, max_tokens = estimate_request_tokens(
+        request, openai_request, model_manager.tokenizer_for_openai(openai_request["model"])
+    )
+    admission = Admission(
+        request_scheduler, openai_request["model"], prompt_tokens, max_tokens, request_priority(bool(request.stream), priority)
+    )
+    return PreparedRequest(request, openai_request, cache_key, None, admission)
+
+
+def finish_request(prepared: PreparedRequest, openai_response: dict[str, Any]) -> dict[str, Any]:
+    """Fill the cache and convert a non-streaming response."""
+
+    if prepared.cached_response is None and prepared.cache_key:
+        response_cache.set(prepared.cache_key, openai_response)
+    return convert_openai_to_claude_response(openai_response, prepared.request)
+
+
+@router.post("/v1/messages")
+async def create_message(
+    request: ClaudeMessagesRequest,
+    http_request: Request,
+    x_request_priority: Optional[str] = Header(None),
+    _: None = Depends(validate_api_key),
+):
+    request_id = str(uuid.uuid4())
+    prepared = await prepare_request(request, x_request_priority)
+    if prepared.cached_response is not None:
+        return JSONResponse(content=finish_request(prepared, prepared.cached_response), headers={CACHE_HEADER: "HIT"})
     if await http_request.is_disconnected():
         raise HTTPException(status_code=499, detail="Client disconnected")
 
     if request.stream:
+        # Wait for scheduler budget here so a local 429 is still an HTTP status, not an SSE error event.
+        await openai_client.admit(prepared.admission)
         try:
-            openai_stream = openai_client.create_chat_completion_stream(openai_request, request_id)
+            openai_stream = openai_client.create_chat_completion_stream(
+                prepared.openai_request, request_id, admission=prepared.admission
+            )
             return StreamingResponse(
-                convert_openai_streaming_to_claude(openai_stream, request, logger=logger),
+                _stream_until_disconnect(
+                    convert_openai_streaming_to_claude(openai_stream, request, logger=logger),
+                    openai_stream,
+                    http_request,
+                    request_id,
+                ),
                 media_type="text/event-stream",
                 headers={
                     "Cache-Control": "no-cache",
                     "Connection": "keep-alive",
                     "Access-Control-Allow-Origin": "*",
                     "Access-Control-Allow-Headers": "*",
+                    PROXY_REQUEST_ID_HEADER: request_id,
                 },
             )
         except HTTPException as exc:
             error_message = openai_client.classify_openai_error(exc.detail)
             error_response = {"type": "error", "error": {"type": "api_error", "message": error_message}}
             return JSONResponse(status_code=exc.status_code, content=error_response)
-    openai_response = await openai_client.create_chat_completion(openai_request, request_id)
-    return convert_openai_to_claude_response(openai_response, request)
+    watcher = asyncio.create_task(_watch_disconnect(http_request, request_id))
+    try:
+        openai_response = await openai_client.create_chat_completion(
+            prepared.openai_request, request_id, admission=prepared.admission
+        )
+    finally:
+        watcher.cancel()
+    return JSONResponse(
+        content=finish_request(prepared, openai_response),
+        headers={CACHE_HEADER: "MISS" if prepared.cache_key else "BYPASS", PROXY_REQUEST_ID_HEADER: request_id},
+    )
+
+
+async def _watch_disconnect(http_request: Request, request_id: str) -> None:
+    """Poll for a client disconnect and cancel the upstream call when it happens."""
+
+    interval = max(0.05, proxy_config.disconnect_poll_interval)
+    while True:
+        await asyncio.sleep(interval)
+        if await http_request.is_disconnected():
+            openai_client.cancel_request(request_id, reason="client_disconnect")
+            return
+
+
+async def _stream_until_disconnect(
+    frames: AsyncIterator[str], openai_stream: AsyncIterator, http_request: Request, request_id: str
+) -> AsyncIterator[str]:
+    """Forward SSE frames, tearing the upstream stream down as soon as the client is gone.
+
+    Depending on the ASGI server a disconnect shows up as a cancelled send, a
+    failed send, or nothing at all until the next chunk arrives, so a watcher
+    polls for it and an unfinished stream is always cancelled on exit.
+    """
+
+    watcher = asyncio.create_task(_watch_disconnect(http_request, request_id))
+    completed = False
+    try:
+        async for frame in frames:
+            yield frame
+        completed = True
+    finally:
+        watcher.cancel()
+        if not completed:
+            openai_client.cancel_request(request_id, reason="client_disconnect")
+        with anyio.CancelScope(shield=True):
+            await frames.aclose()
+            await openai_stream.aclose()
 
 
 @router.post("/v1/messages/count_tokens")
 async def count_tokens(request: ClaudeTokenCountRequest, _: None = Depends(validate_api_key)):
-    total_chars = 0
-    if request.system:
-        if isinstance(request.system, str):
-            total_chars += len(request.system)
-        elif isinstance(request.system, list):
-            for block in request.system:
-                if hasattr(block, "text") and block.text is not None:
-                    total_chars += len(block.text)
-
-    for msg in request.messages:
-        if msg.content is None:
-            continue
-        if isinstance(msg.content, str):
-            total_chars += len(msg.content)
-        elif isinstance(msg.content, list):
-            for block in msg.content:
-                if hasattr(block, "text") and block.text is not None:
-                    total_chars += len(block.text)
-
-    estimated_tokens = max(1, total_chars // 4)
-    return {"input_tokens": estimated_tokens}
+    return {"input_tokens": count_request_tokens(request, model_manager.tokenizer_for(request.model))}
+
+
+@router.get("/admin/requests")
+async def list_active_requests(_: None = Depends(require_admin)):
+    return {"requests": openai_client.list_requests()}
+
+
+@router.post("/admin/requests/{request_id}/cancel")
+async def cancel_active_request(request_id: str, _: None = Depends(require_admin)):
+    """Cancel an in-flight upstream call by proxy request id or by server-minted trace id."""
+
+    if not openai_client.cancel_request(request_id, reason="admin"):
+        raise HTTPException(status_code=404, detail="No in-flight request with this id")
+    return {"cancelled": True, "request_id": request_id}
 
 
 @router.get("/health")
@@ -94,15 +206,16 @@ async def health_check():
     return {
         "status": "healthy",
         "timestamp": datetime.now().isoformat(),
-        "openai_api_configured": bool(proxy_config.openai_api_key),
-        "api_key_valid": bool(proxy_config.openai_api_key),
+        "openai_api_configured": proxy_config.has_openai_credentials(),
+        "api_key_valid": proxy_config.has_openai_credentials(),
         "client_api_key_validation": bool(proxy_config.anthropic_api_key),
+        "upstreams": openai_client.upstreams.describe(),
     }
 
 
 @router.get("/test-connection")
 async def test_connection():
-    if not proxy_config.openai_api_key:
+    if not proxy_config.has_openai_credentials():
         raise HTTPException(status_code=500, detail="OPENAI_API_KEY is required for proxy usage")
 
     try:
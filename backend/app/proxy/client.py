@@ -3,125 +3,309 @@ from __future__ import annotations
 
 import asyncio
 import contextlib
-import json
-from typing import Any, AsyncGenerator, Dict, Optional
+import time
+from typing import TYPE_CHECKING, Any, AsyncGenerator, Dict, Iterable, Optional
 
+import anyio
 from fastapi import HTTPException
-from openai import AsyncAzureOpenAI, AsyncOpenAI
-from openai._exceptions import APIError, AuthenticationError, BadRequestError, RateLimitError
 
+from ..metrics import CANCELLED_STREAMS, UNUSED_TOKEN_BUDGET, UPSTREAM_ERRORS, UPSTREAM_LATENCY, UPSTREAM_TTFT
+from ..tracing import current_request_id, tracer
 from .config import proxy_config
+from .model_manager import model_manager
+from .tokenizer import get_tokenizer
+from .upstreams import Upstream, UpstreamPool
+
+if TYPE_CHECKING:
+    from openai.types.chat import ChatCompletionChunk
+
+    from .scheduler import Admission
+
+ERROR_MESSAGES = {
+    "region": "OpenAI API is not available in your region. Consider using a VPN or Azure OpenAI service.",
+    "auth": "Invalid API key. Please check your OPENAI_API_KEY configuration.",
+    "rate_limit": "Rate limit exceeded. Please wait and try again, or upgrade your API plan.",
+    "model_not_found": "Model not found. Please check your BIG_MODEL and SMALL_MODEL configuration.",
+    "billing": "Billing issue. Please check your OpenAI account billing status.",
+}
 
 
 class OpenAIClient:
     def __init__(self) -> None:
-        headers = {"Content-Type": "application/json", **proxy_config.get_custom_headers()}
-        if proxy_config.azure_api_version:
-            self.client = AsyncAzureOpenAI(
-                api_key=proxy_config.openai_api_key,
-                azure_endpoint=proxy_config.openai_base_url,
-                api_version=proxy_config.azure_api_version,
-                timeout=proxy_config.request_timeout,
-                default_headers=headers,
-            )
-        else:
-            self.client = AsyncOpenAI(
-                api_key=proxy_config.openai_api_key,
-                base_url=proxy_config.openai_base_url,
-                timeout=proxy_config.request_timeout,
-                default_headers=headers,
-            )
+        self._upstreams: Optional[UpstreamPool] = None
         self.active_requests: Dict[str, asyncio.Event] = {}
+        self.request_info: Dict[str, Dict[str, Any]] = {}
+
+    @property
+    def upstreams(self) -> UpstreamPool:
+        """Upstream pool, built (and the OpenAI SDK imported) on first use."""
 
-    async def create_chat_completion(self, request: Dict[str, Any], request_id: Optional[str] = None) -> Dict[str, Any]:
-        cancel_event = None
-        if request_id:
-            cancel_event = asyncio.Event()
-            self.active_requests[request_id] = cancel_event
+        if self._upstreams is None:
+            self._upstreams = UpstreamPool.from_config(proxy_config)
+        return self._upstreams
 
+    @upstreams.setter
+    def upstreams(self, pool: UpstreamPool) -> None:
+        self._upstreams = pool
+
+    def _register(self, request_id: Optional[str], request: Dict[str, Any], stream: bool) -> Optional[asyncio.Event]:
+        if not request_id:
+            return None
+        cancel_event = asyncio.Event()
+        self.active_requests[request_id] = cancel_event
+        self.request_info[request_id] = {
+            "request_id": request_id,
+            "trace_id": current_request_id(),
+            "model": request.get("model"),
+            "stream": stream,
+            "max_tokens": request.get("max_tokens") or request.get("max_completion_tokens"),
+            "started_at": time.time(),
+            "streamed_chunks": 0,
+            "streamed_tokens": 0,
+            "cancel_reason": None,
+        }
+        return cancel_event
+
+    def _unregister(self, request_id: Optional[str]) -> None:
+        if not request_id:
+            return
+        self.active_requests.pop(request_id, None)
+        info = self.request_info.pop(request_id, None)
+        if info and info["cancel_reason"]:
+            CANCELLED_STREAMS.inc(reason=info["cancel_reason"], stream=str(info["stream"]).lower())
+            if info["max_tokens"]:
+                # What the upstream was still allowed to generate; a non-streamed call has streamed nothing.
+                UNUSED_TOKEN_BUDGET.inc(max(0, int(info["max_tokens"]) - info["streamed_tokens"]))
+
+    async def create_chat_completion(
+        self, request: Dict[str, Any], request_id: Optional[str] = None, admission: Optional[Admission] = None
+    ) -> Dict[str, Any]:
+        cancel_event = self._register(request_id, request, stream=False)
+
+        attempts = max(1, min(proxy_config.upstream_retry_attempts, len(self.upstreams)))
+        tried: list[Upstream] = []
         try:
-            completion_task = asyncio.create_task(self.client.chat.completions.create(**request))
-            if cancel_event:
-                cancel_task = asyncio.create_task(cancel_event.wait())
-                done, pending = await asyncio.wait([completion_task, cancel_task], return_when=asyncio.FIRST_COMPLETED)
-                for task in pending:
-                    task.cancel()
-                    with contextlib.suppress(asyncio.CancelledError):
-                        await task
-                if cancel_task in done:
-                    completion_task.cancel()
-                    raise HTTPException(status_code=499, detail="Request cancelled by client")
-                completion = await completion_task
-            else:
-                completion = await completion_task
-            return completion.model_dump()
-        except AuthenticationError as exc:
-            raise HTTPException(status_code=401, detail=self.classify_openai_error(str(exc)))
-        except RateLimitError as exc:
-            raise HTTPException(status_code=429, detail=self.classify_openai_error(str(exc)))
-        except BadRequestError as exc:
-            raise HTTPException(status_code=400, detail=self.classify_openai_error(str(exc)))
-        except APIError as exc:
-            status_code = getattr(exc, "status_code", 500)
-            raise HTTPException(status_code=status_code, detail=self.classify_openai_error(str(exc)))
-        except Exception as exc:  # pragma: no cover - defensive
-            raise HTTPException(status_code=500, detail=f"Unexpected error: {exc}") from exc
+            while True:
+                upstream = await self._checkout(admission, tried)
+                started = time.perf_counter()
+                try:
+                    with tracer.span("openai.chat", upstream=upstream.name, model=request.get("model"), attempt=len(tried) + 1):
+                        completion = await self._complete(upstream, request, cancel_event)
+                except Exception as exc:
+                    if admission is not None:
+                        # Failed attempts are charged their prompt only; the next upstream is charged afresh.
+                        admission.settle(admission.prompt_tokens)
+                    self._record_error(exc)
+                    if not self._is_retryable(exc):
+                        raise
+                    self.upstreams.mark_failure(upstream)
+                    tried.append(upstream)
+                    if len(tried) >= attempts:
+                        raise
+                    continue
+                finally:
+                    self.upstreams.release(upstream)
+                    UPSTREAM_LATENCY.observe(time.perf_counter() - started, upstream=upstream.name, stream="false")
+                self.upstreams.mark_success(upstream)
+                if admission is not None and completion.usage is not None:
+                    admission.settle(completion.usage.total_tokens)
+                return completion.model_dump()
+        except HTTPException:
+            raise
+        except Exception as exc:
+            raise self._to_http_exception(exc) from exc
         finally:
-            if request_id:
-                self.active_requests.pop(request_id, None)
+            self._unregister(request_id)
+
+    async def admit(self, admission: Admission, exclude: Iterable[Upstream] = ()) -> None:
+        """Wait for budget on the upstream the pool would pick next; limits belong to that upstream's key."""
+
+        await admission.acquire(self.upstreams.pick(exclude).name)
+
+    async def _checkout(self, admission: Optional[Admission], exclude: Iterable[Upstream] = ()) -> Upstream:
+        if admission is None:
+            return self.upstreams.acquire(exclude=exclude)
+        if admission.upstream is None:
+            await self.admit(admission, exclude)
+        return self.upstreams.acquire(name=admission.upstream)
+
+    async def _complete(self, upstream: Upstream, request: Dict[str, Any], cancel_event: Optional[asyncio.Event]) -> Any:
+        completion_task = asyncio.create_task(upstream.client.chat.completions.create(**request))
+        if not cancel_event:
+            return await completion_task
+
+        cancel_task = asyncio.create_task(cancel_event.wait())
+        done, pending = await asyncio.wait([completion_task, cancel_task], return_when=asyncio.FIRST_COMPLETED)
+        for task in pending:
+            task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await task
+        if cancel_task in done:
+            completion_task.cancel()
+            raise HTTPException(status_code=499, detail="Request cancelled by client")
+        return await completion_task
 
     async def create_chat_completion_stream(
-        self, request: Dict[str, Any], request_id: Optional[str] = None
-    ) -> AsyncGenerator[str, None]:
-        cancel_event = None
-        if request_id:
-            cancel_event = asyncio.Event()
-            self.active_requests[request_id] = cancel_event
+        self, request: Dict[str, Any], request_id: Optional[str] = None, admission: Optional[Admission] = None
+    ) -> AsyncGenerator[ChatCompletionChunk, None]:
+        cancel_event = self._register(request_id, request, stream=True)
+        info = self.request_info.get(request_id or "")
 
+        upstream = await self._checkout(admission)
+        started = time.perf_counter()
+        first_chunk = True
+        streaming_completion = None
+        closer: Optional[asyncio.Task] = None
+        usage = None
+        generated: list[str] = []
         try:
             request["stream"] = True
-            request.setdefault("stream_options", {})["include_usage"] = True
-            streaming_completion = await self.client.chat.completions.create(**request)
-            async for chunk in streaming_completion:
+            if proxy_config.stream_include_usage:
+                request.setdefault("stream_options", {})["include_usage"] = True
+            with tracer.span("openai.chat.stream", upstream=upstream.name, model=request.get("model")) as span:
+                streaming_completion = await upstream.client.chat.completions.create(**request)
+                if cancel_event:
+                    closer = asyncio.create_task(self._close_on_cancel(cancel_event, streaming_completion))
+                async for chunk in streaming_completion:
+                    if cancel_event and cancel_event.is_set():
+                        break
+                    if first_chunk:
+                        first_chunk = False
+                        ttft = time.perf_counter() - started
+                        UPSTREAM_TTFT.observe(ttft, upstream=upstream.name)
+                        if span is not None:
+                            span.set(ttft_ms=round(ttft * 1000, 3))
+                    if chunk.usage is not None:
+                        usage = chunk.usage
+                    if chunk.choices:
+                        generated.extend(self._delta_text(chunk))
+                        if info is not None:
+                            info["streamed_chunks"] += 1
+                    yield chunk
                 if cancel_event and cancel_event.is_set():
                     raise HTTPException(status_code=499, detail="Request cancelled by client")
-                chunk_json = json.dumps(chunk.model_dump(), ensure_ascii=False)
-                yield f"data: {chunk_json}"
-            yield "data: [DONE]"
-        except AuthenticationError as exc:
-            raise HTTPException(status_code=401, detail=self.classify_openai_error(str(exc)))
-        except RateLimitError as exc:
-            raise HTTPException(status_code=429, detail=self.classify_openai_error(str(exc)))
-        except BadRequestError as exc:
-            raise HTTPException(status_code=400, detail=self.classify_openai_error(str(exc)))
-        except APIError as exc:
-            status_code = getattr(exc, "status_code", 500)
-            raise HTTPException(status_code=status_code, detail=self.classify_openai_error(str(exc)))
-        except Exception as exc:  # pragma: no cover - defensive
-            raise HTTPException(status_code=500, detail=f"Unexpected error: {exc}") from exc
+            self.upstreams.mark_success(upstream)
+        except HTTPException:
+            raise
+        except Exception as exc:
+            if cancel_event and cancel_event.is_set():
+                # Closing the upstream stream on cancellation surfaces as a read error.
+                raise HTTPException(status_code=499, detail="Request cancelled by client") from exc
+            self._record_error(exc)
+            if self._is_retryable(exc):
+                self.upstreams.mark_failure(upstream)
+            raise self._to_http_exception(exc) from exc
         finally:
-            if request_id:
-                self.active_requests.pop(request_id, None)
+            if closer is not None:
+                closer.cancel()
+            if streaming_completion is not None:
+                # Runs under the response's cancel scope when the client went away.
+                with anyio.CancelScope(shield=True), contextlib.suppress(Exception):
+                    await streaming_completion.close()
+            # Without a usage chunk (cancelled, include_usage off or ignored) the output is counted once here.
+            output_tokens = usage.completion_tokens if usage is not None else self._output_tokens(request, generated)
+            if info is not None:
+                info["streamed_tokens"] = output_tokens
+            if admission is not None:
+                admission.settle(usage.total_tokens if usage is not None else admission.prompt_tokens + output_tokens)
+            self.upstreams.release(upstream)
+            UPSTREAM_LATENCY.observe(time.perf_counter() - started, upstream=upstream.name, stream="true")
+            self._unregister(request_id)
+
+    @staticmethod
+    def _delta_text(chunk: ChatCompletionChunk) -> list[str]:
+        """Generated text (content and tool-call arguments) carried by one chunk."""
+
+        delta = chunk.choices[0].delta
+        pieces = [delta.content] if delta.content else []
+        for tool_call in delta.tool_calls or []:
+            if tool_call.function is not None and tool_call.function.arguments:
+                pieces.append(tool_call.function.arguments)
+        return pieces
+
+    @staticmethod
+    def _output_tokens(request: Dict[str, Any], generated: list[str]) -> int:
+        """Count streamed output in one pass, bypassing the ``count_text`` cache meant for prompts."""
+
+        tokenizer = get_tokenizer(model_manager.tokenizer_for_openai(str(request.get("model") or "")))
+        return tokenizer.count("".join(generated)) if generated else 0
+
+    @staticmethod
+    async def _close_on_cancel(cancel_event: asyncio.Event, stream: Any) -> None:
+        """Close the upstream HTTP stream as soon as cancellation is requested, even mid-read."""
+
+        await cancel_event.wait()
+        with contextlib.suppress(Exception):
+            await stream.close()
+
+    @staticmethod
+    def _is_retryable(exc: Exception) -> bool:
+        """Rate limits, server errors and connection failures justify trying another upstream."""
+
+        from openai import APIConnectionError, APIStatusError, RateLimitError
+
+        if isinstance(exc, RateLimitError | APIConnectionError):
+            return True
+        return isinstance(exc, APIStatusError) and exc.status_code >= 500
+
+    def _to_http_exception(self, exc: Exception) -> HTTPException:
+        from openai import APIError, AuthenticationError, BadRequestError, RateLimitError
+
+        if isinstance(exc, AuthenticationError):
+            return HTTPException(status_code=401, detail=self.classify_openai_error(str(exc)))
+        if isinstance(exc, RateLimitError):
+            return HTTPException(status_code=429, detail=self.classify_openai_error(str(exc)))
+        if isinstance(exc, BadRequestError):
+            return HTTPException(status_code=400, detail=self.classify_openai_error(str(exc)))
+        if isinstance(exc, APIError):
+            status_code = getattr(exc, "status_code", 500)
+            return HTTPException(status_code=status_code, detail=self.classify_openai_error(str(exc)))
+        return HTTPException(status_code=500, detail=f"Unexpected error: {exc}")
+
+    def _record_error(self, exc: Exception) -> None:
+        if isinstance(exc, HTTPException):
+            kind = "cancelled" if exc.status_code == 499 else "http"
+        else:
+            kind = self.classify_openai_error_kind(str(exc))
+        UPSTREAM_ERRORS.inc(kind=kind)
+
+    @staticmethod
+    def classify_openai_error_kind(error_detail: Any) -> str:
+        """Return a stable error class name; ``classify_openai_error`` maps it to a user message."""
 
-    def classify_openai_error(self, error_detail: Any) -> str:
         error_str = str(error_detail).lower()
         if "unsupported_country_region_territory" in error_str or "country, region, or territory not supported" in error_str:
-            return "OpenAI API is not available in your region. Consider using a VPN or Azure OpenAI service."
+            return "region"
         if "invalid_api_key" in error_str or "unauthorized" in error_str:
-            return "Invalid API key. Please check your OPENAI_API_KEY configuration."
+            return "auth"
         if "rate_limit" in error_str or "quota" in error_str:
-            return "Rate limit exceeded. Please wait and try again, or upgrade your API plan."
+            return "rate_limit"
         if "model" in error_str and ("not found" in error_str or "does not exist" in error_str):
-            return "Model not found. Please check your BIG_MODEL and SMALL_MODEL configuration."
+            return "model_not_found"
         if "billing" in error_str or "payment" in error_str:
-            return "Billing issue. Please check your OpenAI account billing status."
-        return str(error_detail)
+            return "billing"
+        return "other"
 
-    def cancel_request(self, request_id: str) -> bool:
-        if request_id in self.active_requests:
-            self.active_requests[request_id].set()
-            return True
-        return False
+    def classify_openai_error(self, error_detail: Any) -> str:
+        kind = self.classify_openai_error_kind(error_detail)
+        return ERROR_MESSAGES.get(kind, str(error_detail))
+
+    def cancel_request(self, request_id: str, reason: str = "admin") -> bool:
+        """Cancel an upstream call by proxy request id, or every call made under a trace id."""
+
+        matched = [request_id] if request_id in self.active_requests else [
+            key for key, info in self.request_info.items() if info["trace_id"] == request_id
+        ]
+        for key in matched:
+            info = self.request_info.get(key)
+            if info is not None and not info["cancel_reason"]:
+                info["cancel_reason"] = reason
+            self.active_requests[key].set()
+        return bool(matched)
+
+    def list_requests(self) -> list[Dict[str, Any]]:
+        now = time.time()
+        return [{**info, "elapsed_s": round(now - info["started_at"], 3)} for info in self.request_info.values()]
 
 
 openai_client = OpenAIClient()
@@ -1,9 +1,12 @@
 """Configuration for the Claude proxy (OpenAI-compatible bridge)."""
 from __future__ import annotations
 
+import json
 import os
+from functools import lru_cache
 from typing import Any
 
+from pydantic import AliasChoices, Field
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
@@ -12,8 +15,13 @@ class ProxyConfig(BaseSettings):
 
     model_config = SettingsConfigDict(env_file=".env", env_file_encoding="utf-8", extra="ignore")
 
-    openai_api_key: str = ""
-    openai_base_url: str = "https://api.openai.com/v1"
+    # The NANOBEE_-prefixed names are read directly instead of relying on
+    # Settings.apply_environment() having copied them over before import.
+    openai_api_key: str = Field(default="", validation_alias=AliasChoices("openai_api_key", "nanobee_openai_api_key"))
+    openai_base_url: str = Field(
+        default="https://api.openai.com/v1",
+        validation_alias=AliasChoices("openai_base_url", "nanobee_openai_base_url"),
+    )
     azure_api_version: str | None = None
     request_timeout: int = 90
     max_tokens_limit: int = 4096
@@ -22,6 +30,24 @@ class ProxyConfig(BaseSettings):
     big_model: str = "gpt-4o"
     middle_model: str = "gpt-4o"
     small_model: str = "gpt-4o-mini"
+    model_tokenizers: str = ""
+
+    openai_upstreams: str = ""
+    upstream_cooldown_seconds: float = 30.0
+    upstream_retry_attempts: int = 2
+
+    rpm_limit: int = 0
+    tpm_limit: int = 0
+    model_rate_limits: str = ""
+    rate_limit_max_wait: float = 10.0
+    disconnect_poll_interval: float = 0.5
+    # Ask for the trailing usage chunk; turn off for upstreams that reject stream_options.
+    stream_include_usage: bool = True
+
+    response_cache_enabled: bool = False
+    response_cache_max_entries: int = 512
+    response_cache_ttl_seconds: float = 300.0
+    response_cache_max_bytes: int = 32 * 1024 * 1024
 
     anthropic_api_key: str = ""
     log_level: str = "INFO"
@@ -33,6 +59,21 @@ class ProxyConfig(BaseSettings):
             return True
         return bool(candidate) and candidate == self.anthropic_api_key
 
+    def upstream_specs(self) -> list[dict[str, Any]]:
+        """Return the configured OpenAI-compatible upstreams.
+
+        ``OPENAI_UPSTREAMS`` accepts a JSON array of objects with ``base_url``,
+        ``api_key`` and optional ``weight``/``name``/``rate_limits`` (shaped
+        like ``MODEL_RATE_LIMITS``, for that key only); without it the single
+        ``OPENAI_BASE_URL``/``OPENAI_API_KEY`` pair is used. Parsed once per
+        distinct setting; treat the returned specs as read-only.
+        """
+
+        return list(_parse_upstreams(self.openai_upstreams, self.openai_base_url, self.openai_api_key))
+
+    def has_openai_credentials(self) -> bool:
+        return any(spec["api_key"] for spec in self.upstream_specs())
+
     def get_custom_headers(self) -> dict[str, str]:
         """Collect headers from ``CUSTOM_HEADER_*`` env vars."""
 
@@ -45,4 +86,23 @@ class ProxyConfig(BaseSettings):
         return headers
 
 
+@lru_cache(maxsize=8)
+def _parse_upstreams(raw: str, base_url: str, api_key: str) -> tuple[dict[str, Any], ...]:
+    if raw.strip():
+        specs = json.loads(raw)
+        if not isinstance(specs, list):
+            raise ValueError("OPENAI_UPSTREAMS must be a JSON array")
+        return tuple(
+            {
+                "name": str(spec.get("name") or f"upstream-{idx}"),
+                "base_url": spec.get("base_url") or base_url,
+                "api_key": spec.get("api_key") or api_key,
+                "weight": max(1, int(spec.get("weight", 1))),
+                "rate_limits": spec.get("rate_limits") or {},
+            }
+            for idx, spec in enumerate(specs)
+        )
+    return ({"name": "default", "base_url": base_url, "api_key": api_key, "weight": 1, "rate_limits": {}},)
+
+
 proxy_config = ProxyConfig()
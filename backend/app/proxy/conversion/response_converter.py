@@ -3,7 +3,7 @@ from __future__ import annotations
 
 import json
 import uuid
-from typing import AsyncGenerator
+from typing import Any, AsyncIterable
 
 from fastapi import HTTPException
 
@@ -67,97 +67,180 @@ def convert_openai_to_claude_response(openai_response: dict, original_request: C
     }
 
 
+def _frame(event: str, payload: dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
+_SLOT = "\x00slot\x00"
+
+
+def _template(event: str, payload: dict[str, Any]) -> tuple[str, str]:
+    """Pre-encode ``payload`` around a single string slot; returns the (prefix, suffix) pair."""
+
+    prefix, suffix = _frame(event, payload).split(json.dumps(_SLOT, ensure_ascii=False))
+    return prefix, suffix
+
+
+class _FrameTemplates:
+    """Per-index event frames encoded once and filled with ``json.dumps`` of the delta only."""
+
+    def __init__(self) -> None:
+        self._text: dict[int, tuple[str, str]] = {}
+        self._input_json: dict[int, tuple[str, str]] = {}
+
+    def text_delta(self, index: int, text: str) -> str:
+        template = self._text.get(index)
+        if template is None:
+            template = self._text[index] = _template(
+                Constants.EVENT_CONTENT_BLOCK_DELTA,
+                {"type": Constants.EVENT_CONTENT_BLOCK_DELTA, "index": index, "delta": {"type": Constants.DELTA_TEXT, "text": _SLOT}},
+            )
+        return template[0] + json.dumps(text, ensure_ascii=False) + template[1]
+
+    def input_json_delta(self, index: int, partial_json: str) -> str:
+        template = self._input_json.get(index)
+        if template is None:
+            template = self._input_json[index] = _template(
+                Constants.EVENT_CONTENT_BLOCK_DELTA,
+                {
+                    "type": Constants.EVENT_CONTENT_BLOCK_DELTA,
+                    "index": index,
+                    "delta": {"type": Constants.DELTA_INPUT_JSON, "partial_json": _SLOT},
+                },
+            )
+        return template[0] + json.dumps(partial_json, ensure_ascii=False) + template[1]
+
+
+_PING_FRAME = _frame(Constants.EVENT_PING, {"type": Constants.EVENT_PING})
+
+# Argument bytes held back per tool call while its name is still unknown.
+MAX_PENDING_ARGUMENT_CHARS = 64 * 1024
+
+
+class ToolArgumentsOverflow(Exception):
+    """Raised when a tool call sends more than ``MAX_PENDING_ARGUMENT_CHARS`` before its name."""
+
+
 async def convert_openai_streaming_to_claude(
-    openai_stream: AsyncGenerator[str, None], original_request: ClaudeMessagesRequest, logger
+    openai_stream: AsyncIterable[Any], original_request: ClaudeMessagesRequest, logger
 ):
+    """Translate typed OpenAI ``ChatCompletionChunk`` objects into Claude SSE frames.
+
+    Chunks are consumed as objects straight from the SDK stream, so nothing
+    is serialized and parsed again between the client and this converter.
+    Tool-call argument fragments are forwarded as ``input_json_delta`` events
+    as soon as they arrive, and the usage reported by the final chunk is
+    sent in ``message_delta``.
+    """
+
     message_id = f"msg_{uuid.uuid4().hex[:24]}"
+    frames = _FrameTemplates()
 
-    yield (
-        f"event: {Constants.EVENT_MESSAGE_START}\n"
-        f"data: {json.dumps({'type': Constants.EVENT_MESSAGE_START, 'message': {'id': message_id, 'type': 'message', 'role': Constants.ROLE_ASSISTANT, 'model': original_request.model, 'content': [], 'stop_reason': None, 'stop_sequence': None, 'usage': {'input_tokens': 0, 'output_tokens': 0}}}, ensure_ascii=False)}\n\n"
+    yield _frame(
+        Constants.EVENT_MESSAGE_START,
+        {
+            "type": Constants.EVENT_MESSAGE_START,
+            "message": {
+                "id": message_id,
+                "type": "message",
+                "role": Constants.ROLE_ASSISTANT,
+                "model": original_request.model,
+                "content": [],
+                "stop_reason": None,
+                "stop_sequence": None,
+                "usage": {"input_tokens": 0, "output_tokens": 0},
+            },
+        },
     )
-    yield (
-        f"event: {Constants.EVENT_CONTENT_BLOCK_START}\n"
-        f"data: {json.dumps({'type': Constants.EVENT_CONTENT_BLOCK_START, 'index': 0, 'content_block': {'type': Constants.CONTENT_TEXT, 'text': ''}}, ensure_ascii=False)}\n\n"
+    yield _frame(
+        Constants.EVENT_CONTENT_BLOCK_START,
+        {"type": Constants.EVENT_CONTENT_BLOCK_START, "index": 0, "content_block": {"type": Constants.CONTENT_TEXT, "text": ""}},
     )
-    yield f"event: {Constants.EVENT_PING}\ndata: {json.dumps({'type': Constants.EVENT_PING}, ensure_ascii=False)}\n\n"
+    yield _PING_FRAME
 
     text_block_index = 0
     tool_block_counter = 0
-    current_tool_calls: dict[int, dict[str, object]] = {}
+    current_tool_calls: dict[int, dict[str, Any]] = {}
     final_stop_reason = Constants.STOP_END_TURN
+    usage = {"input_tokens": 0, "output_tokens": 0}
 
     try:
-        async for line in openai_stream:
-            if not line.strip():
-                continue
-            if not line.startswith("data: "):
-                continue
-            chunk_data = line[6:]
-            if chunk_data.strip() == "[DONE]":
-                break
-            try:
-                chunk = json.loads(chunk_data)
-                choices = chunk.get("choices", [])
-                if not choices:
-                    continue
-            except json.JSONDecodeError as exc:  # pragma: no cover - defensive
-                logger.warning("Failed to parse chunk: %s error=%s", chunk_data, exc)
+        async for chunk in openai_stream:
+            if chunk.usage is not None:
+                usage = {"input_tokens": chunk.usage.prompt_tokens or 0, "output_tokens": chunk.usage.completion_tokens or 0}
+            choices = chunk.choices
+            if not choices:
                 continue
 
             choice = choices[0]
-            delta = choice.get("delta", {})
-            finish_reason = choice.get("finish_reason")
-
-            if delta and "content" in delta and delta["content"] is not None:
-                yield (
-                    f"event: {Constants.EVENT_CONTENT_BLOCK_DELTA}\n"
-                    f"data: {json.dumps({'type': Constants.EVENT_CONTENT_BLOCK_DELTA, 'index': text_block_index, 'delta': {'type': Constants.DELTA_TEXT, 'text': delta['content']}}, ensure_ascii=False)}\n\n"
-                )
-
-            if "tool_calls" in delta:
-                for tc_delta in delta["tool_calls"]:
-                    tc_index = tc_delta.get("index", 0)
-                    if tc_index not in current_tool_calls:
-                        current_tool_calls[tc_index] = {
+            delta = choice.delta
+            finish_reason = choice.finish_reason
+
+            if delta is not None and delta.content is not None:
+                yield frames.text_delta(text_block_index, delta.content)
+
+            if delta is not None and delta.tool_calls:
+                for tc_delta in delta.tool_calls:
+                    tc_index = tc_delta.index or 0
+                    tool_call = current_tool_calls.get(tc_index)
+                    if tool_call is None:
+                        tool_call = current_tool_calls[tc_index] = {
                             "id": None,
                             "name": None,
-                            "args_buffer": "",
-                            "json_sent": False,
+                            "pending": [],
+                            "pending_chars": 0,
+                            "last_fragment": "",
                             "claude_index": None,
                             "started": False,
                         }
 
-                    tool_call = current_tool_calls[tc_index]
-                    if tc_delta.get("id"):
-                        tool_call["id"] = tc_delta["id"]
+                    if tc_delta.id:
+                        tool_call["id"] = tc_delta.id
 
-                    function_data = tc_delta.get(Constants.TOOL_FUNCTION, {})
-                    if function_data.get("name"):
-                        tool_call["name"] = function_data["name"]
+                    function_data = tc_delta.function
+                    if function_data is not None and function_data.name:
+                        tool_call["name"] = function_data.name
 
-                    if tool_call["id"] and tool_call["name"] and not tool_call["started"]:
+                    if tool_call["name"] and not tool_call["started"]:
+                        tool_call["id"] = tool_call["id"] or f"toolu_{uuid.uuid4().hex[:24]}"
                         tool_block_counter += 1
                         claude_index = text_block_index + tool_block_counter
                         tool_call["claude_index"] = claude_index
                         tool_call["started"] = True
-                        yield (
-                            f"event: {Constants.EVENT_CONTENT_BLOCK_START}\n"
-                            f"data: {json.dumps({'type': Constants.EVENT_CONTENT_BLOCK_START, 'index': claude_index, 'content_block': {'type': Constants.CONTENT_TOOL_USE, 'id': tool_call['id'], 'name': tool_call['name'], 'input': {}}}, ensure_ascii=False)}\n\n"
+                        yield _frame(
+                            Constants.EVENT_CONTENT_BLOCK_START,
+                            {
+                                "type": Constants.EVENT_CONTENT_BLOCK_START,
+                                "index": claude_index,
+                                "content_block": {
+                                    "type": Constants.CONTENT_TOOL_USE,
+                                    "id": tool_call["id"],
+                                    "name": tool_call["name"],
+                                    "input": {},
+                                },
+                            },
                         )
 
-                    if "arguments" in function_data and tool_call["started"] and function_data["arguments"] is not None:
-                        tool_call["args_buffer"] += function_data["arguments"]
-                        try:
-                            json.loads(tool_call["args_buffer"])
-                            if not tool_call["json_sent"]:
-                                yield (
-                                    f"event: {Constants.EVENT_CONTENT_BLOCK_DELTA}\n"
-                                    f"data: {json.dumps({'type': Constants.EVENT_CONTENT_BLOCK_DELTA, 'index': tool_call['claude_index'], 'delta': {'type': Constants.DELTA_INPUT_JSON, 'partial_json': tool_call['args_buffer']}}, ensure_ascii=False)}\n\n"
-                                )
-                                tool_call["json_sent"] = True
-                        except json.JSONDecodeError:
-                            pass
+                        if tool_call["pending"]:
+                            pending = "".join(tool_call["pending"])
+                            tool_call["pending"] = []
+                            tool_call["last_fragment"] = pending
+                            yield frames.input_json_delta(claude_index, pending)
+
+                    arguments = function_data.arguments if function_data is not None else None
+                    if not arguments:
+                        continue
+                    if tool_call["started"]:
+                        tool_call["last_fragment"] = arguments
+                        yield frames.input_json_delta(tool_call["claude_index"], arguments)
+                    elif tool_call["pending_chars"] + len(arguments) <= MAX_PENDING_ARGUMENT_CHARS:
+                        tool_call["pending"].append(arguments)
+                        tool_call["pending_chars"] += len(arguments)
+                    else:
+                        # Dropping fragments would hand the client corrupted JSON; fail the response instead.
+                        raise ToolArgumentsOverflow(
+                            f"tool call {tc_index} sent more than {MAX_PENDING_ARGUMENT_CHARS} argument characters before its name"
+                        )
 
             if finish_reason:
                 if finish_reason == "length":
@@ -168,26 +251,52 @@ async def convert_openai_streaming_to_claude(
                     final_stop_reason = Constants.STOP_END_TURN
                 else:
                     final_stop_reason = Constants.STOP_END_TURN
-                break
+                # Keep reading: with ``include_usage`` the token counts arrive in a trailing chunk.
+    except ToolArgumentsOverflow as exc:
+        logger.error("Streaming error: %s", exc)
+        error_event = {"type": "error", "error": {"type": "api_error", "message": f"Streaming error: {exc}"}}
+        yield _frame("error", error_event)
+        return
     except Exception as exc:  # pragma: no cover - defensive
         logger.error("Streaming error: %s", exc)
         error_event = {"type": "error", "error": {"type": "api_error", "message": f"Streaming error: {exc}"}}
         yield f"data: {json.dumps(error_event, ensure_ascii=False)}\n\n"
         return
 
-    yield (
-        f"event: {Constants.EVENT_CONTENT_BLOCK_STOP}\n"
-        f"data: {json.dumps({'type': Constants.EVENT_CONTENT_BLOCK_STOP, 'index': text_block_index}, ensure_ascii=False)}\n\n"
-    )
+    yield _frame(Constants.EVENT_CONTENT_BLOCK_STOP, {"type": Constants.EVENT_CONTENT_BLOCK_STOP, "index": text_block_index})
 
     for tool_call in current_tool_calls.values():
         if tool_call.get("started"):
-            yield (
-                f"event: {Constants.EVENT_CONTENT_BLOCK_STOP}\n"
-                f"data: {json.dumps({'type': Constants.EVENT_CONTENT_BLOCK_STOP, 'index': tool_call['claude_index']}, ensure_ascii=False)}\n\n"
+            # Only the closing character is checked; scanning every argument character is too costly here.
+            if tool_call["last_fragment"] and not tool_call["last_fragment"].rstrip().endswith(("}", "]")):
+                logger.warning("Tool call %s ended with incomplete JSON arguments", tool_call["id"])
+            yield _frame(
+                Constants.EVENT_CONTENT_BLOCK_STOP,
+                {"type": Constants.EVENT_CONTENT_BLOCK_STOP, "index": tool_call["claude_index"]},
             )
 
-    yield (
-        f"event: {Constants.EVENT_MESSAGE_STOP}\n"
-        f"data: {json.dumps({'type': Constants.EVENT_MESSAGE_STOP, 'message': {'id': message_id, 'type': 'message', 'role': Constants.ROLE_ASSISTANT, 'model': original_request.model, 'content': [], 'stop_reason': final_stop_reason, 'stop_sequence': None, 'usage': {'input_tokens': 0, 'output_tokens': 0}}}, ensure_ascii=False)}\n\n"
+    yield _frame(
+        Constants.EVENT_MESSAGE_DELTA,
+        {
+            "type": Constants.EVENT_MESSAGE_DELTA,
+            "delta": {"stop_reason": final_stop_reason, "stop_sequence": None},
+            "usage": usage,
+        },
+    )
+
+    yield _frame(
+        Constants.EVENT_MESSAGE_STOP,
+        {
+            "type": Constants.EVENT_MESSAGE_STOP,
+            "message": {
+                "id": message_id,
+                "type": "message",
+                "role": Constants.ROLE_ASSISTANT,
+                "model": original_request.model,
+                "content": [],
+                "stop_reason": final_stop_reason,
+                "stop_sequence": None,
+                "usage": usage,
+            },
+        },
     )
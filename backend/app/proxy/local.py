@@ -0,0 +1,83 @@
+"""In-process entry points to the proxy for callers living in the same process.
+
+``POST /proxy/v1/messages`` costs a loopback round trip per turn: the caller
+serialises the request, uvicorn parses it, FastAPI validates it into a
+``ClaudeMessagesRequest`` and the response goes the same way back. These
+functions run the same pipeline as the route (credential check, conversion,
+response cache, scheduler, upstream pool) on a request object directly.
+
+The Claude Code CLI behind the agent is a separate process and keeps talking
+HTTP; this path is for Python code inside the backend.
+"""
+from __future__ import annotations
+
+import logging
+import uuid
+from typing import Any, AsyncIterator, Optional, Union
+
+import anyio
+
+from . import api
+from .conversion.response_converter import convert_openai_streaming_to_claude
+from .models.claude import ClaudeMessagesRequest
+from ..tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+MessagesRequest = Union[ClaudeMessagesRequest, dict[str, Any]]
+
+
+def _coerce(request: MessagesRequest, stream: bool) -> ClaudeMessagesRequest:
+    if isinstance(request, ClaudeMessagesRequest):
+        return request if request.stream == stream else request.model_copy(update={"stream": stream})
+    return ClaudeMessagesRequest.model_validate({**request, "stream": stream})
+
+
+async def create_message(request: MessagesRequest, *, priority: Optional[str] = None) -> dict[str, Any]:
+    """Non-streaming Claude Messages call; returns the response body the route would send."""
+
+    request = _coerce(request, stream=False)
+    with tracer.span("proxy.local", model=request.model, stream=False) as span:
+        prepared = await api.prepare_request(request, priority)
+        if prepared.cached_response is not None:
+            cache = "HIT"
+            openai_response = prepared.cached_response
+        else:
+            cache = "MISS" if prepared.cache_key else "BYPASS"
+            openai_response = await api.openai_client.create_chat_completion(
+                prepared.openai_request, str(uuid.uuid4()), admission=prepared.admission
+            )
+        if span is not None:
+            span.set(cache=cache)
+        return api.finish_request(prepared, openai_response)
+
+
+async def stream_message(request: MessagesRequest, *, priority: Optional[str] = None) -> AsyncIterator[str]:
+    """Streaming Claude Messages call yielding the same SSE frames as the route.
+
+    Closing the iterator early cancels the upstream call.
+    """
+
+    request = _coerce(request, stream=True)
+    with tracer.span("proxy.local", model=request.model, stream=True):
+        # Streaming requests are never cacheable, so this always reaches the upstream.
+        prepared = await api.prepare_request(request, priority)
+        request_id = str(uuid.uuid4())
+        openai_stream = api.openai_client.create_chat_completion_stream(
+            prepared.openai_request, request_id, admission=prepared.admission
+        )
+        frames = convert_openai_streaming_to_claude(openai_stream, request, logger=logger)
+        completed = False
+        try:
+            async for frame in frames:
+                yield frame
+            completed = True
+        finally:
+            if not completed:
+                api.openai_client.cancel_request(request_id, reason="client_disconnect")
+            with anyio.CancelScope(shield=True):
+                await frames.aclose()
+                await openai_stream.aclose()
+
+
+__all__ = ["create_message", "stream_message"]
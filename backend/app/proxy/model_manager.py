@@ -1,7 +1,11 @@
 """Model mapping helpers for Claude -> OpenAI translation."""
 from __future__ import annotations
 
+import json
+from functools import lru_cache
+
 from .config import proxy_config
+from .tokenizer import HEURISTIC
 
 
 class ModelManager:
@@ -25,5 +29,31 @@ class ModelManager:
             return self.config.big_model
         return self.config.big_model
 
+    def tokenizer_for(self, claude_model: str) -> str:
+        """Pick the tokenizer encoding for the upstream model a Claude model maps to."""
+
+        return self.tokenizer_for_openai(self.map_claude_model_to_openai(claude_model))
+
+    def tokenizer_for_openai(self, openai_model: str) -> str:
+        """Pick the tokenizer encoding for an upstream (OpenAI-side) model name."""
+
+        overrides = _tokenizer_overrides(self.config.model_tokenizers)
+        if openai_model in overrides:
+            return overrides[openai_model]
+
+        model_lower = openai_model.lower()
+        if model_lower.startswith(("gpt-4o", "gpt-4.1", "gpt-5", "o1", "o3", "o4")):
+            return "o200k_base"
+        if model_lower.startswith(("gpt-4", "gpt-3.5")):
+            return "cl100k_base"
+        return HEURISTIC
+
+
+@lru_cache(maxsize=8)
+def _tokenizer_overrides(raw: str) -> dict[str, str]:
+    """``MODEL_TOKENIZERS`` parsed once per distinct value rather than on every request."""
+
+    return json.loads(raw) if raw.strip() else {}
+
 
 model_manager = ModelManager(proxy_config)
@@ -0,0 +1,80 @@
+"""Exact-match cache for deterministic, non-streaming proxy completions."""
+from __future__ import annotations
+
+import copy
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from typing import Any
+
+from .config import ProxyConfig
+
+
+class ResponseCache:
+    """LRU cache with TTL and a byte-size cap over converted OpenAI requests."""
+
+    def __init__(self, *, enabled: bool = False, max_entries: int = 512, ttl_seconds: float = 300.0, max_bytes: int = 32 * 1024 * 1024) -> None:
+        self.enabled = enabled
+        self.max_entries = max(1, max_entries)
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[str, tuple[float, int, dict[str, Any]]] = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_config(cls, config: ProxyConfig) -> "ResponseCache":
+        return cls(
+            enabled=config.response_cache_enabled,
+            max_entries=config.response_cache_max_entries,
+            ttl_seconds=config.response_cache_ttl_seconds,
+            max_bytes=config.response_cache_max_bytes,
+        )
+
+    def is_cacheable(self, openai_request: dict[str, Any]) -> bool:
+        """Only deterministic (temperature 0), non-streaming requests are cached."""
+
+        return self.enabled and not openai_request.get("stream") and openai_request.get("temperature") == 0
+
+    @staticmethod
+    def make_key(openai_request: dict[str, Any]) -> str:
+        canonical = {key: value for key, value in openai_request.items() if key not in {"stream", "stream_options"}}
+        encoded = json.dumps(canonical, ensure_ascii=False, sort_keys=True, separators=(",", ":"), default=str)
+        return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> dict[str, Any] | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        created_at, size, response = entry
+        if time.monotonic() - created_at > self.ttl_seconds:
+            self._drop(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return copy.deepcopy(response)
+
+    def set(self, key: str, response: dict[str, Any]) -> None:
+        size = len(json.dumps(response, ensure_ascii=False, default=str).encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        self._drop(key)
+        self._entries[key] = (time.monotonic(), size, copy.deepcopy(response))
+        self._bytes += size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            self._drop(next(iter(self._entries)))
+
+    def _drop(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[1]
+
+    def stats(self) -> dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries), "bytes": self._bytes}
+
+
+__all__ = ["ResponseCache"]
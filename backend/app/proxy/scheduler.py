@@ -0,0 +1,233 @@
+"""Local rate limiting and priority scheduling in front of the upstream.
+
+Providers enforce limits per API key and model, so every (upstream, model)
+pair gets a requests-per-minute and a tokens-per-minute token bucket. A
+request is charged its prompt tokens plus its completion budget once the
+client has picked an upstream, and settled against the usage the upstream
+reports when the call ends (streamed or not). When a budget is exhausted the
+request waits briefly in a priority queue (interactive before batch) instead
+of bouncing off the upstream as a ``RateLimitError``; it is rejected with 429
+only once it would wait longer than ``max_wait`` seconds.
+"""
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+import json
+import time
+from dataclasses import dataclass, field
+from typing import Any
+
+from fastapi import HTTPException
+
+from .config import ProxyConfig
+from .tokenizer import count_request_tokens
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 1
+
+
+class TokenBucket:
+    """Continuously refilling bucket holding up to one minute of budget."""
+
+    def __init__(self, per_minute: int) -> None:
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = float(per_minute)
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount: float) -> None:
+        self.tokens -= min(amount, self.capacity)
+
+
+@dataclass(order=True)
+class _Waiter:
+    priority: int
+    seq: int
+    tokens: int = field(compare=False)
+    future: asyncio.Future = field(compare=False)
+
+
+class _ModelLane:
+    def __init__(self, rpm: int, tpm: int) -> None:
+        self.requests = TokenBucket(rpm) if rpm > 0 else None
+        self.tokens = TokenBucket(tpm) if tpm > 0 else None
+        self.waiters: list[_Waiter] = []
+        self.drainer: asyncio.Task | None = None
+
+    def wait_time(self, tokens: int, now: float) -> float:
+        waits = [0.0]
+        if self.requests is not None:
+            waits.append(self.requests.wait_time(1, now))
+        if self.tokens is not None:
+            waits.append(self.tokens.wait_time(tokens, now))
+        return max(waits)
+
+    def consume(self, tokens: int) -> None:
+        if self.requests is not None:
+            self.requests.consume(1)
+        if self.tokens is not None:
+            self.tokens.consume(tokens)
+
+
+class RequestScheduler:
+    def __init__(
+        self,
+        limits: dict[str, dict[str, int]],
+        default_rpm: int = 0,
+        default_tpm: int = 0,
+        max_wait: float = 10.0,
+        upstream_limits: dict[str, dict[str, dict[str, int]]] | None = None,
+    ) -> None:
+        self.limits = limits
+        self.upstream_limits = upstream_limits or {}
+        self.default_rpm = default_rpm
+        self.default_tpm = default_tpm
+        self.max_wait = max_wait
+        self._lanes: dict[tuple[str, str], _ModelLane] = {}
+        self._seq = itertools.count()
+        self.queued_total = 0
+        self.rejected_total = 0
+
+    @classmethod
+    def from_config(cls, config: ProxyConfig) -> "RequestScheduler":
+        limits = json.loads(config.model_rate_limits) if config.model_rate_limits.strip() else {}
+        upstream_limits = {spec["name"]: spec["rate_limits"] for spec in config.upstream_specs() if spec["rate_limits"]}
+        return cls(
+            limits,
+            default_rpm=config.rpm_limit,
+            default_tpm=config.tpm_limit,
+            max_wait=config.rate_limit_max_wait,
+            upstream_limits=upstream_limits,
+        )
+
+    def queue_depth(self) -> int:
+        return sum(1 for lane in self._lanes.values() for waiter in lane.waiters if not waiter.future.done())
+
+    def _lane(self, upstream: str, model: str) -> _ModelLane | None:
+        lane = self._lanes.get((upstream, model))
+        if lane is None:
+            # A key's own ``rate_limits`` win over MODEL_RATE_LIMITS, which win over RPM_LIMIT/TPM_LIMIT.
+            limits = {**self.limits.get(model, {}), **self.upstream_limits.get(upstream, {}).get(model, {})}
+            rpm = int(limits.get("rpm", self.default_rpm))
+            tpm = int(limits.get("tpm", self.default_tpm))
+            if rpm <= 0 and tpm <= 0:
+                return None
+            lane = self._lanes[(upstream, model)] = _ModelLane(rpm, tpm)
+        return lane
+
+    async def acquire(self, model: str, tokens: int, priority: int = PRIORITY_BATCH, upstream: str = "default") -> None:
+        """Wait for budget on ``model`` at ``upstream``; raise 429 once the wait would exceed ``max_wait``."""
+
+        lane = self._lane(upstream, model)
+        if lane is None:
+            return
+        if not lane.waiters and lane.wait_time(tokens, time.monotonic()) == 0:
+            lane.consume(tokens)
+            return
+
+        waiter = _Waiter(priority, next(self._seq), tokens, asyncio.get_running_loop().create_future())
+        heapq.heappush(lane.waiters, waiter)
+        self.queued_total += 1
+        if lane.drainer is None or lane.drainer.done():
+            lane.drainer = asyncio.create_task(self._drain(lane))
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), timeout=self.max_wait)
+        except asyncio.CancelledError:
+            waiter.future.cancel()
+            raise
+        except asyncio.TimeoutError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                return
+            waiter.future.cancel()
+            self.rejected_total += 1
+            raise HTTPException(
+                status_code=429,
+                detail=f"Local rate limit for {model} on {upstream} exhausted, retry later",
+                headers={"Retry-After": str(max(1, round(lane.wait_time(tokens, time.monotonic()))))},
+            ) from None
+
+    async def _drain(self, lane: _ModelLane) -> None:
+        while lane.waiters:
+            head = lane.waiters[0]
+            if head.future.done():
+                heapq.heappop(lane.waiters)
+                continue
+            delay = lane.wait_time(head.tokens, time.monotonic())
+            if delay > 0:
+                # Sleep in short steps so a higher-priority arrival can take the head.
+                await asyncio.sleep(min(delay, 0.25))
+                continue
+            heapq.heappop(lane.waiters)
+            lane.consume(head.tokens)
+            head.future.set_result(None)
+
+    def reconcile(self, model: str, estimated: int, actual: int, upstream: str = "default") -> None:
+        """Correct the token budget once the upstream reports real usage."""
+
+        lane = self._lanes.get((upstream, model))
+        if lane is not None and lane.tokens is not None and actual > 0:
+            lane.tokens.tokens = min(lane.tokens.capacity, lane.tokens.tokens + estimated - actual)
+
+
+@dataclass
+class Admission:
+    """One request's claim on the scheduler, charged per attempt and settled from usage."""
+
+    scheduler: RequestScheduler
+    model: str
+    prompt_tokens: int
+    max_tokens: int
+    priority: int = PRIORITY_BATCH
+    upstream: str | None = None
+
+    @property
+    def estimated_tokens(self) -> int:
+        return self.prompt_tokens + self.max_tokens
+
+    async def acquire(self, upstream: str) -> None:
+        await self.scheduler.acquire(self.model, self.estimated_tokens, self.priority, upstream=upstream)
+        self.upstream = upstream
+
+    def settle(self, actual_tokens: int) -> None:
+        """Replace the up-front charge with what the attempt really used; later calls are no-ops."""
+
+        if self.upstream is not None:
+            self.scheduler.reconcile(self.model, self.estimated_tokens, actual_tokens, upstream=self.upstream)
+            self.upstream = None
+
+
+def estimate_request_tokens(request: Any, openai_request: dict[str, Any], tokenizer_name: str) -> tuple[int, int]:
+    """Prompt tokens of the Claude request under the upstream tokenizer, and the completion budget."""
+
+    max_tokens = openai_request.get("max_tokens") or openai_request.get("max_completion_tokens") or 0
+    return count_request_tokens(request, tokenizer_name), int(max_tokens)
+
+
+def request_priority(stream: bool, header_value: str | None) -> int:
+    if header_value:
+        return PRIORITY_BATCH if header_value.strip().lower() in {"batch", "agent", "low"} else PRIORITY_INTERACTIVE
+    return PRIORITY_INTERACTIVE if stream else PRIORITY_BATCH
+
+
+__all__ = [
+    "Admission",
+    "PRIORITY_BATCH",
+    "PRIORITY_INTERACTIVE",
+    "RequestScheduler",
+    "TokenBucket",
+    "estimate_request_tokens",
+    "request_priority",
+]
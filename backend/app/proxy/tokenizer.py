@@ -0,0 +1,154 @@
+"""Offline token counting for ``/v1/messages/count_tokens``.
+
+``tiktoken`` encodings are used when the optional package is installed and
+its encoding file is already in the local tiktoken cache (``TIKTOKEN_CACHE_DIR``);
+``tiktoken`` would otherwise download it synchronously on first use, so a
+CJK-aware heuristic stands in instead.
+Counts of individual texts are memoized so that repeated system prompts and
+tool schemas cost a dictionary lookup.
+"""
+from __future__ import annotations
+
+import hashlib
+import importlib.util
+import json
+import math
+import os
+import re
+import tempfile
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Protocol
+
+from .constants import Constants
+
+HEURISTIC = "heuristic"
+# Per-message framing overhead used by OpenAI-style chat formats.
+MESSAGE_OVERHEAD_TOKENS = 3
+# Upper bound for one image block (~1.15 megapixels / 750 pixels per token).
+IMAGE_TOKENS = 1600
+
+ENCODING_BLOB_URL = "https://openaipublic.blob.core.windows.net/encodings/{name}.tiktoken"
+
+_CJK_RE = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff\uff00-\uffef]")
+_WORD_RE = re.compile(r"[A-Za-z0-9_]+|[^\sA-Za-z0-9_]")
+
+
+class Tokenizer(Protocol):
+    name: str
+
+    def count(self, text: str) -> int: ...
+
+
+class HeuristicTokenizer:
+    """Approximation for models without a local tokenizer.
+
+    CJK characters count as one token each (BPE vocabularies rarely merge
+    them), ASCII words as one token per four characters, punctuation as one.
+    """
+
+    name = HEURISTIC
+
+    def count(self, text: str) -> int:
+        cjk = len(_CJK_RE.findall(text))
+        rest = _CJK_RE.sub(" ", text)
+        return cjk + sum(math.ceil(len(word) / 4) for word in _WORD_RE.findall(rest))
+
+
+class TiktokenTokenizer:
+    def __init__(self, encoding: Any) -> None:
+        self.name = encoding.name
+        self._encoding = encoding
+
+    def count(self, text: str) -> int:
+        return len(self._encoding.encode(text, disallowed_special=()))
+
+
+def cached_encoding_path(name: str) -> Path:
+    """Where tiktoken keeps the downloaded file for ``name`` (mirrors ``tiktoken.load``)."""
+
+    cache_dir = os.environ.get("TIKTOKEN_CACHE_DIR") or os.environ.get("DATA_GYM_CACHE_DIR")
+    root = Path(cache_dir) if cache_dir else Path(tempfile.gettempdir()) / "data-gym-cache"
+    return root / hashlib.sha1(ENCODING_BLOB_URL.format(name=name).encode()).hexdigest()
+
+
+@lru_cache(maxsize=None)
+def get_tokenizer(name: str) -> Tokenizer:
+    """Return the tokenizer for an encoding name, or the heuristic when it is not available locally.
+
+    Never touches the network: an encoding whose file is not cached yet
+    would make ``tiktoken`` download it while blocking the event loop.
+    """
+
+    if name == HEURISTIC or importlib.util.find_spec("tiktoken") is None or not cached_encoding_path(name).is_file():
+        return HeuristicTokenizer()
+    try:
+        import tiktoken
+
+        return TiktokenTokenizer(tiktoken.get_encoding(name))
+    except Exception:  # pragma: no cover - optional dependency / encoding files unavailable
+        return HeuristicTokenizer()
+
+
+@lru_cache(maxsize=4096)
+def count_text(tokenizer_name: str, text: str) -> int:
+    if not text:
+        return 0
+    return get_tokenizer(tokenizer_name).count(text)
+
+
+def _count_block(tokenizer_name: str, block: Any) -> int:
+    block_type = getattr(block, "type", None)
+    if block_type == Constants.CONTENT_TEXT:
+        return count_text(tokenizer_name, block.text or "")
+    if block_type == Constants.CONTENT_IMAGE:
+        return IMAGE_TOKENS
+    if block_type == Constants.CONTENT_TOOL_USE:
+        return count_text(tokenizer_name, block.name) + count_text(
+            tokenizer_name, json.dumps(block.input, ensure_ascii=False, sort_keys=True)
+        )
+    if block_type == Constants.CONTENT_TOOL_RESULT:
+        return _count_tool_result(tokenizer_name, block.content)
+    return 0
+
+
+def _count_tool_result(tokenizer_name: str, content: Any) -> int:
+    if isinstance(content, str):
+        return count_text(tokenizer_name, content)
+    if isinstance(content, list):
+        total = 0
+        for item in content:
+            if isinstance(item, dict) and item.get("type") == Constants.CONTENT_TEXT:
+                total += count_text(tokenizer_name, str(item.get("text", "")))
+            elif isinstance(item, dict) and item.get("type") == Constants.CONTENT_IMAGE:
+                total += IMAGE_TOKENS
+            else:
+                total += count_text(tokenizer_name, json.dumps(item, ensure_ascii=False, sort_keys=True))
+        return total
+    return count_text(tokenizer_name, json.dumps(content, ensure_ascii=False, sort_keys=True))
+
+
+def count_request_tokens(request: Any, tokenizer_name: str) -> int:
+    """Count system, messages (text, images, tool use/results) and tool schemas."""
+
+    total = 0
+    if request.system:
+        if isinstance(request.system, str):
+            total += count_text(tokenizer_name, request.system)
+        else:
+            total += sum(count_text(tokenizer_name, block.text or "") for block in request.system)
+
+    for msg in request.messages:
+        total += MESSAGE_OVERHEAD_TOKENS
+        if isinstance(msg.content, str):
+            total += count_text(tokenizer_name, msg.content)
+        elif isinstance(msg.content, list):
+            total += sum(_count_block(tokenizer_name, block) for block in msg.content)
+
+    for tool in request.tools or []:
+        total += count_text(tokenizer_name, tool.model_dump_json())
+
+    return max(1, total)
+
+
+__all__ = ["HEURISTIC", "HeuristicTokenizer", "count_request_tokens", "count_text", "get_tokenizer"]
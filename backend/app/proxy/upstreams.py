@@ -0,0 +1,118 @@
+"""Pool of OpenAI-compatible upstreams with least-outstanding routing."""
+from __future__ import annotations
+
+import itertools
+import time
+from dataclasses import dataclass, field
+from typing import Any, Iterable
+
+from .config import ProxyConfig
+
+
+@dataclass(eq=False)
+class Upstream:
+    name: str
+    base_url: str
+    client: Any
+    weight: int = 1
+    outstanding: int = 0
+    unhealthy_until: float = 0.0
+    failures: int = field(default=0)
+
+    @property
+    def healthy(self) -> bool:
+        return time.monotonic() >= self.unhealthy_until
+
+    def describe(self) -> dict[str, Any]:
+        return {
+            "name": self.name,
+            "base_url": self.base_url,
+            "weight": self.weight,
+            "outstanding": self.outstanding,
+            "healthy": self.healthy,
+            "failures": self.failures,
+        }
+
+
+class UpstreamPool:
+    """Pick one upstream per request and track its health.
+
+    Selection prefers healthy upstreams with the fewest outstanding requests
+    relative to their weight; ties rotate round-robin. Upstreams answering
+    429 or 5xx are benched for ``cooldown_seconds``.
+    """
+
+    def __init__(self, upstreams: list[Upstream], cooldown_seconds: float = 30.0) -> None:
+        if not upstreams:
+            raise ValueError("At least one upstream is required")
+        self.upstreams = upstreams
+        self.cooldown_seconds = cooldown_seconds
+        self._rotation = itertools.count()
+
+    @classmethod
+    def from_config(cls, config: ProxyConfig) -> "UpstreamPool":
+        from openai import AsyncAzureOpenAI, AsyncOpenAI
+
+        headers = {"Content-Type": "application/json", **config.get_custom_headers()}
+        upstreams = []
+        for spec in config.upstream_specs():
+            if config.azure_api_version:
+                client = AsyncAzureOpenAI(
+                    api_key=spec["api_key"],
+                    azure_endpoint=spec["base_url"],
+                    api_version=config.azure_api_version,
+                    timeout=config.request_timeout,
+                    default_headers=headers,
+                )
+            else:
+                client = AsyncOpenAI(
+                    api_key=spec["api_key"],
+                    base_url=spec["base_url"],
+                    timeout=config.request_timeout,
+                    default_headers=headers,
+                )
+            upstreams.append(Upstream(name=spec["name"], base_url=spec["base_url"], client=client, weight=spec["weight"]))
+        return cls(upstreams, cooldown_seconds=config.upstream_cooldown_seconds)
+
+    def __len__(self) -> int:
+        return len(self.upstreams)
+
+    def pick(self, exclude: Iterable[Upstream] = ()) -> Upstream:
+        """Choose the upstream the next request should use, without reserving it."""
+
+        excluded = set(map(id, exclude))
+        candidates = [upstream for upstream in self.upstreams if id(upstream) not in excluded] or self.upstreams
+        healthy = [upstream for upstream in candidates if upstream.healthy]
+        if healthy:
+            offset = next(self._rotation)
+            rotated = healthy[offset % len(healthy) :] + healthy[: offset % len(healthy)]
+            chosen = min(rotated, key=lambda upstream: (upstream.outstanding + 1) / upstream.weight)
+        else:
+            # Everything is benched: use the upstream that recovers first rather than failing outright.
+            chosen = min(candidates, key=lambda upstream: upstream.unhealthy_until)
+        return chosen
+
+    def acquire(self, exclude: Iterable[Upstream] = (), name: str | None = None) -> Upstream:
+        """Reserve the upstream called ``name``, or pick one; pair with :meth:`release`."""
+
+        chosen = next((upstream for upstream in self.upstreams if upstream.name == name), None) if name else None
+        chosen = chosen or self.pick(exclude)
+        chosen.outstanding += 1
+        return chosen
+
+    def release(self, upstream: Upstream) -> None:
+        upstream.outstanding = max(0, upstream.outstanding - 1)
+
+    def mark_success(self, upstream: Upstream) -> None:
+        upstream.failures = 0
+        upstream.unhealthy_until = 0.0
+
+    def mark_failure(self, upstream: Upstream) -> None:
+        upstream.failures += 1
+        upstream.unhealthy_until = time.monotonic() + self.cooldown_seconds
+
+    def describe(self) -> list[dict[str, Any]]:
+        return [upstream.describe() for upstream in self.upstreams]
+
+
+__all__ = ["Upstream", "UpstreamPool"]
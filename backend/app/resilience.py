@@ -0,0 +1,201 @@
+"""Retry, hedging and circuit-breaker primitives for flaky upstreams.
+
+Used by :class:`app.image_client.ImageGenerationClient`; kept free of HTTP
+specifics apart from the status/header helpers so other clients can reuse
+them.
+"""
+from __future__ import annotations
+
+import asyncio
+import random
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+from typing import Awaitable, Callable, TypeVar
+
+import httpx
+
+T = TypeVar("T")
+
+RETRYABLE_STATUS = frozenset({408, 425, 429, 500, 502, 503, 504})
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    """Seconds to wait from a ``Retry-After`` header (delta-seconds or HTTP date)."""
+
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+def is_retryable_error(exc: BaseException) -> bool:
+    """Timeouts, connection failures and throttling/server statuses are worth retrying."""
+
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code in RETRYABLE_STATUS
+    return isinstance(exc, httpx.TransportError)
+
+
+def retry_after_of(exc: BaseException) -> float | None:
+    if isinstance(exc, httpx.HTTPStatusError):
+        return parse_retry_after(exc.response.headers.get("Retry-After"))
+    return None
+
+
+class RetryPolicy:
+    """Exponential backoff with full jitter, deferring to ``Retry-After`` when given."""
+
+    def __init__(self, attempts: int = 3, base_delay: float = 0.5, max_delay: float = 8.0, max_retry_after: float = 30.0) -> None:
+        self.attempts = max(1, attempts)
+        self.base_delay = max(0.0, base_delay)
+        self.max_delay = max(self.base_delay, max_delay)
+        self.max_retry_after = max_retry_after
+
+    def delay(self, attempt: int, retry_after: float | None = None) -> float | None:
+        """Sleep before attempt ``attempt + 1``; ``None`` when no retry should be made."""
+
+        if attempt >= self.attempts:
+            return None
+        if retry_after is not None:
+            # Waiting longer than the caller is willing to would only hold a slot.
+            return retry_after if retry_after <= self.max_retry_after else None
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+
+class LatencyTracker:
+    """Sliding window of recent successful latencies for percentile queries."""
+
+    def __init__(self, window: int = 200, min_samples: int = 20) -> None:
+        self.samples: deque[float] = deque(maxlen=max(1, window))
+        self.min_samples = min_samples
+
+    def record(self, seconds: float) -> None:
+        self.samples.append(seconds)
+
+    def percentile(self, pct: float) -> float | None:
+        if len(self.samples) < self.min_samples:
+            return None
+        ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+        return ordered[index]
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker: open after ``failure_threshold`` failures,
+    let one probe through after ``reset_timeout`` and close again on success.
+
+    A probe that has not reported back within another ``reset_timeout`` is
+    presumed lost and a new one is admitted.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0, clock: Callable[[], float] = time.monotonic) -> None:
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.opened_total = 0
+        self._probe_in_flight = False
+        self._probe_started = 0.0
+
+    def allow(self) -> bool:
+        if self.state == CLOSED:
+            return True
+        now = self.clock()
+        if self.state == OPEN and now - self.opened_at >= self.reset_timeout:
+            self.state = HALF_OPEN
+            self._probe_in_flight = False
+        if self.state == HALF_OPEN and (not self._probe_in_flight or now - self._probe_started >= self.reset_timeout):
+            self._probe_in_flight = True
+            self._probe_started = now
+            return True
+        return False
+
+    def record_success(self) -> None:
+        self.state = CLOSED
+        self.failures = 0
+        self._probe_in_flight = False
+
+    def release(self) -> None:
+        """Give back an admitted call that ended without a verdict (cancelled, or
+        an error unrelated to the upstream) so the next caller can probe."""
+
+        self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != OPEN:
+                self.opened_total += 1
+            self.state = OPEN
+            self.opened_at = self.clock()
+            self._probe_in_flight = False
+
+    def retry_in(self) -> float:
+        if self.state != OPEN:
+            return 0.0
+        return max(0.0, self.reset_timeout - (self.clock() - self.opened_at))
+
+
+async def hedge(
+    call: Callable[[], Awaitable[T]],
+    delay: float | None,
+    on_hedge: Callable[[], None] | None = None,
+    on_hedge_win: Callable[[], None] | None = None,
+) -> T:
+    """Run ``call``; if it is still pending after ``delay`` seconds start a
+    duplicate and return whichever succeeds first, cancelling the other."""
+
+    first = asyncio.ensure_future(call())
+    tasks = [first]
+    try:
+        if delay is None:
+            return await first
+        done, _ = await asyncio.wait({first}, timeout=delay)
+        if done:
+            return first.result()
+
+        if on_hedge:
+            on_hedge()
+        second = asyncio.ensure_future(call())
+        tasks.append(second)
+        pending: set[asyncio.Future] = {first, second}
+        error: BaseException | None = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is second and on_hedge_win:
+                        on_hedge_win()
+                    return task.result()
+                error = task.exception()
+        assert error is not None
+        raise error
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+
+__all__ = [
+    "CircuitBreaker",
+    "LatencyTracker",
+    "RetryPolicy",
+    "hedge",
+    "is_retryable_error",
+    "parse_retry_after",
+    "retry_after_of",
+]
@@ -1,15 +1,18 @@
 """Skill implementations exposed to the Claude agent."""
 from __future__ import annotations
 
+import asyncio
 from datetime import datetime, timezone
 from textwrap import dedent
-
-from claude_agent_sdk import tool
+from typing import Any, AsyncIterator
 
 from .config import settings
+from .image_cache import ImageResultCache
 from .image_client import ImageGenerationClient, build_slide_prompts
+from .tracing import tracer
 
 image_client = ImageGenerationClient()
+image_cache = ImageResultCache.from_settings()
 
 
 def _outline_content(topic: str, audience: str, slides: int) -> str:
@@ -32,27 +35,111 @@ async def draft_ppt_outline_handler(args: dict) -> dict:
     audience: str = args.get("audience", "通用观众")
     slides: int = int(args.get("slides") or settings.default_slide_count)
 
-    return {"content": [{"type": "text", "text": _outline_content(topic, audience, slides)}]}
+    with tracer.span("skill.draft_ppt_outline", slides=slides):
+        return {"content": [{"type": "text", "text": _outline_content(topic, audience, slides)}]}
 
 
-@tool(
-    name="draft_ppt_outline",
-    description="生成PPT的大纲和分镜，帮助明确每页的叙述重点",
-    input_schema={"topic": str, "audience": str, "slides": int},
-)
 async def draft_ppt_outline(args: dict) -> dict:
     return await draft_ppt_outline_handler(args)
 
 
-async def create_ppt_visuals_handler(args: dict) -> dict:
-    """Call the image generator and format the response."""
-
+def _visual_args(args: dict) -> tuple[str, str | None, int]:
     topic: str = args.get("topic", "未指定主题")
     narrative: str | None = args.get("narrative") or None
     slides: int = max(1, int(args.get("slides") or settings.default_slide_count))
+    return topic, narrative, slides
+
+
+async def _lookup_cache(prompts: list[str]) -> tuple[list[str], list[dict | None]]:
+    keys = [image_cache.make_key(image_client.model, image_client.size, prompt) for prompt in prompts]
+    images: list[dict | None] = []
+    for key in keys:
+        cached = await image_cache.get(key)
+        if cached is not None and not await _still_stored(cached):
+            cached = None
+        images.append({**cached, "cached": True} if cached is not None else None)
+    return keys, images
+
+
+async def _still_stored(item: dict) -> bool:
+    """False when the image store has since evicted the file a cached result points at."""
+
+    digest = (item.get("image") or {}).get("digest")
+    return digest is None or await asyncio.to_thread(image_client.store.path_for, digest) is not None
+
+
+async def _store_result(key: str, item: dict) -> None:
+    if item.get("status", "succeeded") == "succeeded":
+        await image_cache.set(key, item)
+
+
+async def generate_with_cache(prompts: list[str]) -> list[dict]:
+    """Serve prompts from the image cache and only generate the misses."""
+
+    keys, images = await _lookup_cache(prompts)
+    missing = [idx for idx, item in enumerate(images) if item is None]
+    if missing:
+        generated = await image_client.generate_images([prompts[idx] for idx in missing])
+        for idx, item in zip(missing, generated):
+            images[idx] = item
+            await _store_result(keys[idx], item)
+    return [item for item in images if item is not None]
+
+
+async def stream_ppt_visuals_handler(args: dict) -> AsyncIterator[dict]:
+    """Yield one ``slide`` event per image as soon as it is ready, then a ``summary``."""
+
+    topic, narrative, slides = _visual_args(args)
+    prompts = build_slide_prompts(topic, narrative, slides)
+    keys, images = await _lookup_cache(prompts)
+
+    for idx, item in enumerate(images):
+        if item is not None:
+            yield {"type": "slide", "index": idx, **item}
+
+    missing = [idx for idx, item in enumerate(images) if item is None]
+    with tracer.span("skill.stream_ppt_visuals", slides=slides, cached=slides - len(missing)):
+        if missing:
+            async for position, item in image_client.iter_images([prompts[idx] for idx in missing]):
+                idx = missing[position]
+                images[idx] = item
+                await _store_result(keys[idx], item)
+                yield {"type": "slide", "index": idx, **item}
+
+    failed = sum(1 for item in images if item and item.get("status") == "failed")
+    yield {
+        "type": "summary",
+        "topic": topic,
+        "narrative": narrative,
+        "slides": slides,
+        "succeeded": slides - failed,
+        "failed": failed,
+        "cached": slides - len(missing),
+        "finished_at": datetime.now(timezone.utc).isoformat(),
+    }
+
+
+def _absolute_url(url: str | None) -> str | None:
+    """Resolve a stored ``/api/images/...`` reference against ``public_base_url`` when one is configured."""
+
+    if url and url.startswith("/") and settings.public_base_url:
+        return settings.public_base_url.rstrip("/") + url
+    return url
+
+
+async def create_ppt_visuals_handler(args: dict) -> dict:
+    """Call the image generator and format the response."""
+
+    topic, narrative, slides = _visual_args(args)
 
     prompts = build_slide_prompts(topic, narrative, slides)
-    images = await image_client.generate_images(prompts)
+    with tracer.span("skill.create_ppt_visuals", slides=slides) as span:
+        images = await generate_with_cache(prompts)
+        if span is not None:
+            span.set(
+                failed=sum(1 for item in images if item.get("status") == "failed"),
+                cached=sum(1 for item in images if item.get("cached")),
+            )
 
     content_blocks = [
         {
@@ -63,6 +150,7 @@ async def create_ppt_visuals_handler(args: dict) -> dict:
                 - 主题: {topic}
                 - 叙述: {narrative or '使用默认叙述'}
                 - 页数: {slides}
+                - 失败: {sum(1 for item in images if item.get("status") == "failed")}
                 - 时间: {datetime.now(timezone.utc).isoformat()}
                 """
             ).strip(),
@@ -71,25 +159,55 @@ async def create_ppt_visuals_handler(args: dict) -> dict:
 
     for item in images:
         caption = item.get("prompt", "")
-        url = item.get("url") or "未提供URL，请查看raw字段"
-        content_blocks.append({"type": "text", "text": f"{caption}\n图像: {url}"})
+        if item.get("status") == "failed":
+            content_blocks.append({"type": "text", "text": f"{caption}\n生成失败: {item.get('error', '未知错误')}"})
+            continue
+        text = f"{caption}\n图像: {_absolute_url(item.get('url')) or '未提供URL'}"
+        if item.get("source_url"):
+            text += f"\n原始链接: {item['source_url']}"
+        content_blocks.append({"type": "text", "text": text})
 
-    return {"content": content_blocks, "raw": images}
+    return {"content": content_blocks, "images": images}
 
 
-@tool(
-    name="create_ppt_visuals",
-    description="调用生图LLM，为每页PPT生成可视化效果草图",
-    input_schema={"topic": str, "slides": int, "narrative": str},
-)
 async def create_ppt_visuals(args: dict) -> dict:
     return await create_ppt_visuals_handler(args)
 
 
+# (name, description, input schema, handler) for each skill exposed to the agent.
+TOOL_SPECS = (
+    (
+        "draft_ppt_outline",
+        "生成PPT的大纲和分镜，帮助明确每页的叙述重点",
+        {"topic": str, "audience": str, "slides": int},
+        draft_ppt_outline,
+    ),
+    (
+        "create_ppt_visuals",
+        "调用生图LLM，为每页PPT生成可视化效果草图",
+        {"topic": str, "slides": int, "narrative": str},
+        create_ppt_visuals,
+    ),
+)
+
+
+def build_tools() -> list[Any]:
+    """Wrap the skills as SDK MCP tools; imports claude-agent-sdk on first call."""
+
+    from claude_agent_sdk import tool
+
+    return [tool(name=name, description=description, input_schema=schema)(handler) for name, description, schema, handler in TOOL_SPECS]
+
+
 __all__ = [
+    "TOOL_SPECS",
+    "build_tools",
     "draft_ppt_outline",
     "draft_ppt_outline_handler",
     "create_ppt_visuals",
     "create_ppt_visuals_handler",
+    "stream_ppt_visuals_handler",
+    "generate_with_cache",
+    "image_cache",
     "image_client",
 ]
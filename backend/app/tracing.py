@@ -0,0 +1,380 @@
+"""Lightweight in-process request tracing.
+
+A request id is minted by :class:`TracingMiddleware` for every HTTP request
+and carried in a context variable through the agent run, the MCP skill
+handlers and both upstream clients. A caller's ``X-Request-ID`` is only
+recorded as the ``client_request_id`` attribute, except when it names a trace
+this server minted and is still serving: that is how the agent's CLI calls to
+``/proxy`` join the agent run's trace. Finished spans are kept in a bounded
+in-memory store for ``/debug/traces`` (at most ``MAX_SPANS_PER_TRACE`` per
+request) and appended to a daily JSONL file under
+``$NANOBEE_WORKSPACES_ROOT/traces`` by a background thread, so the event loop
+never touches the disk. Files older than ``RETENTION_DAYS`` are pruned. Probe
+and scrape paths (``UNTRACED_PATHS``) get a request id but record no spans.
+"""
+from __future__ import annotations
+
+import json
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Awaitable, Iterator, TypeVar
+
+from .config import settings
+
+T = TypeVar("T")
+
+REQUEST_ID_HEADER = "X-Request-ID"
+MAX_REQUEST_ID_LENGTH = 128
+UNTRACED_PATHS = frozenset({"/health", "/metrics", "/proxy/health"})
+# Exported files are looked up and kept for this many days.
+RETENTION_DAYS = 7
+FLUSH_INTERVAL_SECONDS = 1.0
+# Spans waiting for the writer thread; the oldest are dropped if it falls behind.
+MAX_PENDING_SPANS = 10_000
+# Spans kept and exported per request; a runaway loop cannot grow one trace without bound.
+MAX_SPANS_PER_TRACE = 1_000
+PRUNE_INTERVAL_SECONDS = 3600.0
+
+_request_id: ContextVar[str | None] = ContextVar("nanobee_request_id", default=None)
+_current_span: ContextVar["Span | None"] = ContextVar("nanobee_current_span", default=None)
+
+
+@dataclass
+class Span:
+    request_id: str
+    name: str
+    span_id: str = field(default_factory=lambda: uuid.uuid4().hex[:16])
+    parent_id: str | None = None
+    start: float = field(default_factory=time.time)
+    duration_ms: float | None = None
+    status: str = "ok"
+    error: str | None = None
+    attributes: dict[str, Any] = field(default_factory=dict)
+    _started: float = field(default_factory=time.perf_counter, repr=False)
+
+    def set(self, **attributes: Any) -> None:
+        self.attributes.update(attributes)
+
+    def to_dict(self) -> dict[str, Any]:
+        data = asdict(self)
+        data.pop("_started")
+        return data
+
+
+def current_request_id() -> str | None:
+    return _request_id.get()
+
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex
+
+
+class Tracer:
+    """Collects spans per request id and exports them as JSONL."""
+
+    def __init__(self, root: Path, enabled: bool = True, max_traces: int = 200) -> None:
+        self.root = Path(root)
+        self.enabled = enabled
+        self.max_traces = max(1, max_traces)
+        self._traces: OrderedDict[str, list[dict[str, Any]]] = OrderedDict()
+        self._open: dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._pending: list[dict[str, Any]] = []
+        self._write_lock = threading.Lock()
+        self._writer: threading.Thread | None = None
+        self._stopping = threading.Event()
+        self._last_prune = 0.0
+        self.dropped_spans = 0
+
+    @classmethod
+    def from_settings(cls) -> "Tracer":
+        return cls(
+            Path(settings.workspaces_root) / "traces",
+            enabled=settings.tracing_enabled,
+            max_traces=settings.trace_memory_requests,
+        )
+
+    @contextmanager
+    def request(self, request_id: str | None = None) -> Iterator[str]:
+        """Bind a server-side request id (minted when omitted) for the duration of the block."""
+
+        request_id = request_id or new_request_id()
+        previous_id, previous_span = _request_id.get(), _current_span.get()
+        _request_id.set(request_id)
+        _current_span.set(None)
+        with self._lock:
+            self._open[request_id] = self._open.get(request_id, 0) + 1
+        try:
+            yield request_id
+        finally:
+            with self._lock:
+                if self._open[request_id] > 1:
+                    self._open[request_id] -= 1
+                else:
+                    del self._open[request_id]
+            _request_id.set(previous_id)
+            _current_span.set(previous_span)
+
+    def in_flight(self, request_id: str | None) -> str | None:
+        """``request_id`` if it names a request this process is serving right now, else None."""
+
+        with self._lock:
+            return request_id if request_id in self._open else None
+
+    @contextmanager
+    def span(self, name: str, **attributes: Any) -> Iterator[Span | None]:
+        """Time a block as a child of the current span; a no-op outside a request."""
+
+        request_id = _request_id.get()
+        if not self.enabled or request_id is None:
+            yield None
+            return
+
+        parent = _current_span.get()
+        span = Span(request_id, name, parent_id=parent.span_id if parent else None, attributes=dict(attributes))
+        # set/restore rather than reset(token): spans also wrap async generator
+        # bodies, which may be finalised from a different context.
+        _current_span.set(span)
+        try:
+            yield span
+        except BaseException as exc:
+            span.status = "cancelled" if exc.__class__.__name__ == "CancelledError" else "error"
+            span.error = str(exc) or exc.__class__.__name__
+            raise
+        finally:
+            _current_span.set(parent)
+            span.duration_ms = round((time.perf_counter() - span._started) * 1000, 3)
+            self._record(span)
+
+    async def run(self, request_id: str, name: str, awaitable: Awaitable[T], **attributes: Any) -> T:
+        """Await ``awaitable`` inside its own request context, e.g. for background jobs."""
+
+        with self.request(request_id), self.span(name, **attributes):
+            return await awaitable
+
+    def _record(self, span: Span) -> None:
+        data = span.to_dict()
+        with self._lock:
+            spans = self._traces.get(span.request_id)
+            if spans is None:
+                spans = self._traces[span.request_id] = []
+                while len(self._traces) > self.max_traces:
+                    self._traces.popitem(last=False)
+            else:
+                self._traces.move_to_end(span.request_id)
+            if len(spans) >= MAX_SPANS_PER_TRACE:
+                self.dropped_spans += 1
+                return
+            spans.append(data)
+        self._export(data)
+
+    def _export_path(self, day: datetime) -> Path:
+        return self.root / f"spans-{day.strftime('%Y%m%d')}.jsonl"
+
+    def _export(self, data: dict[str, Any]) -> None:
+        with self._lock:
+            self._pending.append(data)
+            if len(self._pending) > MAX_PENDING_SPANS:
+                del self._pending[: len(self._pending) - MAX_PENDING_SPANS]
+            if (self._writer is None or not self._writer.is_alive()) and not self._stopping.is_set():
+                self._writer = threading.Thread(target=self._write_loop, name="trace-writer", daemon=True)
+                self._writer.start()
+
+    def _write_loop(self) -> None:
+        while not self._stopping.wait(FLUSH_INTERVAL_SECONDS):
+            self.flush()
+
+    def close(self) -> None:
+        """Stop and join the writer thread, then write what is still buffered; blocking."""
+
+        with self._lock:
+            writer = self._writer
+            self._stopping.set()
+        if writer is not None:
+            writer.join()
+        self.flush()
+        with self._lock:
+            # The next app start (tests run several) gets a fresh writer on its first span.
+            self._writer = None
+            self._stopping.clear()
+
+    def flush(self) -> None:
+        """Append buffered spans to their daily files; called by the writer thread and at shutdown."""
+
+        with self._write_lock:
+            with self._lock:
+                pending, self._pending = self._pending, []
+            by_path: dict[Path, list[str]] = {}
+            for data in pending:
+                day = datetime.fromtimestamp(data["start"], tz=timezone.utc)
+                by_path.setdefault(self._export_path(day), []).append(json.dumps(data, ensure_ascii=False, default=repr) + "\n")
+            try:
+                if by_path:
+                    self.root.mkdir(parents=True, exist_ok=True)
+                for path, lines in by_path.items():
+                    with path.open("a", encoding="utf-8") as handle:
+                        handle.writelines(lines)
+                if time.monotonic() - self._last_prune >= PRUNE_INTERVAL_SECONDS:
+                    self._last_prune = time.monotonic()
+                    self._prune()
+            except OSError:
+                pass
+
+    def _prune(self) -> None:
+        if not self.root.exists():
+            return
+        cutoff = self._export_path(datetime.now(timezone.utc) - timedelta(days=RETENTION_DAYS)).name
+        for path in self.root.glob("spans-*.jsonl"):
+            # Names sort by date, so anything before the cutoff name is out of the lookup window.
+            if path.name < cutoff:
+                path.unlink(missing_ok=True)
+
+    def recent(self, limit: int = 50) -> list[dict[str, Any]]:
+        with self._lock:
+            items = list(self._traces.items())[-limit:]
+        summaries = []
+        for request_id, spans in reversed(items):
+            start = min(span["start"] for span in spans)
+            end = max(span["start"] + (span["duration_ms"] or 0) / 1000 for span in spans)
+            summaries.append({"request_id": request_id, "spans": len(spans), "start": start, "duration_ms": round((end - start) * 1000, 3)})
+        return summaries
+
+    def get(self, request_id: str) -> list[dict[str, Any]]:
+        """Spans for ``request_id`` from memory, falling back to the JSONL export.
+
+        The fallback reads files; call it off the event loop.
+        """
+
+        with self._lock:
+            spans = list(self._traces.get(request_id, []))
+        if spans or not self.root.exists():
+            return spans
+        for path in sorted(self.root.glob("spans-*.jsonl"), reverse=True)[:RETENTION_DAYS]:
+            try:
+                with path.open(encoding="utf-8") as handle:
+                    for line in handle:
+                        if request_id in line:
+                            data = json.loads(line)
+                            if data.get("request_id") == request_id:
+                                spans.append(data)
+            except (OSError, ValueError):
+                continue
+            if spans:
+                break
+        return spans
+
+    def waterfall(self, request_id: str) -> dict[str, Any] | None:
+        spans = self.get(request_id)
+        if not spans:
+            return None
+        spans.sort(key=lambda span: span["start"])
+        origin = spans[0]["start"]
+        by_id = {span["span_id"]: span for span in spans}
+
+        def depth(span: dict[str, Any]) -> int:
+            level, parent = 0, by_id.get(span.get("parent_id"))
+            while parent is not None and level < len(spans):
+                level += 1
+                parent = by_id.get(parent.get("parent_id"))
+            return level
+
+        rows = [
+            {
+                "name": span["name"],
+                "span_id": span["span_id"],
+                "parent_id": span["parent_id"],
+                "depth": depth(span),
+                "offset_ms": round((span["start"] - origin) * 1000, 3),
+                "duration_ms": span["duration_ms"],
+                "status": span["status"],
+                "error": span["error"],
+                "attributes": span["attributes"],
+            }
+            for span in spans
+        ]
+        total = max(row["offset_ms"] + (row["duration_ms"] or 0) for row in rows)
+        return {"request_id": request_id, "duration_ms": round(total, 3), "spans": rows}
+
+
+def render_waterfall(trace: dict[str, Any], width: int = 60) -> str:
+    """Plain-text bars for a :meth:`Tracer.waterfall` result."""
+
+    total = trace["duration_ms"] or 1.0
+    lines = [f"request {trace['request_id']}  {trace['duration_ms']:.1f} ms"]
+    label_width = max((len(row["name"]) + 2 * row["depth"] for row in trace["spans"]), default=0)
+    for row in trace["spans"]:
+        start = int(row["offset_ms"] / total * width)
+        length = max(1, int((row["duration_ms"] or 0) / total * width))
+        bar = " " * start + "█" * min(length, width - start)
+        label = ("  " * row["depth"] + row["name"]).ljust(label_width)
+        marker = "" if row["status"] == "ok" else f"  [{row['status']}]"
+        lines.append(f"{label} |{bar.ljust(width)}| {row['offset_ms']:>9.1f} +{row['duration_ms'] or 0:>9.1f} ms{marker}")
+    return "\n".join(lines) + "\n"
+
+
+class TracingMiddleware:
+    """ASGI middleware binding a server-minted request id and a root span to each HTTP request.
+
+    Paths in ``UNTRACED_PATHS`` only get the request id header, so health
+    probes and metric scrapes do not evict real traces.
+
+    Implemented at the ASGI level so the root span and the context variable
+    also cover streaming response bodies.
+    """
+
+    def __init__(self, app: Any, tracer: "Tracer | None" = None) -> None:
+        self.app = app
+        self._tracer = tracer
+
+    @property
+    def tracer(self) -> Tracer:
+        return self._tracer or tracer
+
+    async def __call__(self, scope: dict, receive: Any, send: Any) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        header = REQUEST_ID_HEADER.lower().encode()
+        incoming = next((value.decode("latin-1") for key, value in scope.get("headers", []) if key == header), None)
+        tracer = self.tracer
+        with tracer.request(tracer.in_flight(incoming)) as request_id:
+            scope.setdefault("state", {})["request_id"] = request_id
+            path = scope.get("path")
+            attributes: dict[str, Any] = {"method": scope.get("method"), "path": path}
+            if incoming and incoming != request_id:
+                attributes["client_request_id"] = incoming[:MAX_REQUEST_ID_LENGTH]
+            traced = tracer.span("http", **attributes) if path not in UNTRACED_PATHS else nullcontext()
+            with traced as span:
+
+                async def send_with_id(message: dict) -> None:
+                    if message["type"] == "http.response.start":
+                        headers = list(message.get("headers", []))
+                        headers.append((header, request_id.encode("latin-1")))
+                        message = {**message, "headers": headers}
+                        if span is not None:
+                            span.set(status_code=message.get("status"))
+                    await send(message)
+
+                await self.app(scope, receive, send_with_id)
+
+
+tracer = Tracer.from_settings()
+
+__all__ = [
+    "REQUEST_ID_HEADER",
+    "Span",
+    "Tracer",
+    "TracingMiddleware",
+    "UNTRACED_PATHS",
+    "current_request_id",
+    "render_waterfall",
+    "tracer",
+]
@@ -0,0 +1,580 @@
+"""PPT workflow behind ``/api/ppt/*``: references, outline, slide content and images.
+
+Stages overlap instead of running back to back. The outline is drafted in
+``OUTLINE_ROUNDS`` concurrent rounds, every section's slide content is
+written in parallel, and in :func:`run_pipeline` a slide's image is requested
+as soon as that slide's content exists rather than after the whole deck.
+
+Text comes from the configured text model through the in-process proxy
+(:mod:`app.proxy.local`). Model failures surface as :class:`TextModelError`;
+the built-in section templates are only used when a request sets
+``use_templates``, which skips the text model entirely.
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import logging
+import math
+import re
+from typing import Any, AsyncIterator
+from urllib.parse import quote
+
+from pydantic import BaseModel, Field, ValidationError
+
+from . import skills
+from .config import settings
+from .deck_export import ExportPalette
+from .proxy import api as proxy_api
+from .proxy import local as proxy_local
+from .tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+OUTLINE_SECTIONS = 5
+OUTLINE_ROUNDS = 3
+MAX_CONTENT_SLIDES = 14
+TEXT_MAX_TOKENS = 1024
+
+# (source, search URL template, what the search page lists), most authoritative first.
+REFERENCE_SOURCES = (
+    ("维基百科", "https://zh.wikipedia.org/w/index.php?search={q}", "百科条目"),
+    ("中国知网", "https://kns.cnki.net/kns8s/search?kw={q}", "中文学术论文"),
+    ("Google Scholar", "https://scholar.google.com/scholar?q={q}", "国际学术文献"),
+    ("arXiv", "https://arxiv.org/search/?query={q}&searchtype=all", "预印本论文"),
+    ("百度百科", "https://baike.baidu.com/search?word={q}", "中文词条"),
+    ("36氪", "https://www.36kr.com/search/articles/{q}", "产业报道"),
+    ("知乎", "https://www.zhihu.com/search?type=content&q={q}", "问答与讨论"),
+)
+
+SECTION_TEMPLATES = (
+    ("{topic}：背景与定义", ("{topic}的基本概念与范围", "为什么现在值得关注", "关键术语与衡量指标")),
+    ("发展历程与关键节点", ("起源与早期探索", "关键突破与标志性事件", "当前所处阶段")),
+    ("核心技术与方法", ("主流技术路线", "关键能力与局限", "与相邻领域的关系")),
+    ("典型应用与案例", ("代表性应用场景", "落地案例与成效", "可复用的经验")),
+    ("挑战与未来展望", ("现存问题与风险", "未来发展趋势", "行动建议")),
+)
+
+PALETTES = (
+    ExportPalette(primary="#1e3a8a", secondary="#475569", accent="#f59e0b"),
+    ExportPalette(primary="#065f46", secondary="#4b5563", accent="#f97316"),
+    ExportPalette(primary="#7c2d12", secondary="#57534e", accent="#0ea5e9"),
+    ExportPalette(primary="#4c1d95", secondary="#52525b", accent="#22c55e"),
+    ExportPalette(primary="#0f172a", secondary="#334155", accent="#e11d48"),
+)
+
+
+class ReferenceArticle(BaseModel):
+    title: str
+    url: str
+    summary: str = ""
+    source: str = ""
+    rank: int = 0
+    kind: str = Field(default="article", description="article 为具体文章，search 为站内搜索入口")
+
+
+class OutlineSection(BaseModel):
+    title: str
+    bullets: list[str] = Field(default_factory=list)
+
+
+class SlideReply(BaseModel):
+    """Shape the text model is asked to return for one slide."""
+
+    bullets: list[str] = Field(default_factory=list)
+    keywords: str = ""
+    sources: list[int] = Field(default_factory=list)
+
+
+class SlideContent(BaseModel):
+    title: str
+    bullets: list[str] = Field(default_factory=list)
+    palette: ExportPalette = Field(default_factory=ExportPalette)
+    keywords: str = ""
+    style_prompt: str = ""
+    sources: list[int] = Field(default_factory=list)
+
+
+class SlideImage(BaseModel):
+    title: str
+    style_seed: str
+    model: str
+    url: str | None = None
+    status: str = "succeeded"
+    error: str | None = None
+
+
+class SearchRequest(BaseModel):
+    topic: str = Field(..., description="PPT主题")
+    limit: int = Field(default=6, ge=1, description="参考资料条数")
+
+
+class OutlineRequest(BaseModel):
+    topic: str = Field(..., description="PPT主题")
+    references: list[ReferenceArticle] = Field(default_factory=list, description="参考资料")
+    use_templates: bool = Field(default=False, description="不调用文本模型，使用内置章节模板")
+
+
+class SlidesRequest(BaseModel):
+    topic: str = Field(..., description="PPT主题")
+    outline: list[OutlineSection] = Field(..., min_length=1, description="大纲章节")
+    references: list[ReferenceArticle] = Field(default_factory=list, description="参考资料")
+    style_prompt: str = Field(default="", description="文案与视觉风格")
+    use_templates: bool = Field(default=False, description="不调用文本模型，页面沿用大纲要点")
+
+
+class ImagesRequest(BaseModel):
+    topic: str = Field(default="", description="PPT主题")
+    slides: list[SlideContent] = Field(..., min_length=1, description="需要配图的页面")
+
+
+class PipelineRequest(BaseModel):
+    topic: str = Field(..., description="PPT主题")
+    style_prompt: str = Field(default="", description="文案与视觉风格")
+    limit: int = Field(default=6, ge=1, description="参考资料条数")
+    use_templates: bool = Field(default=False, description="不调用文本模型，使用内置章节模板")
+
+
+# --------------------------------------------------------------------------- text model
+
+
+class TextModelError(RuntimeError):
+    """The text model is not configured or its call failed."""
+
+
+async def _complete_json(stage: str, prompt: str) -> Any | None:
+    """Ask the text model for JSON; ``None`` when the reply holds none.
+
+    Raises :class:`TextModelError` without proxy credentials or when the call fails.
+    """
+
+    if not proxy_api.proxy_config.has_openai_credentials():
+        raise TextModelError("未配置文本模型凭据")
+    request = {
+        "model": settings.default_text_model,
+        "max_tokens": TEXT_MAX_TOKENS,
+        "system": settings.system_prompt,
+        "messages": [{"role": "user", "content": prompt}],
+    }
+    with tracer.span("workflow.text", stage=stage) as span:
+        try:
+            response = await proxy_local.create_message(request)
+        except Exception as exc:
+            logger.warning("text model call for %s failed: %s", stage, exc)
+            if span is not None:
+                span.status, span.error = "error", str(exc)
+            raise TextModelError(f"文本模型调用失败: {exc}") from exc
+    text = "".join(block.get("text", "") for block in response.get("content", []) if block.get("type") == "text")
+    return parse_json_reply(text)
+
+
+def parse_json_reply(text: str) -> Any | None:
+    """Extract the JSON value from a model reply, tolerating code fences and chatter."""
+
+    match = re.search(r"[\[{]", text)
+    if match is None:
+        return None
+    try:
+        value, _ = json.JSONDecoder().raw_decode(text[match.start():])
+    except ValueError:
+        return None
+    return value
+
+
+def _reference_lines(references: list[ReferenceArticle]) -> str:
+    """Search entry points are listed by title only; their pages are not article content."""
+
+    lines = [
+        f"[{ref.rank}] {ref.title}" + ("（检索入口）" if ref.kind == "search" else f"：{ref.summary}")
+        for ref in references
+    ]
+    return "\n".join(lines) or "（无）"
+
+
+# --------------------------------------------------------------------------- references
+
+
+def search_references(topic: str, limit: int = 6) -> list[ReferenceArticle]:
+    """Search entry points on authoritative sources, ranked by authority.
+
+    No search is run: each result is a link to the source's own search page
+    for ``topic`` (``kind="search"``), built rather than generated so every
+    one of them resolves.
+    """
+
+    query = quote(topic)
+    return [
+        ReferenceArticle(
+            title=f"在{source}搜索「{topic}」",
+            url=url.format(q=query),
+            summary=f"检索入口：{source}站内搜索结果，列出与{topic}相关的{listing}，需自行查阅具体内容。",
+            source=source,
+            rank=rank,
+            kind="search",
+        )
+        for rank, (source, url, listing) in enumerate(REFERENCE_SOURCES[: max(1, limit)], start=1)
+    ]
+
+
+# --------------------------------------------------------------------------- outline
+
+
+def _round_ranges(total: int, rounds: int) -> list[tuple[int, int]]:
+    size = math.ceil(total / rounds)
+    return [(start, min(start + size, total)) for start in range(0, total, size)]
+
+
+def _default_sections(topic: str, start: int, end: int) -> list[OutlineSection]:
+    return [
+        OutlineSection(title=title.format(topic=topic), bullets=[bullet.format(topic=topic) for bullet in bullets])
+        for title, bullets in SECTION_TEMPLATES[start:end]
+    ]
+
+
+async def _outline_round(
+    topic: str, references: list[ReferenceArticle], start: int, end: int, use_templates: bool = False
+) -> list[OutlineSection]:
+    if use_templates:
+        return _default_sections(topic, start, end)
+    with tracer.span("workflow.outline_round", sections=end - start):
+        reply = await _complete_json(
+            "outline",
+            f"主题：{topic}\n参考资料：\n{_reference_lines(references)}\n\n"
+            f"PPT 共 {OUTLINE_SECTIONS} 个章节，请只写第 {start + 1} 到第 {end} 章。"
+            '以 JSON 数组返回，每项形如 {"title": "章节标题", "bullets": ["要点", ...]}，每章 3 个要点，不要输出其他内容。',
+        )
+        if isinstance(reply, list) and len(reply) >= end - start:
+            try:
+                return [OutlineSection.model_validate(item) for item in reply[: end - start]]
+            except ValidationError:
+                pass
+        raise TextModelError(f"文本模型未返回第 {start + 1}-{end} 章的有效大纲")
+
+
+async def _iter_rounds(
+    topic: str, references: list[ReferenceArticle], ranges: list[tuple[int, int]], use_templates: bool = False
+) -> AsyncIterator[tuple[int, int, list[OutlineSection] | Exception]]:
+    """Run every outline round concurrently and yield ``(round, start, sections)`` as each finishes."""
+
+    async def run(number: int, start: int, end: int) -> tuple[int, int, list[OutlineSection] | Exception]:
+        try:
+            return number, start, await _outline_round(topic, references, start, end, use_templates)
+        except Exception as exc:
+            logger.warning("outline round %s failed: %s", number, exc)
+            return number, start, exc
+
+    tasks = [asyncio.ensure_future(run(number, start, end)) for number, (start, end) in enumerate(ranges, start=1)]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def stream_outline(
+    topic: str, references: list[ReferenceArticle], use_templates: bool = False
+) -> AsyncIterator[dict[str, Any]]:
+    """Outline events: ``progress`` per round, ``partial`` as each round lands, then ``complete``.
+
+    ``partial`` events arrive in completion order and carry the ``start``
+    position of their sections; the closing event holds the ordered outline.
+    Failed rounds turn it into ``partial_complete``, or ``error`` when none
+    succeeded. ``use_templates`` fills every round from ``SECTION_TEMPLATES``.
+    """
+
+    ranges = _round_ranges(OUTLINE_SECTIONS, OUTLINE_ROUNDS)
+    for number, (start, end) in enumerate(ranges, start=1):
+        chapters = f"{start + 1}-{end}" if end - start > 1 else f"{end}"
+        yield {"type": "progress", "round": number, "message": f"正在生成第 {chapters} 章"}
+
+    sections: dict[int, OutlineSection] = {}
+    failed: list[str] = []
+    async for number, start, result in _iter_rounds(topic, references, ranges, use_templates):
+        if isinstance(result, Exception):
+            failed.append(f"第{number}轮: {result}")
+            continue
+        sections.update((start + offset, section) for offset, section in enumerate(result))
+        yield {
+            "type": "partial",
+            "round": number,
+            "start": start,
+            "sections": [section.model_dump() for section in result],
+            "message": f"第{number}轮完成，新增 {len(result)} 个章节",
+        }
+
+    outline = [sections[idx].model_dump() for idx in sorted(sections)]
+    if not outline:
+        yield {"type": "error", "error": "；".join(failed)}
+    elif failed:
+        yield {"type": "partial_complete", "outline": outline, "message": f"{len(failed)} 轮生成失败，已生成 {len(outline)} 个章节"}
+    else:
+        yield {"type": "complete", "outline": outline, "message": f"大纲生成完成，共 {len(outline)} 个章节"}
+
+
+async def build_outline(
+    topic: str, references: list[ReferenceArticle], use_templates: bool = False
+) -> list[OutlineSection]:
+    """The ordered outline; raises :class:`TextModelError` when every round failed."""
+
+    outline: list[dict[str, Any]] = []
+    async for event in stream_outline(topic, references, use_templates):
+        if event["type"] == "error":
+            raise TextModelError(event["error"])
+        outline = event.get("outline", outline)
+    return [OutlineSection.model_validate(section) for section in outline]
+
+
+# --------------------------------------------------------------------------- slides
+
+
+def deck_palette(topic: str, style_prompt: str) -> ExportPalette:
+    """One palette per deck, so every slide and image shares the same colours."""
+
+    digest = hashlib.sha256(f"{topic}\n{style_prompt}".encode("utf-8")).digest()
+    return PALETTES[digest[0] % len(PALETTES)]
+
+
+async def write_slide(
+    topic: str,
+    section: OutlineSection,
+    index: int,
+    references: list[ReferenceArticle],
+    style_prompt: str,
+    palette: ExportPalette,
+    use_templates: bool = False,
+) -> SlideContent:
+    """One slide from the text model; ``use_templates`` keeps the section's own bullets."""
+
+    ranks = {ref.rank for ref in references}
+    reply = None
+    with tracer.span("workflow.slide", index=index):
+        if not use_templates:
+            reply = await _complete_json(
+                "slide",
+                f"主题：{topic}\n章节：{section.title}\n要点：{'；'.join(section.bullets)}\n风格：{style_prompt or '简洁商务'}\n"
+                f"参考资料：\n{_reference_lines(references)}\n\n"
+                '请把该章节扩写为一页 PPT，以 JSON 对象返回：{"bullets": ["3-5 条精炼要点"], "keywords": "逗号分隔的关键词", '
+                '"sources": [引用的参考编号]}，不要输出其他内容。',
+            )
+    try:
+        parsed = SlideReply.model_validate(reply) if reply is not None else SlideReply()
+    except ValidationError:
+        logger.warning("slide %s reply has an unexpected shape, using the outline", index)
+        parsed = SlideReply()
+    bullets = [item for item in parsed.bullets if item.strip()]
+    keywords = parsed.keywords
+    sources = [item for item in parsed.sources if item in ranks]
+    if not sources and references:
+        sources = [references[index % len(references)].rank]
+    return SlideContent(
+        title=section.title,
+        bullets=bullets or section.bullets,
+        palette=palette,
+        keywords=keywords or f"{topic}、{section.title}",
+        style_prompt=style_prompt,
+        sources=sources,
+    )
+
+
+def reference_slide(references: list[ReferenceArticle], style_prompt: str, palette: ExportPalette) -> SlideContent:
+    return SlideContent(
+        title="参考资料",
+        bullets=[f"[{ref.rank}] {ref.title}" for ref in references],
+        palette=palette,
+        keywords="参考文献",
+        style_prompt=style_prompt,
+        sources=[ref.rank for ref in references],
+    )
+
+
+async def write_slides(
+    topic: str,
+    outline: list[OutlineSection],
+    references: list[ReferenceArticle],
+    style_prompt: str,
+    use_templates: bool = False,
+) -> list[SlideContent]:
+    """Write every section's slide concurrently, then append the reference index page."""
+
+    palette = deck_palette(topic, style_prompt)
+    slides = list(
+        await asyncio.gather(
+            *(
+                write_slide(topic, section, idx, references, style_prompt, palette, use_templates)
+                for idx, section in enumerate(outline[:MAX_CONTENT_SLIDES])
+            )
+        )
+    )
+    if references:
+        slides.append(reference_slide(references, style_prompt, palette))
+    return slides
+
+
+# --------------------------------------------------------------------------- images
+
+
+def style_seed(topic: str, slide: SlideContent) -> str:
+    """Label for a deck's visual style, derived from the topic, style prompt and palette.
+
+    Only returned to callers so they can group images; the image API takes
+    no seed or reference image, so it is not sent upstream.
+    """
+
+    canonical = json.dumps([topic, slide.style_prompt, slide.palette.model_dump()], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:12]
+
+
+def slide_image_prompt(topic: str, slide: SlideContent) -> str:
+    palette = slide.palette
+    return (
+        f"16:9 PPT 页面插图。主题：{topic or slide.title}。本页：{slide.title}。关键词：{slide.keywords}。"
+        f"风格：{slide.style_prompt or '简洁商务'}。配色：主色 {palette.primary}，辅色 {palette.secondary}，"
+        f"强调色 {palette.accent}。不添加水印与文字。"
+    )
+
+
+async def render_images(topic: str, slides: list[SlideContent]) -> list[SlideImage]:
+    """Generate one image per slide through the shared image cache and client."""
+
+    seeds = [style_seed(topic, slide) for slide in slides]
+    prompts = [slide_image_prompt(topic, slide) for slide in slides]
+    results = await skills.generate_with_cache(prompts)
+    return [
+        SlideImage(
+            title=slide.title,
+            style_seed=seed,
+            model=skills.image_client.model,
+            url=result.get("url"),
+            status=result.get("status", "succeeded"),
+            error=result.get("error"),
+        )
+        for slide, seed, result in zip(slides, seeds, results)
+    ]
+
+
+def anchor_style(anchor: SlideContent, slide: SlideContent) -> SlideContent:
+    """``slide`` restyled with the anchor's palette and style prompt."""
+
+    return slide.model_copy(update={"palette": anchor.palette, "style_prompt": anchor.style_prompt})
+
+
+async def stream_deck_images(
+    topic: str, slides: list[SlideContent], concurrency: int | None = None
+) -> AsyncIterator[dict[str, Any]]:
+    """Render a whole deck in the first slide's style.
+
+    Every slide takes over the first slide's palette and style prompt; the
+    prompt is all the image request carries, so nothing from the first render
+    feeds the others and all slides start at once with at most
+    ``concurrency`` (``deck_image_concurrency`` by default) in flight. Yields
+    ``image`` events in completion order, then ``done``.
+    """
+
+    anchor = slides[0]
+    limit = asyncio.Semaphore(max(1, concurrency or settings.deck_image_concurrency))
+
+    async def render(index: int, slide: SlideContent) -> tuple[int, SlideImage]:
+        async with limit:
+            (image,) = await render_images(topic, [anchor_style(anchor, slide)])
+        return index, image
+
+    with tracer.span("workflow.deck_images", slides=len(slides)):
+        images: list[SlideImage] = []
+        tasks = [asyncio.ensure_future(render(idx, slide)) for idx, slide in enumerate(slides)]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                index, image = await next_done
+                images.append(image)
+                yield {"type": "image", "index": index, "image": image.model_dump()}
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    failed = sum(1 for image in images if image.status == "failed")
+    yield {"type": "done", "style_seed": style_seed(topic, anchor), "images": len(images) - failed, "failed": failed}
+
+
+# --------------------------------------------------------------------------- pipeline
+
+
+async def run_pipeline(request: PipelineRequest) -> AsyncIterator[dict[str, Any]]:
+    """Topic to illustrated deck as one event stream.
+
+    Emits ``references``, the outline events of :func:`stream_outline`, then
+    ``slide`` and ``image`` events keyed by slide ``index`` in completion
+    order, and finally ``done``. Slide content starts as each outline round
+    lands and each image as soon as its slide is written, at most
+    ``deck_image_concurrency`` at a time. Every slide shares the deck
+    palette and style prompt.
+    """
+
+    topic, style_prompt, use_templates = request.topic, request.style_prompt, request.use_templates
+    references = search_references(topic, request.limit)
+    yield {"type": "references", "references": [ref.model_dump() for ref in references]}
+
+    palette = deck_palette(topic, style_prompt)
+    queue: asyncio.Queue[dict[str, Any] | None] = asyncio.Queue()
+    children: list[asyncio.Task] = []
+    image_limit = asyncio.Semaphore(max(1, settings.deck_image_concurrency))
+
+    async def slide_and_image(index: int, section: OutlineSection) -> SlideImage:
+        slide = await write_slide(topic, section, index, references, style_prompt, palette, use_templates)
+        await queue.put({"type": "slide", "index": index, "slide": slide.model_dump()})
+        async with image_limit:
+            (image,) = await render_images(topic, [slide])
+        await queue.put({"type": "image", "index": index, "image": image.model_dump()})
+        return image
+
+    async def drive() -> None:
+        try:
+            async for event in stream_outline(topic, references, use_templates):
+                await queue.put(event)
+                if event["type"] != "partial":
+                    continue
+                for offset, section in enumerate(event["sections"]):
+                    index = event["start"] + offset
+                    if index < MAX_CONTENT_SLIDES:
+                        children.append(asyncio.create_task(slide_and_image(index, OutlineSection.model_validate(section))))
+            images = await asyncio.gather(*children)
+            slides = len(children)
+            if references:
+                slide = reference_slide(references, style_prompt, palette)
+                await queue.put({"type": "slide", "index": OUTLINE_SECTIONS, "slide": slide.model_dump()})
+                slides += 1
+            failed = sum(1 for image in images if image.status == "failed")
+            await queue.put({"type": "done", "slides": slides, "images": len(images) - failed, "failed": failed})
+        finally:
+            await queue.put(None)
+
+    with tracer.span("workflow.pipeline"):
+        driver = asyncio.create_task(drive())
+        try:
+            while (event := await queue.get()) is not None:
+                yield event
+            await driver
+        finally:
+            for task in (driver, *children):
+                task.cancel()
+
+
+__all__ = [
+    "ImagesRequest",
+    "OutlineRequest",
+    "OutlineSection",
+    "PipelineRequest",
+    "ReferenceArticle",
+    "SearchRequest",
+    "SlideContent",
+    "SlideImage",
+    "SlidesRequest",
+    "TextModelError",
+    "build_outline",
+    "render_images",
+    "run_pipeline",
+    "search_references",
+    "stream_deck_images",
+    "stream_outline",
+    "write_slides",
+]
@@ -0,0 +1 @@
+"""Benchmarks for the NanoBee backend (run as ``python -m benchmarks.<name>`` from ``backend/``)."""
@@ -0,0 +1,188 @@
+"""Per-turn overhead of the proxy over loopback HTTP versus the in-process path.
+
+The upstream is replaced by an instant canned completion, so the numbers are
+pure proxy overhead: for HTTP that is JSON encoding, uvicorn, FastAPI
+validation and the response round trip; for ``app.proxy.local`` only the
+conversion, scheduler and response conversion remain. Each turn carries a
+realistic agent request (system prompt, the PPT tools and a multi-turn
+history); the response cache is bypassed (temperature 1).
+
+Usage (from ``backend/``)::
+
+    python -m benchmarks.bench_local_proxy --turns 500
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Awaitable, Callable
+
+import httpx
+from fastapi import FastAPI
+from openai.types.chat import ChatCompletionChunk
+
+from app.config import settings
+from app.proxy import api, local
+from app.skills import TOOL_SPECS
+from app.tracing import TracingMiddleware
+
+from .load_test import RESULTS_DIR, MockServer, _free_port, percentile
+
+_JSON_TYPES = {str: "string", int: "integer"}
+_CHUNK_BASE = {"id": "chatcmpl-bench", "object": "chat.completion.chunk", "created": 0, "model": "bench"}
+
+
+def build_turn(history: int) -> dict[str, Any]:
+    """An agent turn shaped like the CLI's: system prompt, tools and ``history`` prior exchanges."""
+
+    tools = [
+        {
+            "name": name,
+            "description": description,
+            "input_schema": {
+                "type": "object",
+                "properties": {key: {"type": _JSON_TYPES[kind]} for key, kind in schema.items()},
+                "required": list(schema),
+            },
+        }
+        for name, description, schema, _ in TOOL_SPECS
+    ]
+    messages: list[dict[str, Any]] = []
+    for idx in range(history):
+        messages.append({"role": "user", "content": f"第{idx}轮：请继续完善演示文稿，补充第{idx}页的要点与配图说明。" * 4})
+        messages.append({"role": "assistant", "content": [{"type": "text", "text": f"第{idx}页已完成：" + "要点说明，" * 40}]})
+    messages.append({"role": "user", "content": "请生成最后一页的总结。"})
+    return {
+        "model": settings.default_text_model or "claude-3-5-sonnet",
+        "max_tokens": 1024,
+        "temperature": 1,
+        "system": settings.system_prompt * 4,
+        "tools": tools,
+        "messages": messages,
+    }
+
+
+def install_instant_upstream(reply_tokens: int) -> None:
+    """Answer every upstream call immediately with a canned completion or stream."""
+
+    text = "总结要点。" * reply_tokens
+    completion = {
+        "id": "chatcmpl-bench",
+        "choices": [{"message": {"content": text}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": 1000, "completion_tokens": reply_tokens, "total_tokens": 1000 + reply_tokens},
+    }
+    chunks = [
+        ChatCompletionChunk.model_validate({**_CHUNK_BASE, "choices": [{"index": 0, "delta": {"content": "总结要点。"}, "finish_reason": None}]})
+        for _ in range(reply_tokens)
+    ]
+    chunks.append(ChatCompletionChunk.model_validate({**_CHUNK_BASE, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}))
+
+    async def create_chat_completion(request: dict[str, Any], request_id: str | None = None, admission: Any = None) -> dict[str, Any]:
+        return completion
+
+    async def create_chat_completion_stream(request: dict[str, Any], request_id: str | None = None, admission: Any = None) -> AsyncIterator[Any]:
+        for chunk in chunks:
+            yield chunk
+
+    api.proxy_config.openai_api_key = api.proxy_config.openai_api_key or "bench-key"
+    api.proxy_config.anthropic_api_key = ""
+    api.openai_client.create_chat_completion = create_chat_completion
+    api.openai_client.create_chat_completion_stream = create_chat_completion_stream
+
+
+def proxy_app() -> FastAPI:
+    app = FastAPI()
+    app.include_router(api.router, prefix="/proxy")
+    app.add_middleware(TracingMiddleware)
+    return app
+
+
+async def _time_turns(turns: int, warmup: int, call: Callable[[], Awaitable[Any]]) -> list[float]:
+    for _ in range(warmup):
+        await call()
+    samples = []
+    for _ in range(turns):
+        started = time.perf_counter()
+        await call()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def _summary(samples: list[float]) -> dict[str, float]:
+    return {
+        "mean_us": round(statistics.fmean(samples) * 1e6, 1),
+        "p50_us": round((percentile(samples, 50) or 0) * 1e6, 1),
+        "p95_us": round((percentile(samples, 95) or 0) * 1e6, 1),
+    }
+
+
+async def run(turns: int, warmup: int, body: dict[str, Any]) -> dict[str, Any]:
+    port = _free_port()
+    streaming = {**body, "stream": True}
+    with MockServer(proxy_app(), port):
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=30) as http:
+
+            async def http_turn() -> None:
+                response = await http.post("/proxy/v1/messages", json=body)
+                response.raise_for_status()
+                response.json()
+
+            async def http_stream_turn() -> None:
+                async with http.stream("POST", "/proxy/v1/messages", json=streaming) as response:
+                    response.raise_for_status()
+                    async for _ in response.aiter_text():
+                        pass
+
+            async def local_turn() -> None:
+                await local.create_message(body)
+
+            async def local_stream_turn() -> None:
+                async for _ in local.stream_message(streaming):
+                    pass
+
+            results = {
+                "http": _summary(await _time_turns(turns, warmup, http_turn)),
+                "local": _summary(await _time_turns(turns, warmup, local_turn)),
+                "http_stream": _summary(await _time_turns(turns, warmup, http_stream_turn)),
+                "local_stream": _summary(await _time_turns(turns, warmup, local_stream_turn)),
+            }
+    for mode in ("", "_stream"):
+        results[f"speedup{mode}"] = round(results[f"http{mode}"]["mean_us"] / results[f"local{mode}"]["mean_us"], 2)
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=500)
+    parser.add_argument("--warmup", type=int, default=50)
+    parser.add_argument("--history", type=int, default=10, help="prior exchanges in each request")
+    parser.add_argument("--reply-tokens", type=int, default=200)
+    args = parser.parse_args()
+
+    install_instant_upstream(args.reply_tokens)
+    body = build_turn(args.history)
+    results = asyncio.run(run(args.turns, args.warmup, body))
+
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S")
+    report = {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {**vars(args), "request_bytes": len(json.dumps(body, ensure_ascii=False).encode("utf-8"))},
+        "results": results,
+    }
+    output = RESULTS_DIR / f"local-proxy-{stamp}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+    print(f"saved {output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
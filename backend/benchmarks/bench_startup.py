@@ -0,0 +1,121 @@
+"""Cold-start cost of the backend: ``import app.main`` and time to a healthy ``/health``.
+
+Each measurement runs in a fresh interpreter so nothing is already imported.
+Heavy SDKs (OpenAI, claude-agent-sdk and the MCP stack) must stay out of the
+import path; they are loaded on first use. The median import time is checked
+against ``--budget`` and the exit status is non-zero when it is exceeded, so
+the script can gate CI. ``tests/test_app.py`` enforces the same budget.
+
+Usage (from ``backend/``)::
+
+    python -m benchmarks.bench_startup --runs 5
+    python -m benchmarks.bench_startup --runs 3 --skip-server --budget 1.0
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any
+
+from .load_test import BACKEND_ROOT, RESULTS_DIR, _free_port, start_backend
+
+IMPORT_BUDGET_SECONDS = 1.5
+DEFERRED_MODULES = ("openai", "claude_agent_sdk", "mcp", "tiktoken", "pptx")
+
+_IMPORT_SNIPPET = """
+import json, sys, time
+started = time.perf_counter()
+import app.main
+elapsed = time.perf_counter() - started
+print(json.dumps({"seconds": elapsed, "loaded": [name for name in %r if name in sys.modules]}))
+""" % (DEFERRED_MODULES,)
+
+
+def _environment(workspaces: str) -> dict[str, str]:
+    return {**os.environ, "NANOBEE_WORKSPACES_ROOT": workspaces}
+
+
+def measure_import() -> dict[str, Any]:
+    """Import ``app.main`` in a fresh interpreter; returns seconds and deferred modules that got loaded."""
+
+    with tempfile.TemporaryDirectory() as workspaces:
+        output = subprocess.run(
+            [sys.executable, "-c", _IMPORT_SNIPPET],
+            cwd=BACKEND_ROOT,
+            env=_environment(workspaces),
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def measure_ready() -> float:
+    """Seconds from spawning uvicorn until ``/health`` answers 200."""
+
+    with tempfile.TemporaryDirectory() as workspaces:
+        started = time.perf_counter()
+        process = start_backend(_environment(workspaces), _free_port())
+        elapsed = time.perf_counter() - started
+        process.terminate()
+        process.wait(timeout=10)
+    return elapsed
+
+
+def _summary(values: list[float]) -> dict[str, float]:
+    return {
+        "median_ms": round(statistics.median(values) * 1000, 1),
+        "min_ms": round(min(values) * 1000, 1),
+        "max_ms": round(max(values) * 1000, 1),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget", type=float, default=IMPORT_BUDGET_SECONDS, help="median import budget in seconds")
+    parser.add_argument("--skip-server", action="store_true", help="only measure the import, not uvicorn readiness")
+    parser.add_argument("--output", type=Path, help="result file (default: benchmarks/results/startup-<timestamp>.json)")
+    args = parser.parse_args()
+
+    imports = [measure_import() for _ in range(args.runs)]
+    loaded = sorted({name for run in imports for name in run["loaded"]})
+    result: dict[str, Any] = {"import": _summary([run["seconds"] for run in imports]), "deferred_modules_loaded": loaded}
+    if not args.skip_server:
+        result["ready"] = _summary([measure_ready() for _ in range(args.runs)])
+
+    median = result["import"]["median_ms"] / 1000
+    result["budget_ms"] = args.budget * 1000
+    result["within_budget"] = median <= args.budget and not loaded
+
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S")
+    report = {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {"runs": args.runs},
+        "results": result,
+    }
+    output = args.output or RESULTS_DIR / f"startup-{stamp}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+    print(json.dumps(result, indent=2, ensure_ascii=False))
+    print(f"saved {output}", file=sys.stderr)
+
+    if loaded:
+        print(f"deferred modules imported eagerly: {', '.join(loaded)}", file=sys.stderr)
+    if not result["within_budget"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""CPU cost per streamed token of the OpenAI -> Claude SSE pipeline.
+
+Compares the legacy string pipeline (``model_dump`` + ``json.dumps`` in the
+client, ``json.loads`` in the converter, full re-parse of tool arguments on
+every delta) with the typed-chunk pipeline used by the proxy today.
+
+Usage (from ``backend/``)::
+
+    python -m benchmarks.bench_stream_converter --tokens 4000 --repeat 5
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import time
+from typing import Any, AsyncIterator
+
+from openai.types.chat import ChatCompletionChunk
+
+from app.proxy.conversion.response_converter import convert_openai_streaming_to_claude
+from app.proxy.models.claude import ClaudeMessagesRequest
+
+from ._legacy_stream import legacy_convert_openai_streaming_to_claude, serialize_chunks
+
+logger = logging.getLogger("bench")
+
+
+def build_chunks(text_tokens: int, arg_tokens: int) -> list[ChatCompletionChunk]:
+    base = {"id": "chatcmpl-bench", "object": "chat.completion.chunk", "created": 0, "model": "bench"}
+    chunks = [
+        ChatCompletionChunk.model_validate(
+            {**base, "choices": [{"index": 0, "delta": {"content": f"词{idx} "}, "finish_reason": None}]}
+        )
+        for idx in range(text_tokens)
+    ]
+    chunks.append(
+        ChatCompletionChunk.model_validate(
+            {
+                **base,
+                "choices": [
+                    {
+                        "index": 0,
+                        "delta": {"tool_calls": [{"index": 0, "id": "call_1", "function": {"name": "create_ppt_visuals", "arguments": ""}}]},
+                        "finish_reason": None,
+                    }
+                ],
+            }
+        )
+    )
+    fragments = ['{"outline": "'] + [f"第{idx}节 " for idx in range(arg_tokens)] + ['"}']
+    for fragment in fragments:
+        chunks.append(
+            ChatCompletionChunk.model_validate(
+                {
+                    **base,
+                    "choices": [
+                        {"index": 0, "delta": {"tool_calls": [{"index": 0, "function": {"arguments": fragment}}]}, "finish_reason": None}
+                    ],
+                }
+            )
+        )
+    chunks.append(ChatCompletionChunk.model_validate({**base, "choices": [{"index": 0, "delta": {}, "finish_reason": "tool_calls"}]}))
+    return chunks
+
+
+async def _replay(chunks: list[ChatCompletionChunk]) -> AsyncIterator[ChatCompletionChunk]:
+    for chunk in chunks:
+        yield chunk
+
+
+async def _drain(frames: AsyncIterator[str]) -> int:
+    count = 0
+    async for _ in frames:
+        count += 1
+    return count
+
+
+async def run_legacy(chunks: list[ChatCompletionChunk], request: ClaudeMessagesRequest) -> int:
+    return await _drain(legacy_convert_openai_streaming_to_claude(serialize_chunks(_replay(chunks)), request, logger))
+
+
+async def run_typed(chunks: list[ChatCompletionChunk], request: ClaudeMessagesRequest) -> int:
+    return await _drain(convert_openai_streaming_to_claude(_replay(chunks), request, logger))
+
+
+def measure(runner, chunks: list[ChatCompletionChunk], request: ClaudeMessagesRequest, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.process_time()
+        asyncio.run(runner(chunks, request))
+        best = min(best, time.process_time() - started)
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tokens", type=int, default=2000, help="text delta chunks per stream")
+    parser.add_argument("--arg-tokens", type=int, default=2000, help="tool argument fragments per stream")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    chunks = build_chunks(args.tokens, args.arg_tokens)
+    request = ClaudeMessagesRequest(model="claude-3-5-sonnet", max_tokens=1024, messages=[{"role": "user", "content": "hi"}])
+    results = {}
+    for name, runner in (("legacy", run_legacy), ("typed", run_typed)):
+        cpu_seconds = measure(runner, chunks, request, args.repeat)
+        results[name] = {"cpu_seconds": round(cpu_seconds, 4), "cpu_us_per_chunk": round(cpu_seconds / len(chunks) * 1e6, 2)}
+    results["speedup"] = round(results["legacy"]["cpu_seconds"] / max(results["typed"]["cpu_seconds"], 1e-9), 2)
+    results["chunks"] = len(chunks)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
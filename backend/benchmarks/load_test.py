@@ -0,0 +1,370 @@
+"""End-to-end load test of the NanoBee backend against local mock upstreams.
+
+Starts :mod:`benchmarks.mock_upstreams` in-process, launches the backend with
+uvicorn in a subprocess pointed at it, then drives each scenario at a fixed
+concurrency and reports throughput, latency percentiles, time to first byte
+and the server's resident memory. Results are written as JSON; pass a
+previous result file with ``--baseline`` to print regressions side by side.
+
+Scenarios:
+
+* ``proxy`` / ``proxy_stream`` - ``POST /proxy/v1/messages`` (non-streaming / SSE)
+* ``visuals`` - ``POST /skills/visuals`` with ``--slides`` images per request
+* ``agent`` - ``POST /agent/run``; needs the Claude Code CLI, which is routed
+  back through the backend's own proxy so it also only hits the mocks
+
+Usage (from ``backend/``)::
+
+    python -m benchmarks.load_test --concurrency 16 --requests 200
+    python -m benchmarks.load_test --scenarios proxy_stream --tokens-per-second 50 \\
+        --baseline benchmarks/results/load-20240101T000000.json
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable
+
+import httpx
+
+from .mock_upstreams import add_config_arguments, config_from_args, create_mock_app
+
+BACKEND_ROOT = Path(__file__).resolve().parents[1]
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+CLIENT_KEY = "bench-client-key"
+SCENARIOS = ("proxy", "proxy_stream", "visuals", "agent")
+DEFAULT_SCENARIOS = ("proxy", "proxy_stream", "visuals")
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def percentile(values: list[float], pct: float) -> float | None:
+    """Linear-interpolated percentile; ``None`` for an empty sample."""
+
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * pct / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def read_rss_bytes(pid: int) -> int | None:
+    try:
+        with open(f"/proc/{pid}/status", encoding="ascii") as handle:
+            for line in handle:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        return None
+    return None
+
+
+class RssSampler:
+    def __init__(self, pid: int | None, interval: float = 0.1) -> None:
+        self.pid = pid
+        self.interval = interval
+        self.samples: list[int] = []
+        self._task: asyncio.Task | None = None
+
+    async def _run(self) -> None:
+        while True:
+            rss = read_rss_bytes(self.pid) if self.pid else None
+            if rss is not None:
+                self.samples.append(rss)
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> dict[str, float | None]:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        if not self.samples:
+            return {"start_mb": None, "peak_mb": None, "end_mb": None}
+        mb = 1024 * 1024
+        return {
+            "start_mb": round(self.samples[0] / mb, 1),
+            "peak_mb": round(max(self.samples) / mb, 1),
+            "end_mb": round(self.samples[-1] / mb, 1),
+        }
+
+
+@dataclass
+class Sample:
+    latency: float
+    ttfb: float | None
+    ok: bool
+    status: int | None = None
+    error: str | None = None
+
+
+@dataclass
+class Scenario:
+    name: str
+    path: str
+    build: Callable[[int], dict[str, Any]]
+    headers: dict[str, str] = field(default_factory=dict)
+
+
+def build_scenarios(slides: int) -> dict[str, Scenario]:
+    def message(idx: int, stream: bool) -> dict[str, Any]:
+        return {
+            "model": "claude-3-5-sonnet-20241022",
+            "max_tokens": 256,
+            "stream": stream,
+            "messages": [{"role": "user", "content": f"Benchmark request {idx}: summarise the quarterly plan."}],
+        }
+
+    proxy_headers = {"x-api-key": CLIENT_KEY, "anthropic-version": "2023-06-01"}
+    return {
+        "proxy": Scenario("proxy", "/proxy/v1/messages", lambda idx: message(idx, False), proxy_headers),
+        "proxy_stream": Scenario("proxy_stream", "/proxy/v1/messages", lambda idx: message(idx, True), proxy_headers),
+        # distinct topics so the image cache and single-flight do not collapse the load
+        "visuals": Scenario("visuals", "/skills/visuals", lambda idx: {"topic": f"基准测试主题 {idx}", "slides": slides}),
+        "agent": Scenario("agent", "/agent/run", lambda idx: {"prompt": f"为“基准测试 {idx}”写一个三页的大纲"}),
+    }
+
+
+async def send(client: httpx.AsyncClient, scenario: Scenario, idx: int) -> Sample:
+    started = time.perf_counter()
+    ttfb = None
+    try:
+        async with client.stream("POST", scenario.path, json=scenario.build(idx), headers=scenario.headers) as response:
+            async for _ in response.aiter_raw():
+                if ttfb is None:
+                    ttfb = time.perf_counter() - started
+            ok = response.status_code < 400
+            return Sample(time.perf_counter() - started, ttfb, ok, response.status_code, None if ok else f"HTTP {response.status_code}")
+    except httpx.HTTPError as exc:
+        return Sample(time.perf_counter() - started, ttfb, False, None, f"{exc.__class__.__name__}: {exc}")
+
+
+async def run_scenario(
+    client: httpx.AsyncClient, scenario: Scenario, concurrency: int, total: int, server_pid: int | None
+) -> dict[str, Any]:
+    samples: list[Sample] = []
+    next_idx = 0
+
+    async def worker() -> None:
+        nonlocal next_idx
+        while next_idx < total:
+            idx = next_idx
+            next_idx += 1
+            samples.append(await send(client, scenario, idx))
+
+    sampler = RssSampler(server_pid)
+    sampler.start()
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(max(1, concurrency))))
+    elapsed = time.perf_counter() - started
+    rss = await sampler.stop()
+    return summarise(scenario.name, samples, elapsed, concurrency, rss)
+
+
+def _ms(value: float | None) -> float | None:
+    return None if value is None else round(value * 1000, 2)
+
+
+def summarise(name: str, samples: list[Sample], elapsed: float, concurrency: int, rss: dict[str, Any]) -> dict[str, Any]:
+    ok = [sample for sample in samples if sample.ok]
+    latencies = [sample.latency for sample in ok]
+    ttfbs = [sample.ttfb for sample in ok if sample.ttfb is not None]
+    errors: dict[str, int] = {}
+    for sample in samples:
+        if not sample.ok:
+            errors[sample.error or "unknown"] = errors.get(sample.error or "unknown", 0) + 1
+    return {
+        "scenario": name,
+        "concurrency": concurrency,
+        "requests": len(samples),
+        "succeeded": len(ok),
+        "failed": len(samples) - len(ok),
+        "errors": errors,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(ok) / elapsed, 2) if elapsed else None,
+        "latency_ms": {f"p{pct}": _ms(percentile(latencies, pct)) for pct in (50, 95, 99)},
+        "ttfb_ms": {f"p{pct}": _ms(percentile(ttfbs, pct)) for pct in (50, 95, 99)},
+        "rss": rss,
+    }
+
+
+class MockServer:
+    """Runs the mock upstream app on a background uvicorn thread."""
+
+    def __init__(self, app: Any, port: int) -> None:
+        import uvicorn
+
+        self.port = port
+        self.server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    def __enter__(self) -> "MockServer":
+        self.thread.start()
+        deadline = time.monotonic() + 10
+        while not self.server.started:
+            if time.monotonic() > deadline:
+                raise RuntimeError("mock upstream server did not start")
+            time.sleep(0.02)
+        return self
+
+    def __exit__(self, *_exc: Any) -> None:
+        self.server.should_exit = True
+        self.thread.join(timeout=5)
+
+
+def backend_env(mock_port: int, backend_port: int, workspaces: str) -> dict[str, str]:
+    env = {key: value for key, value in os.environ.items() if key != "OPENAI_UPSTREAMS"}
+    mock = f"http://127.0.0.1:{mock_port}"
+    env.update(
+        {
+            "OPENAI_API_KEY": "mock-openai-key",
+            "OPENAI_BASE_URL": f"{mock}/v1",
+            "ANTHROPIC_API_KEY": CLIENT_KEY,
+            "ANTHROPIC_BASE_URL": f"http://127.0.0.1:{backend_port}/proxy",
+            "NANOBEE_IMAGE_API_BASE_URL": mock,
+            "NANOBEE_IMAGE_API_PATH": "/images",
+            "NANOBEE_IMAGE_API_KEY": "mock-image-key",
+            "NANOBEE_IMAGE_CACHE_ENABLED": "false",
+            "NANOBEE_WORKSPACES_ROOT": workspaces,
+        }
+    )
+    return env
+
+
+def start_backend(env: dict[str, str], port: int) -> subprocess.Popen:
+    command = [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"]
+    process = subprocess.Popen(command, cwd=BACKEND_ROOT, env=env)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"backend exited during startup with code {process.returncode}")
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/health", timeout=1).status_code == 200:
+                return process
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError("backend did not become healthy within 60s")
+
+
+def compare(results: list[dict[str, Any]], baseline: dict[str, Any]) -> list[str]:
+    previous = {item["scenario"]: item for item in baseline.get("results", [])}
+    lines = []
+    for item in results:
+        before = previous.get(item["scenario"])
+        if not before:
+            continue
+        for label, now, then in (
+            ("throughput_rps", item["throughput_rps"], before["throughput_rps"]),
+            ("p95_ms", item["latency_ms"]["p95"], before["latency_ms"]["p95"]),
+            ("ttfb_p95_ms", item["ttfb_ms"]["p95"], before["ttfb_ms"]["p95"]),
+            ("peak_rss_mb", item["rss"]["peak_mb"], before["rss"]["peak_mb"]),
+        ):
+            if now is None or not then:
+                continue
+            lines.append(f"{item['scenario']:>13} {label:<15} {then:>10} -> {now:<10} ({(now - then) / then:+.1%})")
+    return lines
+
+
+async def drive(base_url: str, args: argparse.Namespace, server_pid: int | None) -> list[dict[str, Any]]:
+    scenarios = build_scenarios(args.slides)
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    results = []
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+        for name in args.scenarios:
+            scenario = scenarios[name]
+            if args.warmup:
+                await run_scenario(client, scenario, min(args.concurrency, args.warmup), args.warmup, None)
+            result = await run_scenario(client, scenario, args.concurrency, args.requests, server_pid)
+            results.append(result)
+            print(
+                f"{name:>13}: {result['throughput_rps']} req/s, p50 {result['latency_ms']['p50']} ms, "
+                f"p95 {result['latency_ms']['p95']} ms, ttfb p50 {result['ttfb_ms']['p50']} ms, "
+                f"failed {result['failed']}/{result['requests']}",
+                file=sys.stderr,
+            )
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default=",".join(DEFAULT_SCENARIOS), help=f"comma separated subset of {','.join(SCENARIOS)}")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=100, help="requests per scenario")
+    parser.add_argument("--warmup", type=int, default=5, help="unmeasured requests before each scenario")
+    parser.add_argument("--slides", type=int, default=4, help="images per /skills/visuals request")
+    parser.add_argument("--timeout", type=float, default=300.0)
+    parser.add_argument("--target", help="benchmark an already running backend instead of spawning one (mocks are not started)")
+    parser.add_argument("--output", type=Path, help="result file (default: benchmarks/results/load-<timestamp>.json)")
+    parser.add_argument("--baseline", type=Path, help="previous result file to compare against")
+    add_config_arguments(parser)
+    args = parser.parse_args()
+    args.scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = sorted(set(args.scenarios) - set(SCENARIOS))
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(unknown)}")
+
+    mock_config = config_from_args(args)
+    if args.target:
+        results = asyncio.run(drive(args.target.rstrip("/"), args, None))
+    else:
+        mock_port, backend_port = _free_port(), _free_port()
+        with MockServer(create_mock_app(mock_config), mock_port), tempfile.TemporaryDirectory() as workspaces:
+            process = start_backend(backend_env(mock_port, backend_port, workspaces), backend_port)
+            try:
+                results = asyncio.run(drive(f"http://127.0.0.1:{backend_port}", args, process.pid))
+            finally:
+                process.terminate()
+                process.wait(timeout=10)
+
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S")
+    report = {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {
+            "scenarios": args.scenarios,
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "slides": args.slides,
+            "target": args.target,
+            "mock": vars(mock_config),
+        },
+        "results": results,
+    }
+    output = args.output or RESULTS_DIR / f"load-{stamp}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+    print(f"saved {output}", file=sys.stderr)
+
+    if args.baseline:
+        for line in compare(results, json.loads(args.baseline.read_text(encoding="utf-8"))):
+            print(line, file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""Local stand-ins for the OpenAI-compatible chat endpoint and the image endpoint.
+
+The load-test harness points the proxy and the image client at this app so
+runs measure NanoBee itself rather than a remote provider. Latency and token
+rate are configurable so the same run can model a fast or a slow upstream.
+
+Standalone usage (from ``backend/``)::
+
+    python -m benchmarks.mock_upstreams --port 9100 --latency-ms 200 --tokens-per-second 80
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Any, AsyncIterator
+
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+
+@dataclass
+class MockUpstreamConfig:
+    latency_ms: float = 150.0
+    tokens_per_second: float = 100.0
+    completion_tokens: int = 64
+    image_latency_ms: float = 400.0
+    image_path: str = "/images"
+
+
+def _completion_id() -> str:
+    return f"chatcmpl-mock-{uuid.uuid4().hex[:12]}"
+
+
+def _usage(prompt_tokens: int, completion_tokens: int) -> dict[str, int]:
+    return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens}
+
+
+def _prompt_tokens(body: dict[str, Any]) -> int:
+    return max(1, len(json.dumps(body.get("messages", []), ensure_ascii=False)) // 4)
+
+
+def create_mock_app(config: MockUpstreamConfig | None = None) -> FastAPI:
+    config = config or MockUpstreamConfig()
+    app = FastAPI(title="NanoBee mock upstreams")
+    app.state.config = config
+    app.state.requests = {"chat": 0, "chat_stream": 0, "images": 0}
+
+    async def token_stream(body: dict[str, Any]) -> AsyncIterator[str]:
+        created = int(time.time())
+        base = {"id": _completion_id(), "object": "chat.completion.chunk", "created": created, "model": body.get("model", "mock")}
+        interval = 1.0 / config.tokens_per_second if config.tokens_per_second > 0 else 0.0
+        await asyncio.sleep(config.latency_ms / 1000)
+        role = {**base, "choices": [{"index": 0, "delta": {"role": "assistant", "content": ""}, "finish_reason": None}]}
+        yield f"data: {json.dumps(role)}\n\n"
+        for idx in range(config.completion_tokens):
+            chunk = {**base, "choices": [{"index": 0, "delta": {"content": f"token{idx} "}, "finish_reason": None}]}
+            yield f"data: {json.dumps(chunk)}\n\n"
+            if interval:
+                await asyncio.sleep(interval)
+        done = {**base, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+        yield f"data: {json.dumps(done)}\n\n"
+        if (body.get("stream_options") or {}).get("include_usage"):
+            usage = {**base, "choices": [], "usage": _usage(_prompt_tokens(body), config.completion_tokens)}
+            yield f"data: {json.dumps(usage)}\n\n"
+        yield "data: [DONE]\n\n"
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request) -> Any:
+        body = await request.json()
+        if body.get("stream"):
+            app.state.requests["chat_stream"] += 1
+            return StreamingResponse(token_stream(body), media_type="text/event-stream")
+
+        app.state.requests["chat"] += 1
+        generation = config.completion_tokens / config.tokens_per_second if config.tokens_per_second > 0 else 0.0
+        await asyncio.sleep(config.latency_ms / 1000 + generation)
+        text = " ".join(f"token{idx}" for idx in range(config.completion_tokens))
+        return {
+            "id": _completion_id(),
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "mock"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+            "usage": _usage(_prompt_tokens(body), config.completion_tokens),
+        }
+
+    @app.post(config.image_path)
+    async def images(request: Request) -> dict[str, Any]:
+        body = await request.json()
+        app.state.requests["images"] += 1
+        await asyncio.sleep(config.image_latency_ms / 1000)
+        digest = uuid.uuid5(uuid.NAMESPACE_URL, str(body.get("prompt", ""))).hex
+        return {"created": int(time.time()), "data": [{"url": f"https://mock.invalid/images/{digest}.png"}]}
+
+    @app.get("/stats")
+    async def stats() -> dict[str, int]:
+        return dict(app.state.requests)
+
+    return app
+
+
+def add_config_arguments(parser: argparse.ArgumentParser) -> None:
+    defaults = MockUpstreamConfig()
+    parser.add_argument("--latency-ms", type=float, default=defaults.latency_ms, help="chat upstream latency before the first token")
+    parser.add_argument("--tokens-per-second", type=float, default=defaults.tokens_per_second, help="chat upstream token rate (0 = unthrottled)")
+    parser.add_argument("--completion-tokens", type=int, default=defaults.completion_tokens, help="tokens per chat completion")
+    parser.add_argument("--image-latency-ms", type=float, default=defaults.image_latency_ms, help="image upstream latency")
+
+
+def config_from_args(args: argparse.Namespace) -> MockUpstreamConfig:
+    return MockUpstreamConfig(
+        latency_ms=args.latency_ms,
+        tokens_per_second=args.tokens_per_second,
+        completion_tokens=args.completion_tokens,
+        image_latency_ms=args.image_latency_ms,
+    )
+
+
+def main() -> None:
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    add_config_arguments(parser)
+    args = parser.parse_args()
+    uvicorn.run(create_mock_app(config_from_args(args)), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
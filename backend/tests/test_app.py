@@ -1,7 +1,12 @@
+import asyncio
+import json
 import sys
+import time
 from pathlib import Path
+from types import SimpleNamespace
 from typing import Any, AsyncIterator
 
+import httpx
 import pytest
 from fastapi.testclient import TestClient
 
@@ -9,25 +14,43 @@ ROOT = Path(__file__).resolve().parents[1]
 if str(ROOT) not in sys.path:
     sys.path.append(str(ROOT))
 
-from app import agent, skills  # noqa: E402
+from app import agent, main, skills, tracing  # noqa: E402
+from app.image_cache import ImageResultCache  # noqa: E402
+from app.config import settings  # noqa: E402
+from app.deck_export import DeckExporter  # noqa: E402
+from app.image_client import ImageGenerationClient  # noqa: E402
+from app.image_store import ImageStore  # noqa: E402
+from app.jobs import JobManager, QueueFullError  # noqa: E402
 from app.main import app
 
 
 @pytest.fixture(autouse=True)
-def restore_modules(monkeypatch):
+def restore_modules(monkeypatch, tmp_path):
     """Restore patched objects after each test."""
 
-    original_query = agent.query
-    original_result_message = agent.ResultMessage
+    monkeypatch.setattr(skills, "image_cache", ImageResultCache(tmp_path / "image-cache"))
+    monkeypatch.setattr(main.job_manager, "root", tmp_path / "jobs")
+    monkeypatch.setattr(tracing.tracer, "root", tmp_path / "traces")
+    monkeypatch.setattr(settings, "workspaces_root", str(tmp_path / "workspaces"))
+    monkeypatch.setattr(skills.image_client, "store", ImageStore.from_settings())
+    monkeypatch.setattr(main, "exporter", DeckExporter(tmp_path / "exports"))
+
     original_generate_images = skills.image_client.generate_images
 
     yield
 
-    monkeypatch.setattr(agent, "query", original_query, raising=False)
-    monkeypatch.setattr(agent, "ResultMessage", original_result_message, raising=False)
     monkeypatch.setattr(skills.image_client, "generate_images", original_generate_images, raising=False)
 
 
+def patch_sdk(monkeypatch, **overrides: Any) -> None:
+    """Point ``agent._sdk()`` at the real SDK with some names replaced."""
+
+    import claude_agent_sdk
+
+    namespace = SimpleNamespace(**{**vars(claude_agent_sdk), **overrides})
+    monkeypatch.setattr(agent, "_sdk", lambda: namespace)
+
+
 def test_health_endpoint():
     client = TestClient(app)
     response = client.get("/health")
@@ -53,8 +76,7 @@ def test_agent_run_endpoint(monkeypatch):
         yield "message-1"
         yield FakeResult(0.05)
 
-    monkeypatch.setattr(agent, "query", fake_query)
-    monkeypatch.setattr(agent, "ResultMessage", FakeResult)
+    patch_sdk(monkeypatch, query=fake_query, ResultMessage=FakeResult)
 
     client = TestClient(app)
     response = client.post("/agent/run", json={"prompt": "测试"})
@@ -67,11 +89,44 @@ def test_agent_run_endpoint(monkeypatch):
     assert len(data["messages"]) == 2
 
 
+def test_agent_run_stream_endpoint(monkeypatch):
+    from claude_agent_sdk import AssistantMessage, ResultMessage, TextBlock, ToolResultBlock, ToolUseBlock, UserMessage
+
+    async def fake_query(*_args: Any, **_kwargs: Any) -> AsyncIterator[Any]:
+        yield AssistantMessage(
+            content=[TextBlock(text="规划中"), ToolUseBlock(id="t1", name="draft_ppt_outline", input={"topic": "AI"})],
+            model="test",
+        )
+        yield UserMessage(content=[ToolResultBlock(tool_use_id="t1", content="大纲")])
+        yield ResultMessage(
+            subtype="success",
+            duration_ms=5,
+            duration_api_ms=4,
+            is_error=False,
+            num_turns=1,
+            session_id="s",
+            total_cost_usd=0.02,
+        )
+
+    patch_sdk(monkeypatch, query=fake_query)
+
+    client = TestClient(app)
+    response = client.post("/agent/run/stream", json={"prompt": "测试"})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = [json.loads(line[6:]) for line in response.text.splitlines() if line.startswith("data: ")]
+    assert [event["type"] for event in events] == ["text", "tool_call_start", "tool_call_finish", "result", "done"]
+    assert events[1]["name"] == "draft_ppt_outline"
+    assert events[2]["id"] == "t1"
+    assert events[3]["cost"] == 0.02
+
+
 def test_visuals_endpoint(monkeypatch):
     async def fake_generate_images(prompts: list[str]) -> list[dict[str, Any]]:
         results = []
         for idx, prompt in enumerate(prompts):
-            results.append({"prompt": prompt, "url": f"http://example.com/{idx}.png", "raw": {"i": idx}})
+            results.append({"prompt": prompt, "url": f"http://example.com/{idx}.png"})
         return results
 
     monkeypatch.setattr(skills.image_client, "generate_images", fake_generate_images)
@@ -82,6 +137,915 @@ def test_visuals_endpoint(monkeypatch):
 
     assert response.status_code == 200
     data = response.json()
-    assert data["raw"]
-    assert len(data["raw"]) == 2
-    assert all(item["url"].startswith("http://example.com/") for item in data["raw"])
+    assert "raw" not in data
+    assert len(data["images"]) == 2
+    assert all(item["url"].startswith("http://example.com/") for item in data["images"])
+
+
+def test_visuals_served_from_cache(monkeypatch, tmp_path):
+    calls: list[list[str]] = []
+
+    async def fake_generate_images(prompts: list[str]) -> list[dict[str, Any]]:
+        calls.append(prompts)
+        return [{"prompt": prompt, "status": "succeeded", "url": f"http://example.com/{prompt}"} for prompt in prompts]
+
+    monkeypatch.setattr(skills.image_client, "generate_images", fake_generate_images)
+
+    client = TestClient(app)
+    payload = {"topic": "缓存主题", "narrative": "缓存叙述", "slides": 3}
+    first = client.post("/skills/visuals", json=payload).json()
+    second = client.post("/skills/visuals", json=payload).json()
+
+    assert len(calls) == 1 and len(calls[0]) == 3
+    assert [item["url"] for item in second["images"]] == [item["url"] for item in first["images"]]
+    assert all(item["cached"] for item in second["images"])
+    assert skills.image_cache.stats()["hits_memory"] == 3
+
+    # A fresh cache over the same directory is served from the disk tier.
+    disk_cache = ImageResultCache(tmp_path / "image-cache")
+    key = disk_cache.make_key(skills.image_client.model, skills.image_client.size, first["images"][0]["prompt"])
+    assert asyncio.run(disk_cache.get(key))["url"] == first["images"][0]["url"]
+    assert disk_cache.stats()["hits_disk"] == 1
+
+
+def test_image_cache_evicts_by_ttl_and_size(tmp_path, monkeypatch):
+    async def expire() -> None:
+        cache = ImageResultCache(tmp_path, ttl_seconds=60)
+        await cache.set("aa01", {"url": "a"})
+        assert await cache.get("aa01") == {"url": "a"}
+        cache.ttl_seconds = -1
+        assert await cache.get("aa01") is None
+        assert not list(tmp_path.glob("*/aa01.json"))
+
+    async def evict() -> ImageResultCache:
+        cache = ImageResultCache(tmp_path / "small", max_entries=1, max_disk_bytes=120)
+        for idx in range(4):
+            await cache.set(f"bb{idx:02d}", {"url": "x" * 40})
+        return cache
+
+    asyncio.run(expire())
+    scans: list[int] = []
+    original_scan = ImageResultCache._scan
+    monkeypatch.setattr(ImageResultCache, "_scan", lambda self: scans.append(1) or original_scan(self))
+    cache = asyncio.run(evict())
+    assert cache.stats()["evictions"] >= 2
+    assert sum(path.stat().st_size for path in (tmp_path / "small").glob("*/*.json")) <= 120
+    # The directory is listed once; later writes and evictions work from the in-memory index.
+    assert scans == [1]
+
+
+def test_visuals_stream_emits_slides_as_completed(monkeypatch):
+    async def fake_generate_one(_client: Any, prompt: str) -> dict[str, Any]:
+        # Earlier slides finish last so completion order differs from prompt order.
+        slide_number = int(prompt.split(":")[0].split()[-1])
+        await asyncio.sleep(0.01 * (4 - slide_number))
+        if slide_number == 2:
+            return {"prompt": prompt, "status": "failed", "url": None, "error": "upstream 502"}
+        return {"prompt": prompt, "status": "succeeded", "url": f"http://example.com/{slide_number}.png"}
+
+    monkeypatch.setattr(skills.image_client, "_generate_one", fake_generate_one)
+
+    client = TestClient(app)
+    response = client.post("/skills/visuals/stream", json={"topic": "流式主题", "slides": 3})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    events = [json.loads(line) for line in response.text.splitlines()]
+    assert [event["index"] for event in events[:-1]] == [2, 1, 0]
+    assert events[1]["status"] == "failed"
+    assert events[-1]["type"] == "summary"
+    assert events[-1]["succeeded"] == 2 and events[-1]["failed"] == 1
+
+
+def test_lifespan_manages_image_http_client():
+    with TestClient(app) as client:
+        assert client.get("/health").status_code == 200
+        pooled = skills.image_client._http_client
+        assert pooled is not None and not pooled.is_closed
+    assert pooled.is_closed
+    assert skills.image_client._http_client is None
+
+
+def test_generate_images_bounded_and_isolates_failures():
+    in_flight = 0
+    peak = 0
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        prompt = json.loads(request.content)["prompt"]
+        if prompt == "p2":
+            return httpx.Response(502)
+        if prompt == "p3":
+            return httpx.Response(200, json=[{"url": "http://example.com/list.png"}])
+        if prompt == "p4":
+            return httpx.Response(200, json={"data": ["http://example.com/bare.png"]})
+        return httpx.Response(200, json={"url": f"http://example.com/{prompt}.png"})
+
+    client = ImageGenerationClient()
+    client.store.enabled = False
+    client._process_limit = asyncio.Semaphore(2)
+    prompts = [f"p{idx}" for idx in range(6)]
+
+    async def run() -> list[dict[str, Any]]:
+        client._http_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        try:
+            return await client.generate_images(prompts)
+        finally:
+            await client.aclose()
+
+    results = asyncio.run(run())
+
+    assert [item["prompt"] for item in results] == prompts
+    assert [item["status"] for item in results].count("failed") == 2
+    assert results[2]["status"] == "failed"
+    # A 200 whose body is not a JSON object fails that slide only.
+    assert results[3]["status"] == "failed" and "expected an object" in results[3]["error"]
+    assert results[4]["status"] == "succeeded" and results[4]["url"] is None
+    assert results[5]["url"] == "http://example.com/p5.png"
+    assert peak == 2
+
+
+def test_identical_in_flight_prompts_share_one_upstream_call():
+    upstream_prompts: list[str] = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        prompt = json.loads(request.content)["prompt"]
+        upstream_prompts.append(prompt)
+        await asyncio.sleep(0.01)
+        return httpx.Response(200, json={"data": [{"url": f"http://example.com/{prompt}.png"}]})
+
+    client = ImageGenerationClient()
+    client.store.enabled = False
+
+    async def run() -> list[list[dict[str, Any]]]:
+        client._http_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        try:
+            return await asyncio.gather(
+                client.generate_images(["a", "b"]),
+                client.generate_images(["a", "b"]),
+                client.generate_images(["b"]),
+            )
+        finally:
+            await client.aclose()
+
+    first, second, third = asyncio.run(run())
+
+    assert sorted(upstream_prompts) == ["a", "b"]
+    assert first == second
+    assert third[0]["url"] == "http://example.com/b.png"
+    assert client._flights.shared == 3
+    assert client._flights.in_flight() == 0
+
+
+def test_shared_flight_is_cancelled_when_its_last_waiter_leaves():
+    from app.singleflight import SingleFlight
+
+    flights = SingleFlight()
+    work_cancelled = asyncio.Event()
+
+    async def work() -> str:
+        try:
+            await asyncio.sleep(60)
+        except asyncio.CancelledError:
+            work_cancelled.set()
+            raise
+        return "done"
+
+    async def run() -> None:
+        first = asyncio.create_task(flights.do("k", work))
+        second = asyncio.create_task(flights.do("k", work))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        await asyncio.sleep(0.01)
+        # Another caller still waits, so the upstream call keeps going.
+        assert not work_cancelled.is_set() and flights.in_flight() == 1
+        second.cancel()
+        await asyncio.wait_for(work_cancelled.wait(), timeout=1)
+        await asyncio.sleep(0)
+        assert flights.in_flight() == 0
+
+    asyncio.run(run())
+
+
+def test_visual_job_lifecycle(monkeypatch):
+    async def fake_generate_images(prompts: list[str]) -> list[dict[str, Any]]:
+        return [{"prompt": prompt, "status": "succeeded", "url": "http://example.com/x.png"} for prompt in prompts]
+
+    monkeypatch.setattr(skills.image_client, "generate_images", fake_generate_images)
+
+    with TestClient(app) as client:
+        assert client.post("/jobs", json={"kind": "visuals", "payload": {}}).status_code == 422
+        submitted = client.post("/jobs", json={"kind": "visuals", "payload": {"topic": "排队主题", "slides": 2}})
+        assert submitted.status_code == 202
+        job_id = submitted.json()["id"]
+        for _ in range(100):
+            status = client.get(f"/jobs/{job_id}").json()["status"]
+            if status == "succeeded":
+                break
+            time.sleep(0.01)
+        result = client.get(f"/jobs/{job_id}/result")
+        assert result.status_code == 200
+        assert len(result.json()["images"]) == 2
+        assert client.get("/jobs/missing").status_code == 404
+
+
+def test_job_manager_fairness_limits_and_restore(tmp_path):
+    order: list[str] = []
+
+    async def runner(payload: dict) -> str:
+        order.append(payload["name"])
+        await asyncio.sleep(0.01)
+        return payload["name"]
+
+    async def run() -> None:
+        manager = JobManager(tmp_path, {"work": runner}, workers=1, max_queue_depth=10, max_tenant_depth=3)
+        for name in ("a1", "a2", "a3"):
+            await manager.submit("work", {"name": name}, tenant="a")
+        await manager.submit("work", {"name": "b1"}, tenant="b")
+        with pytest.raises(QueueFullError):
+            await manager.submit("work", {"name": "a4"}, tenant="a")
+        cancelled = await manager.submit("work", {"name": "b2"}, tenant="b")
+        await manager.cancel(cancelled.id)
+
+        # A fresh manager over the same directory picks the queued jobs back up.
+        restored = JobManager(tmp_path, {"work": runner}, workers=1)
+        await restored.start()
+        for _ in range(100):
+            if restored.queue_depth() == 0 and restored.running_count() == 0:
+                break
+            await asyncio.sleep(0.01)
+        await restored.stop()
+        assert (await restored.get(cancelled.id)).status == "cancelled"
+
+    asyncio.run(run())
+    assert order == ["a1", "b1", "a2", "a3"]
+
+
+def test_job_manager_drops_finished_jobs_past_cap_and_ttl(tmp_path):
+    stopped: list[str] = []
+
+    async def runner(payload: dict) -> str:
+        if payload.get("block"):
+            try:
+                await asyncio.sleep(10)
+            finally:
+                stopped.append("cleaned-up")
+        return "x" * 100
+
+    async def run() -> list:
+        manager = JobManager(tmp_path, {"work": runner}, workers=1, max_finished=2)
+        await manager.start()
+        jobs = [await manager.submit("work", {}) for _ in range(4)]
+        for _ in range(100):
+            if all(job.status == "succeeded" for job in jobs):
+                break
+            await asyncio.sleep(0.01)
+        blocked = await manager.submit("work", {"block": True})
+        await asyncio.sleep(0.05)
+        await manager.stop()
+        assert stopped == ["cleaned-up"] and blocked.status == "running"
+        return jobs
+
+    jobs = asyncio.run(run())
+    manager = JobManager(tmp_path, {"work": runner}, max_finished=2)
+    assert [asyncio.run(manager.get(job.id)) is None for job in jobs] == [True, True, False, False]
+    assert [(tmp_path / f"{job.id}.json").exists() for job in jobs] == [False, False, True, True]
+
+    manager.result_ttl = -1
+    assert asyncio.run(manager.get(jobs[3].id)) is None
+    assert not (tmp_path / f"{jobs[3].id}.json").exists()
+
+
+def test_metrics_endpoint_exposes_runtime_metrics(monkeypatch):
+    from app.metrics import AGENT_RUN_SECONDS, Histogram
+
+    class FakeResult:
+        total_cost_usd = 0.02
+        is_error = False
+
+    async def fake_query(*_args: Any, **_kwargs: Any) -> AsyncIterator[Any]:
+        yield FakeResult()
+
+    patch_sdk(monkeypatch, query=fake_query, ResultMessage=FakeResult)
+    runs_before = AGENT_RUN_SECONDS.count(status="succeeded")
+
+    client = TestClient(app)
+    assert client.post("/agent/run", json={"prompt": "测试"}).status_code == 200
+    response = client.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    body = response.text
+    assert AGENT_RUN_SECONDS.count(status="succeeded") == runs_before + 1
+    assert "# TYPE nanobee_agent_run_seconds histogram" in body
+    assert 'nanobee_agent_run_cost_usd_bucket{le="0.05"}' in body
+    assert 'nanobee_queue_depth{queue="jobs"} 0' in body
+    assert 'nanobee_cache_hit_ratio{cache="image"} 0' in body
+    assert "nanobee_agent_runs_in_flight 0" in body
+
+    histogram = Histogram("demo_seconds", "demo", ("route",), buckets=(0.1, 1.0))
+    histogram.observe(0.5, route="a")
+    assert histogram.samples() == [
+        'demo_seconds_bucket{route="a",le="0.1"} 0',
+        'demo_seconds_bucket{route="a",le="1"} 1',
+        'demo_seconds_bucket{route="a",le="+Inf"} 1',
+        'demo_seconds_sum{route="a"} 0.5',
+        'demo_seconds_count{route="a"} 1',
+    ]
+
+
+def test_request_trace_waterfall(monkeypatch, tmp_path):
+    async def handler(request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(0.01)
+        return httpx.Response(200, json={"url": "http://example.com/slide.png"})
+
+    monkeypatch.setattr(skills.image_client, "_http_client", httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+
+    monkeypatch.setattr(settings, "admin_token", "ops-token")
+    admin = {"X-Admin-Token": "ops-token"}
+    client = TestClient(app)
+    response = client.post("/skills/visuals", json={"topic": "追踪", "slides": 2}, headers={"X-Request-ID": "trace-test-1"})
+    assert response.status_code == 200
+    # The trace id is minted by the server; the caller's id is only an attribute.
+    request_id = response.headers["x-request-id"]
+    assert request_id != "trace-test-1"
+    assert client.get("/health").headers["x-request-id"] != request_id
+    assert client.get(f"/debug/traces/{request_id}").status_code == 401
+
+    trace = client.get(f"/debug/traces/{request_id}", headers=admin).json()
+    spans = {span["name"]: span for span in trace["spans"]}
+    assert trace["spans"][0]["name"] == "http"
+    assert spans["http"]["attributes"]["client_request_id"] == "trace-test-1"
+    assert spans["skill.create_ppt_visuals"]["parent_id"] == spans["http"]["span_id"]
+    image_posts = [span for span in trace["spans"] if span["name"] == "image.post"]
+    assert len(image_posts) == 2
+    assert all(span["depth"] == 2 and span["duration_ms"] >= 10 for span in image_posts)
+
+    assert "image.post" in client.get(f"/debug/traces/{request_id}", params={"format": "text"}, headers=admin).text
+    assert client.get("/debug/traces/missing", headers=admin).status_code == 404
+    tracing.tracer.close()
+    assert tracing.tracer._writer is None
+    exported = [json.loads(line) for path in (tmp_path / "traces").glob("spans-*.jsonl") for line in path.read_text().splitlines()]
+    assert {span["name"] for span in exported if span["request_id"] == request_id} >= {"http", "image.post"}
+    # Probes keep their request id but record no spans.
+    assert not any(span["attributes"].get("path") == "/health" for span in exported)
+
+    stale = tmp_path / "traces" / "spans-20000101.jsonl"
+    stale.write_text("{}\n")
+    tracing.tracer._prune()
+    assert not stale.exists()
+
+
+def test_trace_ids_join_only_in_flight_server_traces_and_cap_spans(monkeypatch):
+    monkeypatch.setattr(settings, "admin_token", "")
+    monkeypatch.setattr(tracing, "MAX_SPANS_PER_TRACE", 3)
+    tracer = tracing.Tracer(tracing.tracer.root, max_traces=10)
+
+    with tracer.request() as live:
+        assert tracer.in_flight(live) == live
+        for idx in range(5):
+            with tracer.span(f"step-{idx}"):
+                pass
+    assert tracer.in_flight(live) is None and tracer.in_flight("caller-chosen") is None
+    assert [span["name"] for span in tracer.get(live)] == ["step-0", "step-1", "step-2"]
+    assert tracer.dropped_spans == 2
+    tracer.close()
+
+    # Without a token, operator routes refuse non-loopback clients (TestClient reports host "testclient").
+    assert TestClient(app).get("/debug/traces").status_code == 403
+
+
+def test_image_retries_breaker_and_hedging():
+    from app.metrics import IMAGE_HEDGES, IMAGE_RETRIES, IMAGE_SHED
+    from app.resilience import CircuitBreaker, RetryPolicy, parse_retry_after
+
+    assert parse_retry_after("2") == 2.0 and parse_retry_after("soon") is None
+    policy = RetryPolicy(attempts=3, base_delay=1.0, max_delay=1.5, max_retry_after=5)
+    assert 0 <= policy.delay(2) <= 1.5
+    assert policy.delay(1, retry_after=4) == 4 and policy.delay(1, retry_after=60) is None
+    assert policy.delay(3) is None
+
+    calls: list[str] = []
+    responses: dict[str, list[Any]] = {}
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        prompt = json.loads(request.content)["prompt"]
+        calls.append(prompt)
+        outcome = responses[prompt].pop(0)
+        if isinstance(outcome, float):
+            await asyncio.sleep(outcome)
+            return httpx.Response(200, json={"url": f"http://example.com/{prompt}-slow.png"})
+        return outcome
+
+    client = ImageGenerationClient()
+    client.store.enabled = False
+    client.retry_policy = RetryPolicy(attempts=3, base_delay=0.01)
+    retries_before = IMAGE_RETRIES.value(reason="503")
+    shed_before = IMAGE_SHED.value()
+    hedges_before = IMAGE_HEDGES.value(outcome="won")
+    responses["flaky"] = [httpx.Response(503, headers={"Retry-After": "0"}), httpx.Response(200, json={"url": "http://example.com/ok.png"})]
+    responses.update({f"broken-{idx}": [httpx.Response(502)] for idx in range(3)})
+    responses["slow"] = [5.0, httpx.Response(200, json={"url": "http://example.com/slow-hedged.png"})]
+
+    async def run() -> list[dict[str, Any]]:
+        client._http_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        try:
+            flaky = await client.generate_images(["flaky"])
+            client.retry_policy = RetryPolicy(attempts=1)
+            client.breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+            broken = await client.generate_images(["broken-0", "broken-1"])
+            broken += await client.generate_images(["broken-2"])
+            client.breaker = CircuitBreaker()
+            client.hedge_enabled = True
+            for _ in range(client.latencies.min_samples):
+                client.latencies.record(0.01)
+            slow = await asyncio.wait_for(client.generate_images(["slow"]), timeout=2)
+            return flaky + broken + slow
+        finally:
+            await client.aclose()
+
+    flaky, *broken, slow = asyncio.run(run())
+
+    assert flaky["status"] == "succeeded" and calls.count("flaky") == 2
+    assert IMAGE_RETRIES.value(reason="503") == retries_before + 1
+    assert [item["status"] for item in broken] == ["failed"] * 3
+    assert "broken-2" not in calls and "circuit open" in broken[2]["error"]
+    assert IMAGE_SHED.value() == shed_before + 1
+    assert slow["url"] == "http://example.com/slow-hedged.png"
+    assert IMAGE_HEDGES.value(outcome="won") == hedges_before + 1
+
+
+def test_cancelled_breaker_probe_lets_the_next_call_probe():
+    from app.resilience import CircuitBreaker, RetryPolicy
+
+    clock = [0.0]
+    probe_started = asyncio.Event()
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        prompt = json.loads(request.content)["prompt"]
+        if prompt == "hangs":
+            probe_started.set()
+            await asyncio.sleep(60)
+        if prompt == "down":
+            return httpx.Response(503)
+        return httpx.Response(200, json={"url": f"http://example.com/{prompt}.png"})
+
+    client = ImageGenerationClient()
+    client.store.enabled = False
+    client.retry_policy = RetryPolicy(attempts=1)
+    client.breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10, clock=lambda: clock[0])
+
+    async def run() -> dict[str, Any]:
+        client._http_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        try:
+            await client.generate_images(["down"])
+            clock[0] = 11.0
+            probe = asyncio.create_task(client.generate_images(["hangs"]))
+            await asyncio.wait_for(probe_started.wait(), timeout=2)
+            # The only waiter leaves, which cancels the shared upstream call as well.
+            probe.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await probe
+            (recovered,) = await client.generate_images(["healthy"])
+            return recovered
+        finally:
+            await client.aclose()
+
+    recovered = asyncio.run(run())
+
+    assert recovered["status"] == "succeeded", recovered
+    assert client.breaker.state == "closed"
+
+    # A probe that never reports back is given up on after another reset timeout.
+    stuck = CircuitBreaker(failure_threshold=1, reset_timeout=10, clock=lambda: clock[0])
+    stuck.record_failure()
+    clock[0] += 10
+    assert stuck.allow() and not stuck.allow()
+    clock[0] += 10
+    assert stuck.allow()
+
+
+def test_images_stored_by_digest_and_served_with_etag_and_range(tmp_path, monkeypatch):
+    import base64
+    import hashlib
+
+    png = b"\x89PNG\r\n\x1a\n" + bytes(range(256)) * 8
+    jpeg = b"\xff\xd8\xff\xe0" + b"jpeg-body" * 100
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        if request.method == "GET":
+            return httpx.Response(200, content=jpeg)
+        prompt = json.loads(request.content)["prompt"]
+        if prompt == "inline":
+            return httpx.Response(200, json={"data": [{"b64_json": base64.b64encode(png).decode()}]})
+        return httpx.Response(200, json={"data": [{"url": "https://cdn.example.com/a.jpg"}]})
+
+    client = skills.image_client
+
+    async def run() -> list[dict[str, Any]]:
+        client._http_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        try:
+            return await client.generate_images(["inline", "linked"])
+        finally:
+            await client.aclose()
+
+    inline, linked = asyncio.run(run())
+
+    digest = hashlib.sha256(png).hexdigest()
+    assert inline["image"] == {"digest": digest, "content_type": "image/png", "bytes": len(png), "url": f"/api/images/{digest}"}
+    assert inline["url"] == f"/api/images/{digest}" and "raw" not in inline
+    assert linked["source_url"] == "https://cdn.example.com/a.jpg"
+    assert linked["image"]["content_type"] == "image/jpeg"
+    assert (tmp_path / "workspaces" / "images" / digest[:2] / digest).read_bytes() == png
+
+    http = TestClient(app)
+    response = http.get(inline["url"])
+    assert response.status_code == 200 and response.content == png
+    assert response.headers["content-type"] == "image/png"
+    assert response.headers["etag"] == f'"{digest}"'
+    assert http.get(inline["url"], headers={"If-None-Match": f'"{digest}"'}).status_code == 304
+    partial = http.get(inline["url"], headers={"Range": "bytes=0-7"})
+    assert partial.status_code == 206 and partial.content == png[:8]
+    assert partial.headers["content-range"] == f"bytes 0-7/{len(png)}"
+    assert http.get(linked["url"]).content == jpeg
+    # References stored before images moved under /api keep resolving.
+    assert http.get(f"/images/{digest}").content == png
+    assert http.get("/api/images/" + "0" * 64).status_code == 404
+    assert http.get("/api/images/..%2Fsecret").status_code == 404
+
+    async def cached(prompts: list[str]) -> list[dict[str, Any]]:
+        return [linked]
+
+    monkeypatch.setattr(skills, "generate_with_cache", cached)
+    monkeypatch.setattr(settings, "public_base_url", "https://ppt.example.com/")
+    result = asyncio.run(skills.create_ppt_visuals_handler({"topic": "t", "slides": 1}))
+    text = result["content"][-1]["text"]
+    assert f"图像: https://ppt.example.com{linked['url']}" in text
+    assert "原始链接: https://cdn.example.com/a.jpg" in text
+
+
+def test_image_store_evicts_least_recently_used_images(tmp_path, monkeypatch):
+    import os
+
+    from app.image_store import ImageStore
+
+    store = ImageStore(tmp_path, max_disk_bytes=250)
+    monkeypatch.setattr(skills.image_client, "store", store)
+    first, second = store.put_bytes(b"\x01" * 100), store.put_bytes(b"\x02" * 100)
+    for stamp, image in enumerate((first, second), start=1):
+        os.utime(tmp_path / image["digest"][:2] / image["digest"], (stamp, stamp))
+    # Serving an image refreshes it, so the untouched one is evicted when the cap is exceeded.
+    assert store.path_for(first["digest"]) is not None
+    store.put_bytes(b"\x03" * 100)
+
+    assert store.path_for(second["digest"]) is None
+    assert store.path_for(first["digest"]) is not None
+    assert sum(path.stat().st_size for path in tmp_path.glob("??/*")) == 200
+
+    async def lookup() -> list[dict | None]:
+        for prompt, image in (("kept", first), ("evicted", second)):
+            key = skills.image_cache.make_key(skills.image_client.model, skills.image_client.size, prompt)
+            await skills.image_cache.set(key, {"prompt": prompt, "status": "succeeded", "url": image["url"], "image": image})
+        return (await skills._lookup_cache(["kept", "evicted"]))[1]
+
+    # A cached result whose file was evicted is a miss, not a URL that 404s.
+    kept, evicted = asyncio.run(lookup())
+    assert kept is not None and kept["cached"] and evicted is None
+
+
+def test_deck_export_streams_pdf_from_stored_images_and_caches_it(tmp_path):
+    import importlib.util
+    import re
+    import struct
+    import zlib
+
+    from app.deck_export import wrap_text
+
+    rows = b"".join(b"\x00" + bytes([x * 60 % 256, 80, 200]) * 4 for x in range(3))
+    png = b"\x89PNG\r\n\x1a\n"
+    for kind, data in ((b"IHDR", struct.pack(">IIBBBBB", 4, 3, 8, 2, 0, 0, 0)), (b"IDAT", zlib.compress(rows)), (b"IEND", b"")):
+        png += struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+    jpeg = b"\xff\xd8\xff\xe0\x00\x04ab\xff\xc0\x00\x11\x08\x00\x02\x00\x05\x03" + b"\x01\x11\x00" * 3 + b"\xff\xd9"
+    store = skills.image_client.store
+    png_ref, jpeg_ref = store.put_bytes(png), store.put_bytes(jpeg)
+
+    deck = {
+        "title": "季度回顾",
+        "slides": [
+            {"title": "背景", "bullets": ["市场增长 Market growth 20%"], "image": png_ref["url"]},
+            {"title": "方案", "bullets": ["降本增效"], "image": jpeg_ref["digest"]},
+            {"title": "总结", "bullets": [], "image": "/images/" + "0" * 64},
+        ],
+    }
+    http = TestClient(app)
+    response = http.post("/api/export/deck", json=deck)
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/pdf"
+    assert response.headers["x-export-cache"] == "miss"
+    pdf = response.content
+    assert pdf.startswith(b"%PDF-1.5") and pdf.rstrip().endswith(b"%%EOF")
+    assert b"/Count 3" in pdf and zlib.compress(rows) in pdf and jpeg in pdf
+    assert b"/DCTDecode" in pdf and b"/Predictor 15 /Colors 3" in pdf
+
+    startxref = int(pdf.rsplit(b"startxref", 1)[1].split()[0])
+    entries = re.findall(rb"(\d{10}) 00000 n", pdf[startxref:])
+    for number, offset in enumerate(entries, start=1):
+        assert pdf[int(offset):].startswith(f"{number} 0 obj".encode())
+
+    cached = http.post("/api/export/deck", json=deck)
+    assert cached.headers["x-export-cache"] == "hit" and cached.content == pdf
+    assert cached.headers["etag"] == response.headers["etag"]
+    assert (tmp_path / "exports" / f"{response.headers['etag'].strip(chr(34))}.pdf").is_file()
+    assert main.exporter.stats() == {"hits": 1, "misses": 1}
+
+    if importlib.util.find_spec("pptx") is None:
+        assert http.post("/api/export/deck", json={**deck, "format": "pptx"}).status_code == 501
+
+    assert wrap_text("人工智能 drives growth", 10, 45) == ["人工智能", "drives", "growth"]
+
+
+def test_deck_export_downloads_only_allowed_public_hosts_within_budget(monkeypatch):
+    import socket
+
+    from app import deck_export
+    from app.deck_export import ExportSlide, resolve_images
+
+    png = b"\x89PNG\r\n\x1a\n" + b"\x00" * 100
+    fetched: list[str] = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        fetched.append(str(request.url))
+        return httpx.Response(200, content=png + request.url.path.encode())
+
+    addresses = {"images.example.com": "93.184.216.34", "cdn.example.com": "93.184.216.35", "intranet.example.com": "10.0.0.5"}
+
+    def fake_getaddrinfo(host: str, port: int, *args: Any, **kwargs: Any) -> list[Any]:
+        return [(socket.AF_INET, socket.SOCK_STREAM, 6, "", (addresses.get(host, host), port))]
+
+    monkeypatch.setattr(socket, "getaddrinfo", fake_getaddrinfo)
+    monkeypatch.setattr(settings, "image_api_base_url", "https://images.example.com/api/v3")
+    monkeypatch.setattr(settings, "export_image_hosts", ".example.com")
+    monkeypatch.setattr(settings, "export_max_download_bytes", 150)
+    # One at a time, so the slides spend the budget in order.
+    monkeypatch.setattr(settings, "export_download_concurrency", 1)
+    store = skills.image_client.store
+    slides = [
+        ExportSlide(title="元数据", image="http://169.254.169.254/latest/meta-data/"),
+        ExportSlide(title="内网", image="http://intranet.example.com/a.png"),
+        ExportSlide(title="外站", image="https://attacker.test/a.png"),
+        ExportSlide(title="上游", image="https://images.example.com/one.png"),
+        ExportSlide(title="超额", image="https://cdn.example.com/two.png"),
+    ]
+
+    async def run() -> list[Any]:
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            return await resolve_images(slides, store, client)
+
+    paths = asyncio.run(run())
+
+    assert paths[:3] == [None, None, None]
+    assert paths[3] is not None and paths[3].read_bytes().startswith(png)
+    # The first download spent most of the 150-byte budget, so the second is cut off.
+    assert paths[4] is None
+    assert all("example.com" in url for url in fetched)
+    assert deck_export.allowed_image_hosts() == {"images.example.com", ".example.com"}
+
+
+def test_pptx_export_accepts_an_empty_title(tmp_path):
+    pytest.importorskip("pptx")
+    from app.deck_export import DeckExportRequest, write_pptx
+
+    target = tmp_path / "deck.pptx"
+    write_pptx(DeckExportRequest(title="", slides=[{"title": "", "bullets": ["要点"]}]), [None], target)
+    assert target.stat().st_size > 0
+
+
+def test_import_defers_heavy_sdks():
+    from benchmarks.bench_startup import measure_import
+
+    # The import-time budget is enforced by ``python -m benchmarks.bench_startup``, not here.
+    assert measure_import()["loaded"] == []
+
+
+def test_agent_pool_runs_each_prompt_on_a_fresh_session_owned_by_one_task(monkeypatch):
+    from app.agent_pool import AgentPool
+
+    clients: list[Any] = []
+
+    class FakeClient:
+        def __init__(self) -> None:
+            self.prompts: list[str] = []
+            self.tasks: set[Any] = set()
+            self.disconnected = False
+            clients.append(self)
+
+        async def connect(self) -> None:
+            self.tasks.add(asyncio.current_task())
+
+        async def query(self, prompt: str) -> None:
+            self.tasks.add(asyncio.current_task())
+            self.prompts.append(prompt)
+            if prompt == "boom":
+                raise RuntimeError("CLI exited")
+
+        async def receive_response(self) -> AsyncIterator[Any]:
+            self.tasks.add(asyncio.current_task())
+            yield SimpleNamespace(text=f"reply to {self.prompts[-1]}")
+            yield SimpleNamespace(text="done")
+
+        async def disconnect(self) -> None:
+            self.tasks.add(asyncio.current_task())
+            self.disconnected = True
+
+    async def settle() -> None:
+        for _ in range(50):
+            await asyncio.sleep(0)
+
+    async def run() -> None:
+        pool = AgentPool(FakeClient, size=1, idle_seconds=0.05, reap_interval=0.02)
+        monkeypatch.setattr(agent, "agent_pool", pool)
+        await pool.start()
+        await settle()
+        assert pool.stats()["idle"] == 1 and len(clients) == 1
+
+        first = [message.text async for message in agent.run_agent("one")]
+        await settle()
+        second = [message.text async for message in agent.run_agent("two")]
+        await settle()
+        assert first == ["reply to one", "done"] and second[0] == "reply to two"
+        # Every run gets its own session; nothing is reused or reset with /clear.
+        assert [client.prompts for client in clients[:2]] == [["one"], ["two"]]
+        assert clients[0].disconnected and clients[1].disconnected
+        # connect, query, receive and disconnect all happen in the session's own task.
+        assert all(len(client.tasks) == 1 for client in clients[:2])
+
+        abandoned = agent.run_agent("three")
+        await abandoned.__anext__()
+        await abandoned.aclose()
+        await settle()
+        assert clients[2].disconnected and len(clients[2].tasks) == 1
+        assert pool.stats()["idle"] == 1 and pool.stats()["busy"] == 0
+
+        with pytest.raises(RuntimeError, match="CLI exited"):
+            [message async for message in agent.run_agent("boom")]
+        await settle()
+        assert clients[3].disconnected and pool.stats()["served"] == 4
+
+        spare = pool._idle[0]
+        assert spare.alive()
+        await asyncio.sleep(0.1)
+        await settle()
+        assert pool.stats()["idle"] == 0 and pool.evicted == 1 and not spare.alive()
+        assert clients[4].disconnected
+        await pool.stop()
+
+    asyncio.run(run())
+
+
+def test_ppt_workflow_endpoints_and_pipeline_start_images_per_slide(monkeypatch):
+    from app.proxy import api as proxy_api
+
+    prompts: list[str] = []
+
+    async def fake_generate_one(_client: Any, prompt: str) -> dict[str, Any]:
+        prompts.append(prompt)
+        return {"prompt": prompt, "status": "succeeded", "url": f"http://example.com/{len(prompts)}.png"}
+
+    monkeypatch.setattr(skills.image_client, "_generate_one", fake_generate_one)
+    monkeypatch.setattr(proxy_api.proxy_config, "openai_api_key", "")
+
+    client = TestClient(app)
+    references = client.post("/api/ppt/search", json={"topic": "人工智能", "limit": 6}).json()["references"]
+    assert [ref["rank"] for ref in references] == [1, 2, 3, 4, 5, 6]
+    assert {ref["kind"] for ref in references} == {"search"} and references[0]["title"] == "在维基百科搜索「人工智能」"
+
+    response = client.post(
+        "/api/ppt/outline-stream", json={"topic": "人工智能", "references": references, "use_templates": True}
+    )
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = [json.loads(line[6:]) for line in response.text.splitlines() if line.startswith("data: ")]
+    assert [event["round"] for event in events if event["type"] == "progress"] == [1, 2, 3]
+    assert sum(len(event["sections"]) for event in events if event["type"] == "partial") == 5
+    outline = events[-1]["outline"]
+    assert events[-1]["type"] == "complete" and len(outline) == 5
+
+    slides = client.post(
+        "/api/ppt/slides",
+        json={"topic": "人工智能", "outline": outline, "references": references, "style_prompt": "简洁", "use_templates": True},
+    ).json()["slides"]
+    assert [slide["title"] for slide in slides[:5]] == [section["title"] for section in outline]
+    assert slides[-1]["title"] == "参考资料" and len(slides) == 6
+    assert len({json.dumps(slide["palette"], sort_keys=True) for slide in slides}) == 1
+
+    images = [client.post("/api/ppt/images", json={"topic": "人工智能", "slides": [slide]}).json()["images"][0] for slide in slides[:2]]
+    assert images[0]["style_seed"] == images[1]["style_seed"]
+    assert images[0]["url"].startswith("http://example.com/")
+
+    response = client.post("/api/ppt/pipeline", json={"topic": "机器学习", "style_prompt": "简洁", "use_templates": True})
+    events = [json.loads(line[6:]) for line in response.text.splitlines() if line.startswith("data: ")]
+    assert events[0]["type"] == "references" and events[-1]["type"] == "done"
+    positions = {(event["type"], event.get("index")): idx for idx, event in enumerate(events)}
+    for index in range(5):
+        assert positions[("slide", index)] < positions[("image", index)]
+    assert ("image", 5) not in positions and ("slide", 5) in positions
+    assert events[-1] == {"type": "done", "slides": 6, "images": 5, "failed": 0}
+
+
+def test_ppt_outline_reports_text_model_failures_instead_of_templates(monkeypatch):
+    from app import workflow
+    from app.proxy import api as proxy_api
+
+    client = TestClient(app)
+    monkeypatch.setattr(proxy_api.proxy_config, "openai_api_key", "")
+    assert client.post("/api/ppt/outline", json={"topic": "人工智能"}).status_code == 502
+    response = client.post("/api/ppt/slides", json={"topic": "人工智能", "outline": [{"title": "背景", "bullets": ["要点"]}]})
+    assert response.status_code == 502
+
+    async def flaky_create_message(request: dict[str, Any]) -> dict[str, Any]:
+        prompt = request["messages"][0]["content"]
+        if "第 1 到" in prompt:
+            raise RuntimeError("upstream timeout")
+        count = 2 if "第 3 到" in prompt else 1
+        sections = [{"title": f"模型章节{idx}", "bullets": ["甲", "乙", "丙"]} for idx in range(count)]
+        return {"content": [{"type": "text", "text": json.dumps(sections, ensure_ascii=False)}]}
+
+    monkeypatch.setattr(proxy_api.proxy_config, "openai_api_key", "sk-test")
+    monkeypatch.setattr(workflow.proxy_local, "create_message", flaky_create_message)
+    response = client.post("/api/ppt/outline-stream", json={"topic": "人工智能"})
+    events = [json.loads(line[6:]) for line in response.text.splitlines() if line.startswith("data: ")]
+    assert events[-1]["type"] == "partial_complete" and len(events[-1]["outline"]) == 3
+    titles = [section["title"] for section in events[-1]["outline"]]
+    assert all(title.startswith("模型章节") for title in titles)
+
+
+def test_write_slide_falls_back_on_wrong_shape_replies(monkeypatch):
+    from app import workflow
+
+    references = workflow.search_references("人工智能", limit=2)
+    section = workflow.OutlineSection(title="背景", bullets=["要点一", "要点二"])
+    palette = workflow.deck_palette("人工智能", "")
+    replies = iter(
+        [
+            {"bullets": "一条字符串", "keywords": "k", "sources": [1]},
+            {"bullets": ["甲"], "sources": None},
+            {"bullets": ["乙"], "sources": [{"rank": 1}]},
+            ["不是对象"],
+            {"bullets": ["丙", " "], "keywords": "关键词", "sources": ["2", 9]},
+        ]
+    )
+
+    async def fake_complete_json(stage: str, prompt: str) -> Any:
+        return next(replies)
+
+    monkeypatch.setattr(workflow, "_complete_json", fake_complete_json)
+
+    async def run() -> list[Any]:
+        return [await workflow.write_slide("人工智能", section, 0, references, "", palette) for _ in range(5)]
+
+    *malformed, valid = asyncio.run(run())
+
+    for slide in malformed:
+        assert slide.bullets == section.bullets
+        assert slide.keywords == "人工智能、背景" and slide.sources == [1]
+    assert valid.bullets == ["丙"] and valid.keywords == "关键词" and valid.sources == [2]
+
+
+def test_deck_images_stream_shares_first_slide_style_and_bounds_fan_out(monkeypatch):
+    started: list[str] = []
+    in_flight = {"now": 0, "peak": 0, "beside_first": 0}
+
+    async def fake_generate_one(_client: Any, prompt: str) -> dict[str, Any]:
+        started.append(prompt)
+        in_flight["now"] += 1
+        in_flight["peak"] = max(in_flight["peak"], in_flight["now"])
+        await asyncio.sleep(0.01)
+        if "第0页" in prompt:
+            in_flight["beside_first"] = in_flight["now"] - 1
+        in_flight["now"] -= 1
+        return {"prompt": prompt, "status": "succeeded", "url": f"http://example.com/{len(started)}.png"}
+
+    monkeypatch.setattr(skills.image_client, "_generate_one", fake_generate_one)
+    monkeypatch.setattr(settings, "deck_image_concurrency", 2)
+
+    palettes = [{"primary": f"#00000{idx}", "secondary": "#111111", "accent": "#222222"} for idx in range(6)]
+    slides = [
+        {"title": f"第{idx}页", "bullets": ["要点"], "palette": palettes[idx], "keywords": "k", "style_prompt": f"风格{idx}"}
+        for idx in range(6)
+    ]
+    response = TestClient(app).post("/api/ppt/images/stream", json={"topic": "深度学习", "slides": slides})
+
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = [json.loads(line[6:]) for line in response.text.splitlines() if line.startswith("data: ")]
+    assert sorted(event["index"] for event in events[:-1]) == [0, 1, 2, 3, 4, 5]
+    # The first slide does not hold the others back.
+    assert in_flight["beside_first"] == 1 and in_flight["peak"] == 2
+    # Every slide is rendered with the anchor's palette and style prompt.
+    assert all("#000000" in prompt and "风格0" in prompt for prompt in started)
+    # The style seed only labels the results; the image API has no seed to pass it to.
+    assert not any(events[-1]["style_seed"] in prompt for prompt in started)
+    assert {event["image"]["style_seed"] for event in events[:-1]} == {events[-1]["style_seed"]}
+    assert events[-1] == {"type": "done", "style_seed": events[0]["image"]["style_seed"], "images": 6, "failed": 0}
@@ -0,0 +1,545 @@
+import asyncio
+import json
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any
+
+import httpx
+import pytest
+from fastapi import HTTPException
+from openai import RateLimitError
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.append(str(ROOT))
+
+from app.proxy.client import OpenAIClient  # noqa: E402
+from app.proxy.upstreams import Upstream, UpstreamPool  # noqa: E402
+from app.tracing import tracer  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def isolate_traces(monkeypatch, tmp_path):
+    monkeypatch.setattr(tracer, "root", tmp_path / "traces")
+
+
+class FakeCompletion:
+    def __init__(self, payload: dict[str, Any]) -> None:
+        self.payload = payload
+        self.usage = SimpleNamespace(**payload["usage"]) if "usage" in payload else None
+
+    def model_dump(self) -> dict[str, Any]:
+        return self.payload
+
+
+def fake_upstream(name: str, outcomes: list[Any], weight: int = 1) -> Upstream:
+    calls: list[dict[str, Any]] = []
+
+    async def create(**request: Any) -> Any:
+        calls.append(request)
+        outcome = outcomes.pop(0) if outcomes else {"id": name}
+        if isinstance(outcome, Exception):
+            raise outcome
+        return FakeCompletion(outcome)
+
+    client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)), calls=calls)
+    return Upstream(name=name, base_url=f"http://{name}", client=client, weight=weight)
+
+
+def rate_limit_error() -> RateLimitError:
+    response = httpx.Response(429, request=httpx.Request("POST", "http://upstream/chat/completions"))
+    return RateLimitError("rate_limit_exceeded", response=response, body=None)
+
+
+def test_pool_prefers_least_outstanding_weighted_upstream():
+    light, heavy = fake_upstream("light", []), fake_upstream("heavy", [], weight=3)
+    pool = UpstreamPool([light, heavy])
+
+    picks = [pool.acquire().name for _ in range(4)]
+
+    assert picks.count("heavy") == 3
+    assert light.outstanding == 1 and heavy.outstanding == 3
+
+
+def test_rate_limited_upstream_is_benched_and_request_retried():
+    first = fake_upstream("first", [rate_limit_error()])
+    second = fake_upstream("second", [{"id": "from-second"}])
+    client = OpenAIClient()
+    client.upstreams = UpstreamPool([first, second], cooldown_seconds=60)
+
+    # Force the first pick onto the upstream that will fail.
+    second.outstanding = 5
+    result = asyncio.run(client.create_chat_completion({"model": "gpt-4o", "messages": []}, "req-1"))
+    second.outstanding -= 5
+
+    assert result == {"id": "from-second"}
+    assert not first.healthy and first.failures == 1
+    assert second.healthy
+    assert first.outstanding == 0 and second.outstanding == 0
+    assert client.upstreams.acquire() is second
+
+
+def test_retries_exhausted_surface_rate_limit():
+    from app.metrics import UPSTREAM_ERRORS
+
+    only = fake_upstream("only", [rate_limit_error()])
+    client = OpenAIClient()
+    client.upstreams = UpstreamPool([only])
+    errors_before = UPSTREAM_ERRORS.value(kind="rate_limit")
+
+    with pytest.raises(HTTPException) as excinfo:
+        asyncio.run(client.create_chat_completion({"model": "gpt-4o", "messages": []}))
+
+    assert excinfo.value.status_code == 429
+    assert UPSTREAM_ERRORS.value(kind="rate_limit") == errors_before + 1
+
+
+def test_scheduler_queues_interactive_ahead_and_rejects_long_waits():
+    from app.proxy.scheduler import PRIORITY_BATCH, PRIORITY_INTERACTIVE, RequestScheduler
+
+    order: list[str] = []
+
+    async def run() -> None:
+        scheduler = RequestScheduler({"gpt-4o": {"rpm": 600}}, max_wait=2.0)
+        await scheduler.acquire("gpt-4o", 10)
+        scheduler._lanes[("default", "gpt-4o")].requests.tokens = 0
+
+        async def call(name: str, priority: int) -> None:
+            await scheduler.acquire("gpt-4o", 10, priority)
+            order.append(name)
+
+        batch = [asyncio.create_task(call(f"batch-{idx}", PRIORITY_BATCH)) for idx in range(2)]
+        await asyncio.sleep(0)
+        interactive = asyncio.create_task(call("interactive", PRIORITY_INTERACTIVE))
+        await asyncio.gather(*batch, interactive)
+
+        # Unlimited models pass straight through.
+        await scheduler.acquire("other-model", 10**6)
+
+        strict = RequestScheduler({}, default_tpm=60, max_wait=0.05)
+        await strict.acquire("gpt-4o", 60)
+        with pytest.raises(HTTPException) as excinfo:
+            await strict.acquire("gpt-4o", 60)
+        assert excinfo.value.status_code == 429
+        assert strict.rejected_total == 1 and strict.queue_depth() == 0
+
+    asyncio.run(run())
+    assert order == ["interactive", "batch-0", "batch-1"]
+
+
+class UsageStream:
+    def __init__(self, chunks: list[Any]) -> None:
+        self.chunks = chunks
+
+    async def close(self) -> None:
+        pass
+
+    def __aiter__(self) -> Any:
+        return self._iterate()
+
+    async def _iterate(self) -> Any:
+        for chunk in self.chunks:
+            yield chunk
+
+
+def test_budgets_are_per_upstream_key_and_streams_settle_from_usage():
+    from app.proxy.scheduler import Admission, RequestScheduler
+
+    scheduler = RequestScheduler({"gpt-4o": {"tpm": 1000}}, upstream_limits={"b": {"gpt-4o": {"tpm": 500}}})
+    chunks = [_chunk({"content": "大纲"}), _chunk({}, finish_reason="stop"), _chunk(None, usage={"prompt_tokens": 30, "completion_tokens": 10, "total_tokens": 40})]
+
+    async def create(**_request: Any) -> Any:
+        return UsageStream(list(chunks))
+
+    completions = SimpleNamespace(create=create)
+    a = Upstream(name="a", base_url="http://a", client=SimpleNamespace(chat=SimpleNamespace(completions=completions)))
+    b = Upstream(name="b", base_url="http://b", client=SimpleNamespace(chat=SimpleNamespace(completions=completions)))
+    client = OpenAIClient()
+    client.upstreams = UpstreamPool([a, b])
+
+    async def stream_once(admission: Admission) -> None:
+        await client.admit(admission)
+        async for _ in client.create_chat_completion_stream({"model": "gpt-4o", "messages": [], "max_tokens": 400}, admission=admission):
+            pass
+
+    async def run() -> tuple[Admission, Admission]:
+        first, second = (Admission(scheduler, "gpt-4o", prompt_tokens=50, max_tokens=400) for _ in range(2))
+        await stream_once(first)
+        a.outstanding = 5  # steer the second request onto key b
+        await stream_once(second)
+        a.outstanding = 0
+        return first, second
+
+    first, second = asyncio.run(run())
+
+    assert {first.upstream, second.upstream} == {None}
+    lane_a, lane_b = scheduler._lanes[("a", "gpt-4o")].tokens, scheduler._lanes[("b", "gpt-4o")].tokens
+    assert lane_a.capacity == 1000 and lane_b.capacity == 500
+    # Charged 450 up front each, then settled to the 40 tokens the usage chunk reported.
+    assert lane_a.tokens == pytest.approx(960, abs=1) and lane_b.tokens == pytest.approx(460, abs=1)
+    assert a.outstanding == 0 and b.outstanding == 0
+
+
+def test_deterministic_completions_served_from_response_cache(monkeypatch):
+    from fastapi.testclient import TestClient
+
+    from app.main import app
+    from app.proxy import api
+    from app.proxy.response_cache import ResponseCache
+
+    calls: list[dict[str, Any]] = []
+
+    async def fake_completion(request: dict[str, Any], request_id: str | None = None, admission: Any = None) -> dict[str, Any]:
+        calls.append(request)
+        return {
+            "id": "chatcmpl-1",
+            "choices": [{"message": {"content": "你好"}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 3, "completion_tokens": 2, "total_tokens": 5},
+        }
+
+    monkeypatch.setattr(api.proxy_config, "openai_api_key", "sk-test")
+    monkeypatch.setattr(api.proxy_config, "anthropic_api_key", "")
+    monkeypatch.setattr(api.openai_client, "create_chat_completion", fake_completion)
+    monkeypatch.setattr(api, "response_cache", ResponseCache(enabled=True))
+
+    client = TestClient(app)
+    body = {"model": "claude-3-5-sonnet", "max_tokens": 64, "temperature": 0, "messages": [{"role": "user", "content": "hi"}]}
+    first = client.post("/proxy/v1/messages", json=body)
+    second = client.post("/proxy/v1/messages", json=body)
+    sampled = client.post("/proxy/v1/messages", json={**body, "temperature": 0.7})
+
+    assert first.headers["X-Proxy-Cache"] == "MISS"
+    assert second.headers["X-Proxy-Cache"] == "HIT"
+    assert sampled.headers["X-Proxy-Cache"] == "BYPASS"
+    assert second.json() == first.json()
+    assert second.json()["content"][0]["text"] == "你好"
+    assert len(calls) == 2
+
+
+def test_response_cache_respects_byte_cap():
+    from app.proxy.response_cache import ResponseCache
+
+    cache = ResponseCache(enabled=True, max_bytes=200)
+    for idx in range(5):
+        cache.set(f"k{idx}", {"text": "x" * 60})
+
+    assert cache.stats()["bytes"] <= 200
+    assert cache.get("k0") is None
+    assert cache.get("k4") == {"text": "x" * 60}
+
+
+def _chunk(delta: dict[str, Any], finish_reason: str | None = None, usage: dict[str, int] | None = None) -> Any:
+    from openai.types.chat import ChatCompletionChunk
+
+    choices = [] if delta is None else [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+    return ChatCompletionChunk.model_validate(
+        {"id": "c", "object": "chat.completion.chunk", "created": 0, "model": "m", "choices": choices, "usage": usage}
+    )
+
+
+def _collect_events(chunks: list[Any]) -> list[dict[str, Any]]:
+    import logging
+
+    from app.proxy.conversion.response_converter import convert_openai_streaming_to_claude
+    from app.proxy.models.claude import ClaudeMessagesRequest
+
+    async def stream() -> Any:
+        for chunk in chunks:
+            yield chunk
+
+    async def run() -> list[str]:
+        request = ClaudeMessagesRequest(model="claude-3-5-sonnet", max_tokens=64, messages=[{"role": "user", "content": "hi"}])
+        return [frame async for frame in convert_openai_streaming_to_claude(stream(), request, logging.getLogger("test"))]
+
+    frames = asyncio.run(run())
+    return [json.loads(frame.split("data: ", 1)[1]) for frame in frames]
+
+
+def test_streaming_converter_consumes_typed_chunks():
+    events = _collect_events(
+        [
+            _chunk({"content": "你好 \"世界\""}),
+            _chunk({"tool_calls": [{"index": 0, "id": "call_1", "function": {"name": "draft_ppt_outline", "arguments": ""}}]}),
+            _chunk({"tool_calls": [{"index": 0, "function": {"arguments": '{"topic": "a}\\"'}}]}),
+            _chunk({"tool_calls": [{"index": 0, "function": {"arguments": ' {b", "n": [1]}'}}]}),
+            _chunk({}, finish_reason="tool_calls"),
+        ]
+    )
+
+    types = [event["type"] for event in events]
+    assert types[:3] == ["message_start", "content_block_start", "ping"]
+    assert events[3]["delta"] == {"type": "text_delta", "text": "你好 \"世界\""}
+    assert events[4]["content_block"]["name"] == "draft_ppt_outline"
+    tool_input = "".join(event["delta"]["partial_json"] for event in events if event.get("delta", {}).get("type") == "input_json_delta")
+    assert json.loads(tool_input) == {"topic": 'a}" {b', "n": [1]}
+    assert events[-1]["message"]["stop_reason"] == "tool_use"
+
+
+def test_tool_arguments_stream_incrementally_with_final_usage():
+    events = _collect_events(
+        [
+            _chunk({"tool_calls": [{"index": 0, "function": {"arguments": '{"outline": '}}]}),
+            _chunk({"tool_calls": [{"index": 0, "id": "call_9", "function": {"name": "create_ppt_visuals"}}]}),
+            _chunk({"tool_calls": [{"index": 0, "function": {"arguments": '"第一节'}}]}),
+            _chunk({"tool_calls": [{"index": 0, "function": {"arguments": '第二节"}'}}]}),
+            _chunk({}, finish_reason="tool_calls"),
+            _chunk(None, usage={"prompt_tokens": 11, "completion_tokens": 7, "total_tokens": 18}),
+        ]
+    )
+
+    deltas = [event["delta"]["partial_json"] for event in events if event.get("delta", {}).get("type") == "input_json_delta"]
+    assert deltas == ['{"outline": ', '"第一节', '第二节"}']
+    message_delta = next(event for event in events if event["type"] == "message_delta")
+    assert message_delta["delta"]["stop_reason"] == "tool_use"
+    assert message_delta["usage"] == {"input_tokens": 11, "output_tokens": 7}
+    assert [event["type"] for event in events][-2:] == ["message_delta", "message_stop"]
+
+
+def test_oversized_arguments_before_tool_name_fail_the_stream(monkeypatch):
+    from app.proxy.conversion import response_converter
+
+    monkeypatch.setattr(response_converter, "MAX_PENDING_ARGUMENT_CHARS", 10)
+    events = _collect_events(
+        [
+            _chunk({"tool_calls": [{"index": 0, "function": {"arguments": '{"outline": '}}]}),
+            _chunk({"tool_calls": [{"index": 0, "id": "call_1", "function": {"name": "draft_ppt_outline"}}]}),
+            _chunk({"tool_calls": [{"index": 0, "function": {"arguments": '"x"}'}}]}),
+        ]
+    )
+
+    assert events[-1]["type"] == "error"
+    assert not any(event.get("delta", {}).get("type") == "input_json_delta" for event in events)
+
+
+def test_count_tokens_covers_system_tools_and_tool_results(monkeypatch):
+    from fastapi.testclient import TestClient
+
+    from app.config import settings
+    from app.main import app
+    from app.proxy import api
+    from app.proxy.tokenizer import count_text
+
+    monkeypatch.setattr(api.proxy_config, "anthropic_api_key", "")
+    monkeypatch.setattr(api.proxy_config, "big_model", "doubao-seed-1-6")
+    client = TestClient(app)
+    base = {"model": "claude-3-opus", "system": settings.system_prompt, "messages": [{"role": "user", "content": "做一份PPT"}]}
+    tool = {"name": "create_ppt_visuals", "description": "生图", "input_schema": {"type": "object", "properties": {"topic": {"type": "string"}}}}
+    with_tools = {
+        **base,
+        "tools": [tool],
+        "messages": [
+            *base["messages"],
+            {"role": "assistant", "content": [{"type": "tool_use", "id": "t1", "name": "create_ppt_visuals", "input": {"topic": "AI"}}]},
+            {"role": "user", "content": [{"type": "tool_result", "tool_use_id": "t1", "content": "生成了六张图片"}]},
+        ],
+    }
+
+    plain = client.post("/proxy/v1/messages/count_tokens", json=base).json()["input_tokens"]
+    hits_before = count_text.cache_info().hits
+    full = client.post("/proxy/v1/messages/count_tokens", json=with_tools).json()["input_tokens"]
+
+    # Chinese characters are roughly one token each, not one per four characters.
+    assert plain >= len(settings.system_prompt) // 2
+    assert full > plain + 10
+    assert count_text.cache_info().hits > hits_before
+
+
+def test_model_manager_selects_tokenizer_per_mapped_model():
+    from app.proxy.config import ProxyConfig
+    from app.proxy.model_manager import ModelManager
+
+    manager = ModelManager(ProxyConfig(big_model="gpt-4o", small_model="gpt-3.5-turbo", model_tokenizers='{"deepseek-chat": "cl100k_base"}'))
+
+    assert manager.tokenizer_for("claude-3-opus") == "o200k_base"
+    assert manager.tokenizer_for("claude-3-haiku") == "cl100k_base"
+    assert manager.tokenizer_for("deepseek-chat") == "cl100k_base"
+    assert manager.tokenizer_for("doubao-seed-1-6") == "heuristic"
+
+
+def test_json_settings_are_parsed_once_per_value():
+    from app.proxy.config import ProxyConfig
+    from app.proxy.model_manager import ModelManager, _tokenizer_overrides
+
+    config = ProxyConfig(openai_api_key="", openai_upstreams='[{"name": "a", "base_url": "http://a", "api_key": "sk-a"}]')
+    first = config.upstream_specs()
+    assert config.has_openai_credentials()
+    assert config.upstream_specs()[0] is first[0]
+
+    config.openai_upstreams = ""
+    assert config.upstream_specs()[0]["name"] == "default" and not config.has_openai_credentials()
+
+    manager = ModelManager(ProxyConfig(model_tokenizers='{"deepseek-chat": "cl100k_base"}'))
+    misses = _tokenizer_overrides.cache_info().misses
+    for _ in range(3):
+        manager.tokenizer_for_openai("deepseek-chat")
+    assert _tokenizer_overrides.cache_info().misses <= misses + 1
+
+
+def test_tokenizer_never_downloads_uncached_encodings(monkeypatch, tmp_path):
+    from app.proxy import tokenizer
+
+    monkeypatch.setenv("TIKTOKEN_CACHE_DIR", str(tmp_path))
+    tokenizer.get_tokenizer.cache_clear()
+    try:
+        assert tokenizer.cached_encoding_path("cl100k_base").parent == tmp_path
+        # Nothing cached: the heuristic is used instead of fetching the encoding over the network.
+        assert tokenizer.get_tokenizer("cl100k_base").name == tokenizer.HEURISTIC
+    finally:
+        tokenizer.get_tokenizer.cache_clear()
+
+
+class SlowStream:
+    """Stand-in for openai's AsyncStream: one chunk per tick until closed."""
+
+    def __init__(self) -> None:
+        self.closed = asyncio.Event()
+        self.sent = 0
+
+    async def close(self) -> None:
+        self.closed.set()
+
+    def __aiter__(self) -> "SlowStream":
+        return self
+
+    async def __anext__(self) -> Any:
+        tick = asyncio.ensure_future(asyncio.sleep(0.02 if self.sent < 3 else 60))
+        closed = asyncio.ensure_future(self.closed.wait())
+        await asyncio.wait([tick, closed], return_when=asyncio.FIRST_COMPLETED)
+        tick.cancel()
+        closed.cancel()
+        if self.closed.is_set():
+            raise httpx.ReadError("stream closed")
+        self.sent += 1
+        return _chunk({"content": f"t{self.sent} slide notes"})
+
+
+def test_client_disconnect_closes_upstream_stream_and_counts_unused_budget(monkeypatch):
+    import logging
+
+    from app.metrics import CANCELLED_STREAMS, UNUSED_TOKEN_BUDGET
+    from app.proxy import api, tokenizer
+    from app.proxy.model_manager import model_manager
+    from app.proxy.conversion.response_converter import convert_openai_streaming_to_claude
+    from app.proxy.models.claude import ClaudeMessagesRequest
+
+    stream = SlowStream()
+
+    async def create(**_request: Any) -> Any:
+        return stream
+
+    completions = SimpleNamespace(create=create)
+    upstream = Upstream(name="slow", base_url="http://slow", client=SimpleNamespace(chat=SimpleNamespace(completions=completions)))
+    client = OpenAIClient()
+    client.upstreams = UpstreamPool([upstream])
+    monkeypatch.setattr(api, "openai_client", client)
+    monkeypatch.setattr(api.proxy_config, "disconnect_poll_interval", 0.05)
+
+    class FakeHttpRequest:
+        disconnected = False
+
+        async def is_disconnected(self) -> bool:
+            return self.disconnected
+
+    http_request = FakeHttpRequest()
+    unused_before = UNUSED_TOKEN_BUDGET.value()
+    disconnects_before = CANCELLED_STREAMS.value(reason="client_disconnect", stream="true")
+    request = ClaudeMessagesRequest(model="claude-3-5-sonnet", max_tokens=100, stream=True, messages=[{"role": "user", "content": "hi"}])
+
+    async def run() -> list[str]:
+        openai_stream = client.create_chat_completion_stream({"model": "gpt-4o", "messages": [], "max_tokens": 100}, "req-1")
+        frames = api._stream_until_disconnect(
+            convert_openai_streaming_to_claude(openai_stream, request, logging.getLogger("test")), openai_stream, http_request, "req-1"
+        )
+        received: list[str] = []
+        async for frame in frames:
+            received.append(frame)
+            if "t3" in frame:
+                assert [item["request_id"] for item in client.list_requests()] == ["req-1"]
+                http_request.disconnected = True
+        return received
+
+    frames = asyncio.run(asyncio.wait_for(run(), timeout=5))
+
+    assert stream.closed.is_set() and stream.sent == 3
+    assert any("t3" in frame for frame in frames)
+    assert client.list_requests() == [] and client.active_requests == {}
+    assert upstream.outstanding == 0
+    assert CANCELLED_STREAMS.value(reason="client_disconnect", stream="true") == disconnects_before + 1
+    # Streamed output is measured in tokens of the upstream model, counted once and outside the prompt cache.
+    encoding = tokenizer.get_tokenizer(model_manager.tokenizer_for_openai("gpt-4o"))
+    streamed = encoding.count("".join(f"t{n} slide notes" for n in (1, 2, 3)))
+    assert streamed > 3
+    assert UNUSED_TOKEN_BUDGET.value() == unused_before + 100 - streamed
+
+
+def test_admin_cancel_by_request_id(monkeypatch):
+    from fastapi.testclient import TestClient
+
+    from app.config import settings
+    from app.main import app
+    from app.proxy import api
+
+    client = OpenAIClient()
+    monkeypatch.setattr(api, "openai_client", client)
+    monkeypatch.setattr(api.proxy_config, "anthropic_api_key", "")
+    monkeypatch.setattr(settings, "admin_token", "ops-token")
+    http = TestClient(app, headers={"X-Admin-Token": "ops-token"})
+
+    cancel_event = client._register("req-admin", {"model": "gpt-4o", "max_tokens": 10}, stream=True)
+    client.request_info["req-admin"]["trace_id"] = "trace-1"
+
+    # An open client API key (ANTHROPIC_API_KEY unset) does not open the operator routes.
+    assert TestClient(app).post("/proxy/admin/requests/trace-1/cancel").status_code == 401
+    assert not cancel_event.is_set()
+    listed = http.get("/proxy/admin/requests").json()["requests"]
+    assert [item["request_id"] for item in listed] == ["req-admin"]
+    assert http.post("/proxy/admin/requests/unknown/cancel").status_code == 404
+    assert http.post("/proxy/admin/requests/trace-1/cancel").json() == {"cancelled": True, "request_id": "trace-1"}
+    assert cancel_event.is_set()
+    assert client.request_info["req-admin"]["cancel_reason"] == "admin"
+
+
+def test_local_transport_matches_http_route_and_shares_cache(monkeypatch):
+    from fastapi.testclient import TestClient
+
+    from app.main import app
+    from app.proxy import api, local
+    from app.proxy.response_cache import ResponseCache
+
+    calls: list[str] = []
+
+    async def fake_completion(request: dict[str, Any], request_id: str | None = None, admission: Any = None) -> dict[str, Any]:
+        calls.append("completion")
+        return {
+            "id": "chatcmpl-local",
+            "choices": [{"message": {"content": "大纲"}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 3, "completion_tokens": 2, "total_tokens": 5},
+        }
+
+    async def fake_stream(request: dict[str, Any], request_id: str | None = None, admission: Any = None) -> Any:
+        calls.append("stream")
+        yield _chunk({"content": "第一页"})
+        yield _chunk({}, finish_reason="stop")
+
+    monkeypatch.setattr(api.proxy_config, "openai_api_key", "sk-test")
+    monkeypatch.setattr(api.proxy_config, "anthropic_api_key", "")
+    monkeypatch.setattr(api.openai_client, "create_chat_completion", fake_completion)
+    monkeypatch.setattr(api.openai_client, "create_chat_completion_stream", fake_stream)
+    monkeypatch.setattr(api, "response_cache", ResponseCache(enabled=True))
+
+    body = {"model": "claude-3-5-sonnet", "max_tokens": 64, "temperature": 0, "messages": [{"role": "user", "content": "hi"}]}
+    over_http = TestClient(app).post("/proxy/v1/messages", json=body).json()
+
+    async def run() -> tuple[dict[str, Any], list[str]]:
+        direct = await local.create_message(body)
+        frames = [frame async for frame in local.stream_message(body)]
+        return direct, frames
+
+    direct, frames = asyncio.run(run())
+
+    assert direct == over_http
+    assert calls == ["completion", "stream"]
+    events = [json.loads(frame.split("data: ", 1)[1]) for frame in frames]
+    assert events[3]["delta"] == {"type": "text_delta", "text": "第一页"}
+    assert events[-1]["type"] == "message_stop"
@@ -1,7 +1,7 @@
 import { createSignal, onCleanup, Show } from "solid-js";
 
 type LoadingTimerProps = {
-    operation: "reference" | "outline" | "slides" | "images";
+    operation: "reference" | "outline" | "slides" | "images" | "pdf";
 };
 
 const OPERATION_LABELS = {
@@ -9,6 +9,7 @@ const OPERATION_LABELS = {
     outline: "生成大纲",
     slides: "生成内容",
     images: "生成图片",
+    pdf: "导出 PDF",
 } as const;
 
 export function LoadingTimer(props: LoadingTimerProps) {
@@ -1,5 +1,4 @@
 import { createEffect, createMemo, createSignal, For, Show } from "solid-js";
-import jsPDF from "jspdf";
 import { Badge } from "@/components/ui/badge";
 import { Button } from "@/components/ui/button";
 import { Card, CardContent, CardDescription, CardHeader, CardTitle } from "@/components/ui/card";
@@ -9,6 +8,8 @@ import { Textarea } from "@/components/ui/textarea";
 import { LoadingTimer } from "@/components/LoadingTimer";
 
 const apiBase = import.meta.env.VITE_API_BASE || "http://localhost:8000";
+// Stored slide images come back as backend-relative paths (/api/images/<digest>).
+const assetUrl = (url?: string) => (url?.startsWith("/") ? `${apiBase}${url}` : url);
 
 type ReferenceArticle = {
   title: string;
@@ -16,6 +17,7 @@ type ReferenceArticle = {
   summary: string;
   source: string;
   rank?: number;
+  kind?: "article" | "search";
 };
 
 type OutlineSection = {
@@ -105,7 +107,7 @@ export function HomePage() {
       }
       const data = await response.json();
       setReferences(data.references || []);
-      pushStatus(`✓ 找到 ${data.references?.length || 0} 个参考资料`);
+      pushStatus(`✓ 整理出 ${data.references?.length || 0} 个参考资料来源`);
     } catch (error: any) {
       const fullError = `✗ 搜索失败: ${error.message}`;
       pushStatus(fullError);
@@ -266,101 +268,92 @@ export function HomePage() {
       });
     };
 
-    const generateImageForSlide = async (slide: SlideContent): Promise<SlideImage | null> => {
-      const body = {
-        topic: topic(),
-        slides: [slide],
-        watermark: false,
-        session_id: sessionId(),
-        image_model: apiKey() ? { model: "doubao-seedream-4-5-251128", base_url: "", api_key: apiKey() } : undefined,
-      };
-      try {
-        const response = await fetch(`${apiBase}/api/ppt/images`, {
-          method: "POST",
-          headers: { "Content-Type": "application/json" },
-          body: JSON.stringify(body),
-        });
-        if (!response.ok) throw new Error(response.statusText);
-        const data = await response.json();
-        const image: SlideImage | undefined = data.images?.[0];
-        return image || null;
-      } catch (err: any) {
-        pushStatus(`✗ 图片生成失败（${slide.title}）：${err.message || err}`);
-        return null;
-      }
-    };
-
     try {
-      if (slidesToUse.length > 0) {
-        const firstImage = await generateImageForSlide(slidesToUse[0]);
-        if (firstImage) {
-          upsertImage(firstImage);
-          pushStatus(`✓ 首张图片完成：${slidesToUse[0].title}`);
-        }
-      }
+      // One streamed call: the server renders every slide in the first slide's
+      // style under its own concurrency limit and streams each as it lands.
+      const response = await fetch(`${apiBase}/api/ppt/images/stream`, {
+        method: "POST",
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify({ topic: topic(), slides: slidesToUse, session_id: sessionId() }),
+      });
+      if (!response.ok) throw new Error(`HTTP ${response.status}: ${await response.text()}`);
+      const reader = response.body?.getReader();
+      if (!reader) throw new Error("无法读取响应流");
 
-      const remaining = slidesToUse.slice(1);
-      if (remaining.length) {
-        const results = await Promise.allSettled(remaining.map(generateImageForSlide));
-        results.forEach((res, idx) => {
-          if (res.status === "fulfilled" && res.value) {
-            upsertImage(res.value);
-          } else if (res.status === "rejected") {
-            pushStatus(`✗ 图片生成失败（${remaining[idx].title}）：${res.reason}`);
+      const decoder = new TextDecoder();
+      let buffer = "";
+      while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        const lines = buffer.split("\n");
+        buffer = lines.pop() || "";
+
+        for (const line of lines) {
+          if (!line.startsWith("data: ")) continue;
+          const data = JSON.parse(line.slice(6));
+          const slideTitle = slidesToUse[data.index]?.title;
+          switch (data.type) {
+            case "image":
+              if (data.image.status === "failed") {
+                pushStatus(`✗ 图片生成失败（${slideTitle}）：${data.image.error || "未知错误"}`);
+              } else {
+                upsertImage(data.image);
+                pushStatus(`✓ 图片完成：${slideTitle}`);
+              }
+              break;
+            case "done":
+              pushStatus(`✓ 已生成 ${data.images}/${data.images + data.failed} 张图片`);
+              break;
+            case "error":
+              pushStatus(`✗ 图片生成失败: ${data.error}`);
+              break;
           }
-        });
-        pushStatus(`✓ 已生成 ${results.filter((r) => r.status === "fulfilled").length}/${remaining.length} 张图片`);
+        }
       }
     } catch (error: any) {
-      pushStatus(`✗ PPT 页面生成失败: ${error.message}`);
+      pushStatus(`✗ 图片生成失败: ${error.message}`);
     } finally {
       setBusy(null);
     }
   };
 
-  const fetchImageDataUrl = async (image: SlideImage): Promise<string | null> => {
-    if (image.data_url) return image.data_url;
-    if (!image.url) return null;
-    try {
-      const res = await fetch(image.url);
-      if (!res.ok) return null;
-      const blob = await res.blob();
-      return await new Promise<string>((resolve, reject) => {
-        const reader = new FileReader();
-        reader.onloadend = () => resolve(reader.result as string);
-        reader.onerror = () => reject(reader.error);
-        reader.readAsDataURL(blob);
-      });
-    } catch (err) {
-      console.error("Failed to fetch image data URL", err);
-      return null;
-    }
-  };
-
   const downloadPdf = async () => {
     if (!slides().length) return;
-    const doc = new jsPDF({ orientation: "landscape", unit: "pt", format: "a4" });
-    for (let idx = 0; idx < slides().length; idx++) {
-      const slide = slides()[idx];
-      if (idx !== 0) doc.addPage();
-      doc.setFontSize(24);
-      doc.text(slide.title, 60, 80);
-      doc.setFontSize(14);
-      slide.bullets.forEach((b, i) => doc.text(`• ${b}`, 80, 130 + i * 24));
-      const image = slideImages().find((img) => img.title === slide.title);
-      if (image) {
-        const dataUrl = await fetchImageDataUrl(image);
-        if (dataUrl) {
-          try {
-            doc.addImage(dataUrl, "PNG", 400, 90, 320, 180);
-          } catch (e) {
-            console.error("Failed to add image to PDF", e);
-          }
-        }
-      }
+    setBusy("pdf");
+    try {
+      // Rendered server-side from the stored images and streamed back page by page.
+      const response = await fetch(`${apiBase}/api/export/deck`, {
+        method: "POST",
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify({
+          title: topic(),
+          format: "pdf",
+          slides: slides().map((slide) => {
+            const image = slideImages().find((img) => img.title === slide.title);
+            return {
+              title: slide.title,
+              bullets: slide.bullets,
+              palette: slide.palette,
+              image: image?.url || image?.data_url || null,
+            };
+          }),
+        }),
+      });
+      if (!response.ok) throw new Error(await response.text());
+      const blob = await response.blob();
+      const link = document.createElement("a");
+      link.href = URL.createObjectURL(blob);
+      link.download = `${topic()}.pdf`;
+      link.click();
+      // Revoking right after click() can cancel the download before the browser has started it.
+      setTimeout(() => URL.revokeObjectURL(link.href), 60_000);
+      pushStatus("✓ PDF 已导出");
+    } catch (error: any) {
+      pushStatus(`✗ PDF 导出失败: ${error.message}`);
+    } finally {
+      setBusy(null);
     }
-    doc.save(`${topic()}.pdf`);
-    pushStatus("✓ PDF 已导出");
   };
 
   const currentSlide = createMemo(() => slides()[currentSlideIndex()]);
@@ -440,7 +433,7 @@ export function HomePage() {
                   <div class="flex items-center justify-between">
                     <div>
                       <CardTitle class="text-lg">参考资料</CardTitle>
-                      <CardDescription>已基于主题搜索到 {references().length} 条资料</CardDescription>
+                      <CardDescription>已基于主题整理 {references().length} 个资料来源</CardDescription>
                     </div>
                     <Button variant="ghost" size="sm" class="text-xs h-7" onClick={() => setReferences([])}>
                       ✏️ 修改主题
@@ -454,7 +447,7 @@ export function HomePage() {
                         <p class="font-medium text-sm">{ref.title}</p>
                         <p class="text-xs text-slate-500 line-clamp-2">{ref.summary}</p>
                         <a class="text-xs text-blue-500 hover:underline" href={ref.url} target="_blank" rel="noreferrer">
-                          {ref.source}
+                          {ref.kind === "search" ? `前往${ref.source}检索` : ref.source}
                         </a>
                       </div>
                     )}
@@ -535,7 +528,7 @@ export function HomePage() {
                       }
                     >
                       <div class="aspect-video bg-slate-50 rounded-lg flex flex-col items-center justify-center relative overflow-hidden">
-                        <LoadingTimer operation={busy() as "reference" | "outline" | "slides" | "images"} />
+                        <LoadingTimer operation={busy() as "reference" | "outline" | "slides" | "images" | "pdf"} />
                       </div>
                     </Show>
                   }
@@ -547,7 +540,7 @@ export function HomePage() {
                       <Show when={currentImage()?.url || currentImage()?.data_url}>
                         <div class="absolute inset-0 z-0">
                           <img
-                            src={currentImage()?.url || currentImage()?.data_url}
+                            src={assetUrl(currentImage()?.url) || currentImage()?.data_url}
                             alt={currentPreviewSlide()?.title || "slide"}
                             class="w-full h-full object-cover opacity-20"
                           />